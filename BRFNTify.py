@@ -32,6 +32,7 @@
 import contextlib
 import functools
 import io
+import mmap
 import os
 import struct
 import sys
@@ -41,7 +42,14 @@ import unicodedata
 from PyQt5 import QtCore, QtGui, QtWidgets
 Qt = QtCore.Qt
 
+import archive
+import cx
+import formatadvisor
+import memory
+import timing
 import TPLLib
+import yaz0
+from TPLLib.tpl import textureSize
 
 
 
@@ -52,6 +60,14 @@ Font = None
 
 ENCODINGS = ['UCS-2', 'UTF-16', 'CP932', 'CP1252']
 
+# The largest texture width or height the console supports
+MAX_TEXTURE_SIZE = 1024
+
+# Layout of the dicts returned by BRFNT.getMetrics()
+METRICS_VERSION = 1
+FINF_METRICS = ['fontType', 'leading', 'defaultChar', 'leftMargin', 'charWidth', 'fullWidth', 'encoding', 'height', 'width', 'ascent', 'descent']
+TGLP_METRICS = ['cellWidth', 'cellHeight', 'baseLine', 'maxCharWidth', 'texFormat', 'charsPerRow', 'charsPerColumn']
+
 
 
 
@@ -168,6 +184,9 @@ class Window(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__(None)
         self.savename = ''
+        self.saveCompressed = False
+        self.saveArchive = None
+        self.saveArchiveMember = None
 
         self.view = ViewWidget()
 
@@ -207,6 +226,10 @@ class Window(QtWidgets.QMainWindow):
         self.CreateAction('saveas', self.HandleSaveAs, GetIcon('saveas'), 'Save &as...', 'Save the font file to a new filename', QtGui.QKeySequence.SaveAs)
         self.CreateAction('exportasimg', self.HandleExportAsImage, None, '&Export as Image...', 'Export all characters as an image', 'Ctrl+E')
         self.CreateAction('importfromimg', self.HandleImportFromImage, None, '&Import from Image...', 'Import all characters from an image', 'Ctrl+I')
+        self.CreateAction('autogrid', self.HandleAutoGrid, None, 'Choose Sheet &Grid When Saving', 'Pick the characters per row and column that need the least texture data when saving', None, True)
+        self.CreateAction('autoformat', self.HandleAutoFormat, None, 'Use Smallest &Lossless Format When Saving', 'Switch to the smallest texture format that keeps every glyph exactly the same when saving', None, True)
+        self.CreateAction('sortglyphs', self.HandleSortGlyphs, None, 'Sort Glyphs When &Saving', 'Store glyphs sorted by character code when saving, for a smaller and faster CMAP', None, True)
+        self.CreateAction('dedupeglyphs', self.HandleDedupeGlyphs, None, 'Share I&dentical Glyphs When Saving', 'Store glyphs that look the same and have the same widths only once when saving, with all of their character codes pointing to it', None, True)
         self.CreateAction('generate', self.HandleGenerate, None, '&Generate', 'Generate a font from one installed on your computer', 'Ctrl+G')
         self.SetOutputEnabled(False)
         # Dock show/hide actions are created later
@@ -218,6 +241,11 @@ class Window(QtWidgets.QMainWindow):
         self.actions['ascent'].setCheckable(True)
         self.actions['baseLine'].setCheckable(True)
         self.actions['widths'].setCheckable(True)
+        self.CreateAction('timing', self.HandleTiming, None, 'Record &Timings', 'Record how long loading, saving and redrawing take', None, True)
+        self.CreateAction('timingreport', self.HandleTimingReport, None, 'Timing &Report...', 'Show the recorded timings, or save them as a trace', None)
+        self.actions['timing'].setChecked(timing.enabled)
+        self.CreateAction('formatreport', self.HandleFormatReport, None, 'Texture &Format Report...', 'Show how big and how accurate the font would be in each texture format', None)
+        self.CreateAction('memoryreport', self.HandleMemoryReport, None, '&Memory Report...', 'Show how much memory the font is using', None)
         self.CreateAction('about', self.HandleAbout, GetIcon('about'), '&About', 'About BRFNTify Next', 'Ctrl+H')
 
         self.actions['fontmetrics'] = self.fontDock.toggleViewAction()
@@ -240,6 +268,10 @@ class Window(QtWidgets.QMainWindow):
         self.fileMenu.addAction(self.actions['open'])
         self.fileMenu.addAction(self.actions['save'])
         self.fileMenu.addAction(self.actions['saveas'])
+        self.fileMenu.addAction(self.actions['sortglyphs'])
+        self.fileMenu.addAction(self.actions['dedupeglyphs'])
+        self.fileMenu.addAction(self.actions['autoformat'])
+        self.fileMenu.addAction(self.actions['autogrid'])
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.actions['exportasimg'])
         self.fileMenu.addAction(self.actions['importfromimg'])
@@ -257,6 +289,11 @@ class Window(QtWidgets.QMainWindow):
         self.viewMenu.addAction(self.actions['widths'])
         m.addMenu(self.viewMenu)
         self.helpMenu = QtWidgets.QMenu('&Help', self)
+        self.helpMenu.addAction(self.actions['timing'])
+        self.helpMenu.addAction(self.actions['timingreport'])
+        self.helpMenu.addAction(self.actions['memoryreport'])
+        self.helpMenu.addAction(self.actions['formatreport'])
+        self.helpMenu.addSeparator()
         self.helpMenu.addAction(self.actions['about'])
         m.addMenu(self.helpMenu)
 
@@ -362,38 +399,53 @@ class Window(QtWidgets.QMainWindow):
         global Font
 
         # File Dialog
-        fn = QtWidgets.QFileDialog.getOpenFileName(self, 'Choose a Font', '', 'Wii font files (*.brfnt);;All Files(*)')[0]
+        fn = QtWidgets.QFileDialog.getOpenFileName(self, 'Choose a Font', '', 'Wii font files (*.brfnt *.brfna *.szs *.arc);;All Files(*)')[0]
         if not fn: return
 
         # Put the whole thing in a try-except clause
         try:
 
-            with open(fn, 'rb') as f:
-                tmpf = f.read()
+            # Mapped rather than read, so that only the font's own data
+            # is read from an uncompressed archive
+            with timing.span('read'), open(fn, 'rb') as f:
+                tmpf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            compressed = yaz0.isCompressed(tmpf)
+            with timing.span('yaz0'):
+                tmpf = yaz0.unwrap(tmpf)
+
+            arc = member = None
+            if archive.isU8(tmpf):
+                arc = archive.U8(tmpf)
+                member = self.ChooseArchiveMember(arc)
+                if member is None: return
+                tmpf = arc.getFile(member)
 
             Font = BRFNT(tmpf)
+            self.ApplySaveOptions()
 
             self.fontDock.updateFields()
-            self.brfntScene.clear()
-            self.brfntScene.setSceneRect(
-                0,
-                0,
-                Font.cellWidth * 30,
-                Font.cellHeight * (len(Font.glyphs) / 30) + 1)
+            with timing.span('populate'):
+                self.brfntScene.clear()
+                self.brfntScene.setSceneRect(
+                    0,
+                    0,
+                    Font.cellWidth * 30,
+                    Font.cellHeight * (len(Font.glyphs) / 30) + 1)
 
-            x = 0
-            y = 0
-            i = 0
-            for item in Font.glyphs:
-                if i >= 30:
-                    x = 0
-                    y = y + item.pixmap.height()
-                    i = 0
-
-                item.setPos(x, y)
-                self.brfntScene.addItem(item)
-                x = x + item.pixmap.width()
-                i += 1
+                x = 0
+                y = 0
+                i = 0
+                for item in Font.glyphs:
+                    if i >= 30:
+                        x = 0
+                        y = y + item.pixmap.height()
+                        i = 0
+
+                    item.setPos(x, y)
+                    self.brfntScene.addItem(item)
+                    x = x + item.pixmap.width()
+                    i += 1
 
             self.view.updateDisplay()
             self.view.setScene(self.brfntScene)
@@ -402,7 +454,13 @@ class Window(QtWidgets.QMainWindow):
             self.view.updateLayout()
 
             self.savename = fn
-            self.setWindowTitle('BRFNTify Next - %s' % fn.replace('\\', '/').split('/')[-1])
+            self.saveCompressed = compressed
+            self.saveArchive = arc
+            self.saveArchiveMember = member
+            title = fn.replace('\\', '/').split('/')[-1]
+            if member is not None:
+                title += ' - ' + member
+            self.setWindowTitle('BRFNTify Next - %s' % title)
             self.SetOutputEnabled(True)
 
         except Exception as e:
@@ -416,25 +474,83 @@ class Window(QtWidgets.QMainWindow):
         if not self.savename:
             self.HandleSaveAs()
             return
+        if Font.compressedSheets:
+            QtWidgets.QMessageBox.information(self, 'Save as BRFNT',
+                "BRFNTify can't write BRFNA files (fonts with compressed texture sheets), so this font will be saved as a .brfnt file instead.")
+            self.HandleSaveAs()
+            return
 
         data = self.Save()
         if data:
-            with open(self.savename, 'wb') as f:
+            if self.saveArchive is not None:
+                self.saveArchive.replaceFile(self.saveArchiveMember, data)
+                if not self.saveCompressed:
+                    with timing.span('write'):
+                        self.saveArchive.writeFile(self.savename)
+                    return
+                data = self.saveArchive.save()
+
+            if self.saveCompressed:
+                with timing.span('yaz0'):
+                    data = self.Compress(data)
+            with timing.span('write'), open(self.savename, 'wb') as f:
                 f.write(data)
 
 
+    def Compress(self, data):
+        """
+        Yaz0-compress data on a worker thread, showing a progress dialog
+        until it's done, so the window keeps responding
+        """
+        dlg = QtWidgets.QProgressDialog('Compressing...', None, 0, len(data), self)
+        dlg.setWindowTitle('Saving')
+        dlg.setWindowModality(Qt.WindowModal)
+        dlg.setMinimumDuration(500)
+
+        thread = CompressThread(data)
+        thread.progress.connect(dlg.setValue)
+        loop = QtCore.QEventLoop()
+        thread.finished.connect(loop.quit)
+        thread.start()
+        loop.exec_()
+        dlg.close()
+
+        if thread.error is not None:
+            raise thread.error
+        return thread.result
+
+
     def HandleSaveAs(self):
         """
         Save the font file to a new file
         """
-        fn = QtWidgets.QFileDialog.getSaveFileName(self, 'Choose a new filename', '', 'Wii font files (*.brfnt);;All Files(*)')[0]
+        fn = QtWidgets.QFileDialog.getSaveFileName(self, 'Choose a new filename', '', 'Wii font files (*.brfnt);;Yaz0-compressed Wii font files (*.szs);;All Files(*)')[0]
         if not fn: return
         self.savename = fn
+        self.saveCompressed = fn.lower().endswith('.szs')
+        Font.compressedSheets = False # BRFNA fonts are saved as BRFNT
+        self.saveArchive = None
+        self.saveArchiveMember = None
         self.setWindowTitle('BRFNTify Next - %s' % fn.replace('\\', '/').split('/')[-1])
 
         self.HandleSave()
 
 
+    def ChooseArchiveMember(self, arc):
+        """
+        Ask the user which font in a U8 archive to open, and return its
+        path (or None if they cancel)
+        """
+        names = [n for n in arc.names() if n.lower().endswith(('.brfnt', '.brfna'))]
+        if not names:
+            raise ValueError("This archive doesn't contain any .brfnt or .brfna files")
+        elif len(names) == 1:
+            return names[0]
+
+        name, ok = QtWidgets.QInputDialog.getItem(self, 'Choose a Font', 'This archive contains more than one font. Which one would you like to open?', names, 0, False)
+        return name if ok else None
+
+
     def HandleExportAsImage(self):
         """
         Export all character graphics as an image
@@ -484,6 +600,7 @@ class Window(QtWidgets.QMainWindow):
 
             global Font
             Font = BRFNT.generate(dlg.selectedFont(), chars, dlg.fg, dlg.bg)
+            self.ApplySaveOptions()
 
             x = 0
             y = 0
@@ -538,6 +655,165 @@ class Window(QtWidgets.QMainWindow):
         self.view.updateWidths(toggled)
 
 
+    def HandleSortGlyphs(self, toggled):
+        """
+        Handle the user toggling Sort Glyphs When Saving
+        """
+        self.ApplySaveOptions()
+
+
+    def HandleDedupeGlyphs(self, toggled):
+        """
+        Handle the user toggling Share Identical Glyphs When Saving
+        """
+        self.ApplySaveOptions()
+
+
+    def HandleAutoGrid(self, toggled):
+        """
+        Handle the user toggling Choose Sheet Grid When Saving
+        """
+        self.ApplySaveOptions()
+
+
+    def HandleAutoFormat(self, toggled):
+        """
+        Handle the user toggling Use Smallest Lossless Format When
+        Saving
+        """
+        self.ApplySaveOptions()
+
+
+    def ApplySaveOptions(self):
+        """
+        Set the open font's saving options to match the File menu
+        """
+        if Font is None: return
+        Font.reorderGlyphs = self.actions['sortglyphs'].isChecked()
+        Font.dedupeGlyphs = self.actions['dedupeglyphs'].isChecked()
+        Font.autoSheetGrid = self.actions['autogrid'].isChecked()
+        Font.autoFormatMaxError = 0 if self.actions['autoformat'].isChecked() else None
+
+
+    def HandleTiming(self, toggled):
+        """
+        Handle the user toggling Record Timings
+        """
+        timing.setEnabled(toggled)
+
+
+    def HandleTimingReport(self):
+        """
+        Show a summary of the recorded timings
+        """
+        txtedit = QtWidgets.QPlainTextEdit(timing.summaryTable())
+        txtedit.setReadOnly(True)
+        txtedit.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        txtedit.setWordWrapMode(QtGui.QTextOption.NoWrap)
+
+        buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Close)
+        saveBtn = buttonBox.addButton('Save Trace...', QtWidgets.QDialogButtonBox.ActionRole)
+        clearBtn = buttonBox.addButton('Clear', QtWidgets.QDialogButtonBox.ResetRole)
+
+        def handleSave():
+            fn = QtWidgets.QFileDialog.getSaveFileName(dlg, 'Choose a trace file', '', 'Chrome trace (*.json);;All Files(*)')[0]
+            if fn: timing.saveChromeTrace(fn)
+
+        def handleClear():
+            timing.clear()
+            txtedit.setPlainText(timing.summaryTable())
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(txtedit)
+        layout.addWidget(buttonBox)
+
+        dlg = QtWidgets.QDialog()
+        dlg.setLayout(layout)
+        dlg.setModal(True)
+        dlg.setMinimumWidth(512)
+        dlg.setWindowTitle('Timing Report')
+        buttonBox.rejected.connect(dlg.reject)
+        saveBtn.clicked.connect(handleSave)
+        clearBtn.clicked.connect(handleClear)
+        dlg.exec_()
+
+
+    def HandleMemoryReport(self):
+        """
+        Show how much memory the font is using, by subsystem
+        """
+        if Font is None:
+            report = 'No font is open.\n\n' + memory.formatReport({key: 0 for key, description in memory.SUBSYSTEMS})
+        else:
+            report = memory.formatReport(memory.fontUsage(Font))
+
+        txtedit = QtWidgets.QPlainTextEdit(report)
+        txtedit.setReadOnly(True)
+        txtedit.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        txtedit.setWordWrapMode(QtGui.QTextOption.NoWrap)
+
+        buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(txtedit)
+        layout.addWidget(buttonBox)
+
+        dlg = QtWidgets.QDialog()
+        dlg.setLayout(layout)
+        dlg.setModal(True)
+        dlg.setMinimumWidth(512)
+        dlg.setWindowTitle('Memory Report')
+        buttonBox.accepted.connect(dlg.accept)
+        dlg.exec_()
+
+
+    def HandleFormatReport(self):
+        """
+        Show how big the font's texture data would be in each texture
+        format, and how much each would change the glyphs
+        """
+        if Font is None or not Font.glyphs:
+            QtWidgets.QMessageBox.information(self, 'Texture Format Report', 'No font with any glyphs is open.')
+            return
+
+        results = formatadvisor.analyzeFormats(Font)
+        smallest = formatadvisor.smallestFormat(Font, 0, results)
+        report = formatadvisor.formatReport(results, Font.texFormat)
+
+        txtedit = QtWidgets.QPlainTextEdit(report)
+        txtedit.setReadOnly(True)
+        txtedit.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        txtedit.setWordWrapMode(QtGui.QTextOption.NoWrap)
+
+        buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Close)
+        useBtn = buttonBox.addButton('Use %s' % TPLLib.FORMAT_NAMES[smallest], QtWidgets.QDialogButtonBox.ActionRole)
+        useBtn.setEnabled(smallest != Font.texFormat)
+
+        layout = QtWidgets.QVBoxLayout()
+        if smallest == Font.texFormat:
+            message = 'No format is smaller than the current one (%s) without changing any pixels.'
+        else:
+            message = 'The smallest lossless format is %s.'
+        layout.addWidget(QtWidgets.QLabel(message % TPLLib.FORMAT_NAMES[smallest]))
+        layout.addWidget(txtedit)
+        layout.addWidget(buttonBox)
+
+        dlg = QtWidgets.QDialog()
+        dlg.setLayout(layout)
+        dlg.setModal(True)
+        dlg.setMinimumWidth(512)
+        dlg.setWindowTitle('Texture Format Report')
+
+        def handleUse():
+            Font.texFormat = smallest
+            self.fontDock.updateFields()
+            dlg.accept()
+
+        buttonBox.rejected.connect(dlg.reject)
+        useBtn.clicked.connect(handleUse)
+        dlg.exec_()
+
+
     def HandleAbout(self):
         """
         Handle the user clicking About
@@ -591,6 +867,27 @@ class Window(QtWidgets.QMainWindow):
 
 
 
+class CompressThread(QtCore.QThread):
+    """
+    Thread that Yaz0-compresses some data, reporting its progress
+    """
+    progress = QtCore.pyqtSignal(int)
+
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+        self.result = self.error = None
+
+    def run(self):
+        """
+        Compress the data
+        """
+        try:
+            self.result = yaz0.compress(self.data, progress=self.progress.emit)
+        except Exception as e:
+            self.error = e
+
+
 class GenerateDialog(QtWidgets.QDialog):
     """
     Allows the user to generate a glyph table from an installed font
@@ -910,7 +1207,7 @@ class FontMetricsDock(QtWidgets.QDockWidget):
     """
     typeList = ['0', '1', '2'] # TODO: check exactly what the valid values are
     endiannessList = ['Big', 'Little']
-    formatList = ['I4', 'I8', 'IA4', 'IA8', 'RGB565', 'RGB4A3', 'RGBA8', 'Unknown', 'CI4', 'CI8', 'CI14x2', 'Unknown', 'Unknown', 'Unknown', 'CMPR/S3TC']
+    formatList = ['I4', 'I8', 'IA4', 'IA8', 'RGB565', 'RGB4A3', 'RGBA8', 'Unknown', 'CI4 (read only)', 'CI8 (read only)', 'CI14x2 (read only)', 'Unknown', 'Unknown', 'Unknown', 'CMPR/S3TC']
     updating = False
 
     def __init__(self, parent):
@@ -945,6 +1242,8 @@ class FontMetricsDock(QtWidgets.QDockWidget):
         self.edits['endianness'].addItems(self.endiannessList)
         self.edits['encoding'].addItems(ENCODINGS)
         self.edits['texFormat'].addItems(self.formatList)
+        for format in TPLLib.PALETTE_FORMATS:
+            self.edits['texFormat'].model().item(format).setEnabled(False)
         self.edits['charsPerRow'].setMaximum(0xFFFF)
         self.edits['charsPerColumn'].setMaximum(0xFFFF)
         self.edits['defaultChar'].setMaxLength(1)
@@ -1254,7 +1553,10 @@ class CharMetricsDock(QtWidgets.QDockWidget):
 
     def handleCopy(self):
         """
-        Handle the Copy button being clicked
+        Handle the Copy button being clicked. The copy shares the
+        glyph's image, so until either one is changed, the image is only
+        stored once when saving with File > Share Identical Glyphs When
+        Saving (see BRFNT.getSaveLayout()).
         """
         c = self.value # c: "current"
         new = Glyph(c.pixmap, c.char, c.leftMargin, c.charWidth, c.fullWidth)
@@ -1319,6 +1621,7 @@ class TextPreviewDock(QtWidgets.QDockWidget):
         self.setWindowTitle('T. Preview')
 
 
+    @timing.timed('preview')
     def updatePreview(self):
         """
         Redraw the preview image
@@ -1462,6 +1765,7 @@ class ViewWidget(QtWidgets.QGraphicsView):
         self.updateLayout()
 
 
+    @timing.timed('layout')
     def updateLayout(self, force=False):
         if Font is None: return
 
@@ -1536,73 +1840,110 @@ class ViewWidget(QtWidgets.QGraphicsView):
 
 class BRFNT:
     """
-    Class that represents a BRFNT file.
+    Class that represents a BRFNT file (or a BRFNA file, which is the
+    same except that each texture sheet is compressed separately, and
+    there's an extra GLGR block; BRFNA files can be loaded, but are
+    always saved as BRFNT).
     """
     encoding = None
     endianness = None
+    compressedSheets = False # loaded from a BRFNA file
+    highQualityEncoding = False # slower texture encoding, for release builds
+    reorderGlyphs = False # store glyphs sorted by character code when saving, for a smaller CMAP
+    dedupeGlyphs = False # store identical glyphs once when saving, with all of their codes pointing to it
+    autoFormatMaxError = None # if set, save in the smallest texture format within this error
+    autoSheetGrid = False # save with the charsPerRow and charsPerColumn that need the least texture data
+
+    # How many bytes one more CMAP block has to save to be worth it.
+    # The console finds a character's glyph by checking each CMAP block
+    # in turn, so more blocks make lookups slower; 0 plans for the
+    # smallest file.
+    cmapLookupWeight = 16
+
+    # How many bytes of texture data one more sheet has to save to be
+    # worth it, for getBestSheetGrid(). Each sheet is a separate texture
+    # for the console to load, and text that uses glyphs from several
+    # sheets makes it switch between them; 0 picks the least data.
+    sheetWeight = 0x4000
 
     def __init__(self, data=None):
         if data is not None:
             self._initFromData(data)
 
 
+    @timing.timed('load')
     def _initFromData(self, tmpf):
         """
         Load BRFNT data
         """
+        tglpOffset, tglpSize, textureSize, numTexs, texWidth, texHeight, CWDH2, CMAP = self._parseHeaders(tmpf)
 
-        magic = tmpf[:4]
-        if magic == b'RFNT':
-            endian = '>'
-        elif magic == b'TNFR':
-            endian = '<'
-        else:
-            raise ValueError('Not a BRFNT (magic: %s)' % repr(magic))
-        self.endianness = endian
 
-        RFNT = struct.unpack_from(endian + '4sHHIHH', tmpf[0:16])
-        FINF = struct.unpack_from(endian + '4sIBbHbBbB3I4B', tmpf[16:48])
-        TGLP = struct.unpack_from(endian + '4sIBBbBI6HI', tmpf[48:96])
-        CWDH = struct.unpack_from(endian + '4sIxxH4x', tmpf, FINF[10] - 8)
-        CWDH2 = []
-        CMAP = {}
+        TPLDat = memoryview(tmpf)[(tglpOffset + 48):(tglpOffset + tglpSize)]
 
 
-        position = FINF[10] + 8
-        for i in range(CWDH[2]+1):
-            Entry = struct.unpack_from(endian + 'bBb', tmpf, position)
-            position += 3
-            CWDH2.append((Entry[0], Entry[1], Entry[2]))
+        Images = []
 
-        position = FINF[11]
-        while position != 0:
-            Entry = struct.unpack_from(endian + 'HHHxxIH', tmpf, position) # 0: start range -- 1: end range -- 2: type -- 3: position -- 4: CharCode List
-            if Entry[2] == 0:
-                index = Entry[4]
-                for glyph in range(Entry[0], Entry[1] + 1):
-                    CMAP[index] = glyph
-                    index += 1
+        # Sheets are extracted (and decompressed, for BRFNA) one at a
+        # time, just before they're decoded
+        for tex in self._iterSheetData(TPLDat, numTexs, textureSize):
 
-            elif Entry[2] == 1:
-                indexdat = tmpf[(position+12) : (position+12+((Entry[1]-Entry[0]+1)*2))]
-                entries = struct.unpack(endian + str(int(len(indexdat)/2)) + 'H', indexdat)
-                for i, glyph in enumerate(range(Entry[0], Entry[1]+1)):
-                    index = entries[i]
-                    if index == 0xFFFF:
-                        pass
-                    else:
-                        CMAP[index] = glyph
+            Images.extend(self._sliceSheet(self._decodeSheet(tex, texWidth, texHeight)))
 
-            elif Entry[2] == 2:
-                entries = struct.unpack_from(endian + str(Entry[4]*2) + 'H', tmpf, position+0xE)
-                for i in range(Entry[4]):
-                    CMAP[entries[i * 2 + 1]] = entries[i * 2]
 
-            else:
-                raise ValueError('Unknown CMAP type!')
-                break
+        for i in range(len(CWDH2), len(Images)):
+            CWDH2.append((0xFF, 0xFF, 0xFF))
 
-            position = Entry[3]
+
+        self.glyphs = []
+        for i, tex in enumerate(Images):
+            codes = CMAP.get(i)
+            if codes is None:
+                print('WARNING: No character code is assigned to glyph %d' % i)
+                continue
+
+            # Several codes can share one glyph; each gets its own Glyph,
+            # sharing the same pixmap
+            for val in codes:
+                char = valueToChar(val, self.encoding)
+                g = Glyph(tex, char, CWDH2[i][0], CWDH2[i][1], CWDH2[i][2])
+                g.updateToolTip(self.encoding)
+                self.glyphs.append(g)
+
+
+    def _parseHeaders(self, tmpf):
+        """
+        Read everything in BRFNT data except for the texture sheets.
+        Font-wide values are stored in self; returns (TGLP offset, TGLP
+        size, sheet size, number of sheets, sheet width, sheet height,
+        CWDH entries, CMAP dict (see _parseCMAP())).
+        """
+        magic = bytes(tmpf[:4])
+        if magic in (b'RFNT', b'RFNA'):
+            endian = '>'
+        elif magic in (b'TNFR', b'ANFR'):
+            endian = '<'
+        else:
+            raise ValueError('Not a BRFNT or BRFNA (magic: %s)' % repr(magic))
+        self.endianness = endian
+        self.compressedSheets = magic in (b'RFNA', b'ANFR')
+
+        RFNT = struct.unpack_from(endian + '4sHHIHH', tmpf, 0)
+
+        # BRFNA files have a GLGR block before the FINF (and can have
+        # other blocks before the TGLP), so find the FINF by walking the
+        # blocks from the end of the header, and the rest from the
+        # offsets in the FINF
+        finfOffset = self._findBlock(tmpf, b'FINF', RFNT[4], RFNT[5])
+        FINF = struct.unpack_from(endian + '4sIBbHbBbB3I4B', tmpf, finfOffset)
+        tglpOffset = FINF[9] - 8
+        TGLP = struct.unpack_from(endian + '4sIBBbBI6HI', tmpf, tglpOffset)
+        CWDH = struct.unpack_from(endian + '4sIxxH4x', tmpf, FINF[10] - 8)
+
+        position = FINF[10] + 8
+        CWDH2 = list(struct.iter_unpack(endian + 'bBb', tmpf[position : position + 3 * (CWDH[2]+1)]))
+
+        CMAP = self._parseCMAP(tmpf, FINF[11])
 
 
         self.rfntVersionMajor = RFNT[1]      # Major Font Version (0xFFFE)
@@ -1635,50 +1976,173 @@ class BRFNT:
         texWidth = TGLP[11]                     # Width of a texture
         texHeight = TGLP[12]                    # Height of a texture
 
+        return tglpOffset, TGLP[1], textureSize, numTexs, texWidth, texHeight, CWDH2, CMAP
 
-        TPLDat = tmpf[96:(TGLP[1] + 48)]
 
+    def _findBlock(self, tmpf, magic, headerSize, numBlocks):
+        """
+        Return the offset of the first block with the given magic (as
+        it's written in big-endian files), walking the numBlocks blocks
+        that follow the headerSize-byte file header
+        """
+        if self.endianness == '<':
+            magic = magic[::-1]
 
-        SingleTex = []
-        Images = []
-        offset = 0
-        charsPerTex = self.charsPerRow * self.charsPerColumn
+        offset = headerSize
+        for i in range(numBlocks):
+            blockMagic, blockSize = struct.unpack_from(self.endianness + '4sI', tmpf, offset)
+            if blockMagic == magic:
+                return offset
+            if blockSize < 8:
+                break
+            offset += blockSize
 
-        for tex in range(numTexs):
-            SingleTex.append(struct.unpack(endian + str(textureSize) + 'B', TPLDat[offset:textureSize+offset]))
-            offset += textureSize
+        raise ValueError('No %s block found' % magic.decode('latin-1'))
 
-        for tex in SingleTex:
 
-            decoder = TPLLib.decoder(self.texFormat)
-            decoder = decoder(tex, texWidth, texHeight)
-            newdata = decoder.run()
-            dest = QtGui.QImage(newdata, texWidth, texHeight, 4 * texWidth, QtGui.QImage.Format_ARGB32)
+    @classmethod
+    def peek(cls, path):
+        """
+        Read everything but the texture sheets from a .brfnt or .brfna
+        file (see peekData()). The file is mapped into memory, so the
+        texture data is never read from disk.
+        """
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if yaz0.isCompressed(data):
+                    return cls.peekData(yaz0.decompress(data))
+                return cls.peekData(data)
 
-            y = 0
-            for a in range(self.charsPerColumn):
-                x = 0
-                for b in range(self.charsPerRow):
-                    Images.append(QtGui.QPixmap.fromImage(dest.copy(x, y, self.cellWidth, self.cellHeight)))
-                    x += self.cellWidth
-                y += self.cellHeight
 
+    @classmethod
+    def peekData(cls, data):
+        """
+        Read everything but the texture sheets from BRFNT data, without
+        decoding anything. Returns a dict in the format returned by
+        getMetrics(), plus 'sheets' (the number, size in bytes, width
+        and height of the texture sheets) and 'codeRanges' (see
+        codeRanges()).
+        """
+        self = cls()
+        self.glyphs = []
+        tglpOffset, tglpSize, textureSize, numTexs, texWidth, texHeight, CWDH2, CMAP = self._parseHeaders(data)
 
-        for i in range(len(CWDH2), len(Images)):
-            CWDH2.append((0xFF, 0xFF, 0xFF))
+        # The same glyphs that loading the font would create
+        glyphs = []
+        for i in range(numTexs * self.charsPerRow * self.charsPerColumn):
+            leftMargin, charWidth, fullWidth = CWDH2[i] if i < len(CWDH2) else (0xFF, 0xFF, 0xFF)
+            for code in CMAP.get(i, ()):
+                glyphs.append({'code': code, 'leftMargin': leftMargin, 'charWidth': charWidth, 'fullWidth': fullWidth})
 
+        metrics = self.getMetrics()
+        metrics['glyphs'] = glyphs
+        metrics['sheets'] = {'count': numTexs, 'size': textureSize, 'width': texWidth, 'height': texHeight}
+        metrics['codeRanges'] = codeRanges(code for codes in CMAP.values() for code in codes)
+        return metrics
 
-        self.glyphs = []
-        for i, tex in enumerate(Images):
-            val = CMAP.get(i)
-            if val is None:
-                print('WARNING: No character code is assigned to glyph %d' % i)
+
+    def _iterSheetData(self, TPLDat, numTexs, textureSize):
+        """
+        Yield the encoded data for each texture sheet in the TGLP data.
+        In BRFNA files, each sheet is a u32 length followed by that many
+        bytes of CX-compressed data (padded to a multiple of 4 bytes).
+        """
+        offset = 0
+        for tex in range(numTexs):
+            if not self.compressedSheets:
+                yield TPLDat[offset:textureSize+offset]
+                offset += textureSize
                 continue
 
-            char = valueToChar(val, self.encoding)
-            g = Glyph(tex, char, CWDH2[i][0], CWDH2[i][1], CWDH2[i][2])
-            g.updateToolTip(self.encoding)
-            self.glyphs.append(g)
+            compressedSize = struct.unpack_from(self.endianness + 'I', TPLDat, offset)[0]
+            offset += 4
+            with timing.span('decompress'):
+                sheet = cx.decompress(TPLDat[offset:compressedSize+offset])
+            if len(sheet) != textureSize:
+                raise ValueError('Compressed texture sheet %d has the wrong size (0x%X instead of 0x%X)' % (tex, len(sheet), textureSize))
+            yield sheet
+            offset += (compressedSize + 3) & ~3
+
+
+    @timing.timed('parseCMAP')
+    def _parseCMAP(self, tmpf, position):
+        """
+        Read the chain of CMAP blocks starting at position, and return a
+        dict of glyph indices to sorted lists of the character codes
+        that use them (usually just one, but glyphs can be shared)
+        """
+        endian = self.endianness
+        CMAP = {}
+
+        def add(index, code):
+            codes = CMAP.setdefault(index, [])
+            if code not in codes:
+                codes.append(code)
+
+        while position != 0:
+            Entry = struct.unpack_from(endian + 'HHHxxIH', tmpf, position) # 0: start range -- 1: end range -- 2: type -- 3: position -- 4: CharCode List
+            if Entry[2] == 0:
+                index = Entry[4]
+                for glyph in range(Entry[0], Entry[1] + 1):
+                    add(index, glyph)
+                    index += 1
+
+            elif Entry[2] == 1:
+                indexdat = tmpf[(position+12) : (position+12+((Entry[1]-Entry[0]+1)*2))]
+                entries = struct.unpack(endian + str(int(len(indexdat)/2)) + 'H', indexdat)
+                for i, glyph in enumerate(range(Entry[0], Entry[1]+1)):
+                    index = entries[i]
+                    if index == 0xFFFF:
+                        pass
+                    else:
+                        add(index, glyph)
+
+            elif Entry[2] == 2:
+                entries = struct.unpack_from(endian + str(Entry[4]*2) + 'H', tmpf, position+0xE)
+                for i in range(Entry[4]):
+                    add(entries[i * 2 + 1], entries[i * 2])
+
+            else:
+                raise ValueError('Unknown CMAP type!')
+                break
+
+            position = Entry[3]
+
+        for codes in CMAP.values():
+            codes.sort()
+        return CMAP
+
+
+    @timing.timed('decode')
+    def _decodeSheet(self, tex, texWidth, texHeight):
+        """
+        Decode one texture sheet and return it as a QImage
+        """
+        decoder = TPLLib.decoder(self.texFormat)
+        if self.texFormat in TPLLib.PALETTE_FORMATS:
+            tlutStart = len(tex) - self.getPaletteSize()
+            decoder = decoder(tex[:tlutStart], texWidth, texHeight, tlut=tex[tlutStart:], tlutFormat=TPLLib.TLUT_RGB5A3)
+        else:
+            decoder = decoder(tex, texWidth, texHeight)
+        newdata = decoder.run()
+        return QtGui.QImage(newdata, texWidth, texHeight, 4 * texWidth, QtGui.QImage.Format_ARGB32)
+
+
+    @timing.timed('slice')
+    def _sliceSheet(self, dest):
+        """
+        Cut a decoded texture sheet into glyph pixmaps, and return them
+        in order
+        """
+        Images = []
+        y = 0
+        for a in range(self.charsPerColumn):
+            x = 0
+            for b in range(self.charsPerRow):
+                Images.append(QtGui.QPixmap.fromImage(dest.copy(x, y, self.cellWidth, self.cellHeight)))
+                x += self.cellWidth
+            y += self.cellHeight
+        return Images
 
 
     @classmethod
@@ -1726,19 +2190,56 @@ class BRFNT:
         self.baseLine = fontMetrics.ascent() + 1
         self.maxCharWidth = fontMetrics.maxWidth() + 1
         self.texFormat = 3
-        self.charsPerRow = 5
-        self.charsPerColumn = 5
+        self.charsPerRow = self.charsPerColumn = 5
+        self.charsPerRow, self.charsPerColumn = self.getBestSheetGrid()
 
         return self
 
 
-    def save(self):
+    @timing.timed('save')
+    def save(self, texDatas=None, layout=None):
         """
-        Save the font and return its data
+        Save the font and return its data. If texDatas (a list of
+        already-encoded texture sheets, with glyphs stored as described
+        by layout) is provided, it's used instead of painting and
+        encoding the glyph images. layout is calculated with
+        getSaveLayout() if not provided.
+
+        If autoFormatMaxError is set (and texDatas isn't provided), the
+        data is saved in the smallest texture format that keeps every
+        pixel within that error (see formatadvisor.py). Likewise, if
+        autoSheetGrid is set, the charsPerRow and charsPerColumn
+        returned by getBestSheetGrid() are used. The font itself keeps
+        its own texFormat and grid either way.
         """
+        if layout is None:
+            layout = self.getSaveLayout()
+
+        original = self.texFormat, self.charsPerRow, self.charsPerColumn
+        try:
+            if self.autoFormatMaxError is not None and texDatas is None:
+                with timing.span('chooseFormat'):
+                    results = formatadvisor.analyzeFormats(self, layout=layout)
+                    self.texFormat = formatadvisor.smallestFormat(self, self.autoFormatMaxError, results)
+
+            if self.autoSheetGrid and texDatas is None:
+                self.charsPerRow, self.charsPerColumn = self.getBestSheetGrid(len(layout[0]))
+
+            return self._saveData(texDatas, layout)
+        finally:
+            self.texFormat, self.charsPerRow, self.charsPerColumn = original
+
 
+    def _saveData(self, texDatas, layout):
+        """
+        Build the font data for save(), using the font's current texture
+        format and sheet grid
+        """
         data = bytearray()
         endian = self.endianness
+        glyphs = [self.glyphs[i] for i in layout[0]]
+
+        self._checkSaveFormat()
 
         # Leave space for the RFNT header
         data.extend(b'\0' * 16)
@@ -1749,42 +2250,11 @@ class BRFNT:
         numChunks += 1
 
         # TGLP
+        texWidth, texHeight = self.getTextureSize()
+        if texDatas is None:
+            texDatas = [self.encodeSheet(ti) for ti in self._paintSheets(glyphs)]
 
-        # Get the smallest power-of-two texture size that will fit
-        texWidth = texHeight = 1
-        while texWidth < self.cellWidth * self.charsPerRow:
-            texWidth <<= 1
-        while texHeight < self.cellHeight * self.charsPerColumn:
-            texHeight <<= 1
-
-        texImages = []
-        currentTexP = None
-        x = y = 0
-        for g in self.glyphs:
-            if currentTexP is None:
-                # make new tex
-                tex = QtGui.QImage(texWidth, texHeight, QtGui.QImage.Format_ARGB32_Premultiplied)
-                tex.fill(QtCore.Qt.transparent)
-                currentTexP = QtGui.QPainter(tex)
-                texImages.append(tex)
-
-            currentTexP.drawPixmap(x * self.cellWidth, y * self.cellHeight, g.pixmap)
-
-            x += 1
-            if x >= self.charsPerRow:
-                x = 0
-                y += 1
-
-                if y >= self.charsPerColumn:
-                    y = 0
-                    currentTexP = None
-
-        texDatas = []
-        for ti in texImages:
-            encoder = TPLLib.encoder(self.texFormat)
-            encoder = encoder(ti.bits().asstring(texWidth * texHeight * 4), texWidth, texHeight)
-            texDatas.append(encoder.run())
-
+        sheetSize = len(texDatas[0]) if texDatas else 0
 
         data.extend(struct.pack(endian + '4sIBBbBI6HI16x',
             b'TGLP' if endian == '>' else b'PLGT',
@@ -1793,7 +2263,7 @@ class BRFNT:
             self.cellHeight - 1,
             self.baseLine - 1,
             self.maxCharWidth - 1,
-            len(texDatas[0]) if texDatas else 0,
+            sheetSize,
             len(texDatas),
             self.texFormat,
             self.charsPerRow,
@@ -1811,21 +2281,25 @@ class BRFNT:
         data.extend(b'\0' * 16)
         numChunks += 1
 
-        for g in self.glyphs:
-            data.extend(struct.pack(endian + 'bBb', g.leftMargin, g.charWidth, g.fullWidth))
+        with timing.span('packCWDH'):
+            for g in glyphs:
+                data.extend(struct.pack(endian + 'bBb', g.leftMargin, g.charWidth, g.fullWidth))
         while len(data) % 4: data.append(0)
 
         # Fill in the CWDH header
         struct.pack_into(endian + '4sIxxH', data, cwdhOffset,
             b'CWDH' if endian == '>' else b'HDWC',
             len(data) - cwdhOffset,
-            len(self.glyphs) - 1)
+            len(glyphs) - 1)
 
         # CMAP
         firstCMAPOffset = len(data)
         prevCMAPOffset = None
 
-        for type, firstChar, lastChar, extra in self._createCmapBlocks():
+        with timing.span('planCMAP'):
+            cmapBlocks = list(self._createCmapBlocks(layout))
+
+        for type, firstChar, lastChar, extra in cmapBlocks:
 
             if prevCMAPOffset is not None:
                 struct.pack_into(endian + 'I', data, prevCMAPOffset + 16, len(data) + 8)
@@ -1891,7 +2365,189 @@ class BRFNT:
         return data
 
 
-    def _createCmapBlocks(self):
+    def getSaveLayout(self, imageKeys=None):
+        """
+        Decide how the glyphs will be stored when saving. Returns
+        (stored, storedIndices): the indices of the glyphs whose images
+        and CWDH entries are stored, in the order they're stored in, and
+        for each glyph, the index of the stored glyph its character code
+        will point to.
+
+        If reorderGlyphs is set, glyphs are sorted by character code,
+        which lets the CMAP describe each run of consecutive codes with a
+        single type-0 block. If dedupeGlyphs is set, glyphs with the same
+        image and CWDH entry are only stored once. imageKeys can be a
+        list of hashable values that identify each glyph's image;
+        otherwise, the pixels are compared. Glyph images and metrics
+        aren't changed either way.
+        """
+        order = range(len(self.glyphs))
+        if self.reorderGlyphs:
+            codes = [g.value(self.encoding) for g in self.glyphs]
+            order = sorted(order, key=codes.__getitem__)
+
+        if self.dedupeGlyphs and imageKeys is None:
+            imageKeys = self._imageKeys()
+
+        stored = []
+        storedIndices = [None] * len(self.glyphs)
+        seen = {}
+        for i in order:
+            if self.dedupeGlyphs:
+                g = self.glyphs[i]
+                key = (imageKeys[i], g.leftMargin, g.charWidth, g.fullWidth)
+                if key in seen:
+                    storedIndices[i] = seen[key]
+                    continue
+                seen[key] = len(stored)
+            storedIndices[i] = len(stored)
+            stored.append(i)
+
+        return stored, storedIndices
+
+
+    def _imageKeys(self):
+        """
+        Return (width, height, pixels) for each glyph's image, so that
+        identical images compare equal. Glyphs that share a pixmap (such
+        as those loaded from one shared glyph) share one key, and are
+        only read once.
+        """
+        keys = []
+        byPixmap = {}
+        for g in self.glyphs:
+            key = byPixmap.get(g.pixmap.cacheKey())
+            if key is None:
+                image = g.pixmap.toImage().convertToFormat(QtGui.QImage.Format_ARGB32)
+                pixels = b'' if image.isNull() else image.constBits().asstring(image.byteCount())
+                key = byPixmap[g.pixmap.cacheKey()] = (image.width(), image.height(), pixels)
+            keys.append(key)
+        return keys
+
+
+    def getTextureSize(self, charsPerRow=None, charsPerColumn=None):
+        """
+        Return the smallest power-of-two texture size (width, height)
+        that will fit a full sheet of glyphs (with the font's own grid,
+        unless charsPerRow and charsPerColumn are given)
+        """
+        if charsPerRow is None:
+            charsPerRow, charsPerColumn = self.charsPerRow, self.charsPerColumn
+
+        texWidth = texHeight = 1
+        while texWidth < self.cellWidth * charsPerRow:
+            texWidth <<= 1
+        while texHeight < self.cellHeight * charsPerColumn:
+            texHeight <<= 1
+
+        return texWidth, texHeight
+
+
+    def getBestSheetGrid(self, numGlyphs=None):
+        """
+        Return the (charsPerRow, charsPerColumn) that stores numGlyphs
+        glyphs (by default, as many as saving would store) in the
+        fewest bytes of texture data in the font's texture format, plus
+        sheetWeight for each sheet. Every power-of-two sheet size up to
+        MAX_TEXTURE_SIZE in each direction is tried. Among equally good
+        choices, fewer sheets are preferred, then the current grid,
+        then squarer sheets. If a cell is too big for any sheet, the
+        current grid is returned.
+        """
+        if numGlyphs is None:
+            numGlyphs = len(self.getSaveLayout()[0])
+        numGlyphs = max(numGlyphs, 1)
+        current = (self.charsPerRow, self.charsPerColumn)
+
+        best = None
+        bestKey = None
+        sizes = [1 << i for i in range(MAX_TEXTURE_SIZE.bit_length())]
+        for maxWidth in sizes:
+            charsPerRow = min(maxWidth // self.cellWidth, numGlyphs)
+            if not charsPerRow: continue
+
+            for maxHeight in sizes:
+                charsPerColumn = min(maxHeight // self.cellHeight, -(-numGlyphs // charsPerRow))
+                if not charsPerColumn: continue
+
+                texWidth, texHeight = self.getTextureSize(charsPerRow, charsPerColumn)
+                numSheets = -(-numGlyphs // (charsPerRow * charsPerColumn))
+                size = numSheets * textureSize(self.texFormat, texWidth, texHeight)
+                key = (size + numSheets * self.sheetWeight, numSheets, (charsPerRow, charsPerColumn) != current,
+                    abs(texWidth.bit_length() - texHeight.bit_length()))
+                if bestKey is None or key < bestKey:
+                    best, bestKey = (charsPerRow, charsPerColumn), key
+
+        return current if best is None else best
+
+
+    def _paintSheets(self, glyphs):
+        """
+        Paint the given glyphs onto texture sheets, in order, and return
+        the sheets as a list of QImages
+        """
+        charsPerTex = self.charsPerRow * self.charsPerColumn
+
+        texImages = []
+        for i in range(0, len(glyphs), charsPerTex):
+            texImages.append(self._paintSheet([g.pixmap for g in glyphs[i : i + charsPerTex]]))
+
+        return texImages
+
+
+    @timing.timed('paint')
+    def _paintSheet(self, pixmaps):
+        """
+        Paint up to (charsPerRow * charsPerColumn) glyph pixmaps onto a
+        single texture sheet, and return it as a QImage
+        """
+        texWidth, texHeight = self.getTextureSize()
+
+        tex = QtGui.QImage(texWidth, texHeight, QtGui.QImage.Format_ARGB32_Premultiplied)
+        tex.fill(QtCore.Qt.transparent)
+        texP = QtGui.QPainter(tex)
+
+        for i, pix in enumerate(pixmaps):
+            y, x = divmod(i, self.charsPerRow)
+            texP.drawPixmap(x * self.cellWidth, y * self.cellHeight, pix)
+
+        texP.end()
+        return tex
+
+
+    @timing.timed('encode')
+    def encodeSheet(self, tex):
+        """
+        Encode a texture sheet QImage in the font's texture format
+        """
+        self._checkSaveFormat()
+        texWidth, texHeight = self.getTextureSize()
+
+        encoder = TPLLib.encoder(self.texFormat, self.highQualityEncoding)
+        encoder = encoder(tex.bits().asstring(texWidth * texHeight * 4), texWidth, texHeight)
+        return encoder.run()
+
+
+    def _checkSaveFormat(self):
+        """
+        Raise ValueError if fonts can't be saved in the font's texture
+        format. Palette formats can only be read: TGLP has nowhere to
+        put a palette, so fonts that use them (see format.txt) aren't
+        standard.
+        """
+        if self.texFormat in TPLLib.PALETTE_FORMATS:
+            raise ValueError("%s fonts can be opened, but not saved (games can't read the palette). Please choose another texture format." % TPLLib.FORMAT_NAMES[self.texFormat])
+
+
+    def getPaletteSize(self):
+        """
+        Return the size of the palette stored with each texture sheet,
+        for fonts in palette formats
+        """
+        return 2 << {TPLLib.CI4: 4, TPLLib.CI8: 8, TPLLib.CI14x2: 14}[self.texFormat]
+
+
+    def _createCmapBlocks(self, layout=None):
         """
         Figure out how glyphs should be defined among CMAP blocks, and
         then yield the type value, the first character code, the last
@@ -1899,75 +2555,157 @@ class BRFNT:
         For type 0, the extra value is the first glyph index.
         For type 1, the extra value is a list of glyph indices.
         For type 2, the extra value is a list of (code, index) pairs.
-        """
 
-        charCodes = [g.value(self.encoding) for g in self.glyphs]
-        yieldedChars = [False] * len(charCodes)
-
-        def findRuns(L, minLen=1):
-            """
-            Find runs of numbers counting up by 1 in the given list.
-            Yield (startIndex, runLength) pairs.
-            Only runs at least minLen long will count.
-            """
-            if not L: return
-            runStartI = 0
-            lastValue = L[0]
-            for i, v in enumerate(L):
-                if i == 0: continue
-                if v != lastValue + 1:
-                    if i - runStartI >= minLen:
-                        yield runStartI, i - runStartI
-                    runStartI = i
-                lastValue = v
-            if len(L) - runStartI >= minLen:
-                yield runStartI, len(L) - runStartI
-
-
-        # Type-0 CMAPs (runs of glyphs and indices together)
-        for runStart, runLen in findRuns(charCodes, 5):
-            firstChar = charCodes[runStart]
-            lastChar = charCodes[runStart + runLen - 1]
-            yield 0, firstChar, lastChar, runStart
-
-            for i in range(runStart, runStart + runLen):
-                yieldedChars[i] = True
-
-        # Type-1 CMAPs (runs of increasing character codes with explicit indices)
-        remainingCodes = {}
-        for i, c in enumerate(charCodes):
-            if yieldedChars[i]: continue
-            remainingCodes[c] = i
-
-        sortedRemainingCodes = sorted(remainingCodes)
-        for runStart, runLen in findRuns(sortedRemainingCodes, 5):
-            firstChar = sortedRemainingCodes[runStart]
-            lastChar = sortedRemainingCodes[runStart + runLen - 1]
-            indices = []
-            for c in range(firstChar, lastChar + 1):
-                indices.append(remainingCodes[c])
-            yield 1, firstChar, lastChar, indices
-
-            for i in indices:
-                yieldedChars[i] = True
-
-        # And put whatever's left into a final type-2 CMAP (explicit mapping)
-        entries = []
-        for i, c in enumerate(charCodes):
-            if yieldedChars[i]: continue
-            entries.append((c, i))
-        if entries:
-            entries.sort(key=lambda e: e[0]) # sort by char code
-            yield 2, 0, 0xFFFF, entries
-
-
-    def getExportedImageMetrics(self):
+        Glyph indices are those of the stored glyphs, as described by
+        layout (from getSaveLayout(), which is called if it isn't
+        provided).
+
+        Blocks are planned to minimize their total size in bytes plus
+        cmapLookupWeight for each block (see below), and are yielded
+        largest first, since the console checks them in order when
+        looking up a character.
+        """
+        if layout is None:
+            layout = self.getSaveLayout()
+
+        # The first glyph with each code; any others can only go in
+        # the type-2 block
+        firstIndices = {}
+        duplicates = set()
+        for g, i in zip(self.glyphs, layout[1]):
+            c = g.value(self.encoding)
+            if c not in firstIndices:
+                firstIndices[c] = i
+            elif firstIndices[c] != i:
+                duplicates.add((c, i))
+
+        codes = sorted(firstIndices)
+        indices = [firstIndices[c] for c in codes]
+
+        for type, start, end in self._planCmapBlocks(codes, indices, bool(duplicates)):
+            if type == 0:
+                yield 0, codes[start], codes[end - 1], indices[start]
+            elif type == 1:
+                extra = [0xFFFF] * (codes[end - 1] - codes[start] + 1)
+                for i in range(start, end):
+                    extra[codes[i] - codes[start]] = indices[i]
+                yield 1, codes[start], codes[end - 1], extra
+            else:
+                entries = sorted([(codes[i], indices[i]) for i in start] + list(duplicates))
+                yield 2, 0, 0xFFFF, entries
+
+
+    def _planCmapBlocks(self, codes, indices, needType2=False):
+        """
+        Choose CMAP blocks for the sorted, unique character codes codes
+        (with glyph indices indices), by dynamic programming over the
+        codes in order. Returns a list of (type, start, end) for type-0
+        and type-1 blocks (covering codes[start:end]), sorted largest
+        first, followed by (2, list of positions in codes, None) if a
+        type-2 block is needed. With needType2, a type-2 block is
+        always included (even if it's empty).
+        """
+        HEADER = 0x14
+        weight = self.cmapLookupWeight
+        n = len(codes)
+        INF = float('inf')
+
+        # cost[layer][i]: cheapest way to cover codes[:i], without
+        # (layer 0) or with (layer 1) some codes left for the type-2
+        # block, whose fixed cost is added at the end.
+        # choice[layer][i]: (type, start, layer before)
+        cost = [[0] + [INF] * n, [INF] * (n + 1)]
+        choice = [[None] * (n + 1), [None] * (n + 1)]
+
+        # A type-1 block spanning a gap of g missing codes costs 2*g
+        # more bytes; once that's more than a new block would cost, it
+        # never pays to span it
+        maxGap = (HEADER + 4 + weight) // 2
+
+        # Best starting points so far, per layer: for type 0, the
+        # cheapest cost[j] in the current run of consecutive codes and
+        # indices; for type 1, the cheapest cost[j] - 2 * codes[j] in
+        # the current cluster, kept separately for even and odd codes
+        # (which decides whether the index list needs padding)
+        best0 = [(INF, 0), (INF, 0)]
+        best1 = [[(INF, 0), (INF, 0)], [(INF, 0), (INF, 0)]]
+
+        for i in range(1, n + 1):
+            j = i - 1
+            code = codes[j]
+
+            if j == 0 or code - codes[j - 1] != 1 or indices[j] - indices[j - 1] != 1:
+                best0 = [(INF, 0), (INF, 0)]
+            if j == 0 or code - codes[j - 1] - 1 > maxGap:
+                best1 = [[(INF, 0), (INF, 0)], [(INF, 0), (INF, 0)]]
+
+            for layer in (0, 1):
+                if cost[layer][j] < best0[layer][0]:
+                    best0[layer] = (cost[layer][j], j)
+                key = cost[layer][j] - 2 * code
+                if key < best1[layer][code & 1][0]:
+                    best1[layer][code & 1] = (key, j)
+
+            for layer in (0, 1):
+                # Type 0 ending here
+                value, start = best0[layer]
+                total = value + HEADER + 4 + weight
+                if total < cost[layer][i]:
+                    cost[layer][i] = total
+                    choice[layer][i] = (0, start, layer)
+
+                # Type 1 ending here: an odd number of indices needs
+                # two bytes of padding
+                for parity in (0, 1):
+                    value, start = best1[layer][parity]
+                    total = value + 2 * code + 2 + HEADER + weight + (2 if parity == code & 1 else 0)
+                    if total < cost[layer][i]:
+                        cost[layer][i] = total
+                        choice[layer][i] = (1, start, layer)
+
+            # Or put this code in the type-2 block (4 bytes per entry)
+            for layer in (0, 1):
+                total = cost[layer][j] + 4
+                if total < cost[1][i]:
+                    cost[1][i] = total
+                    choice[1][i] = (2, j, layer)
+
+        # The type-2 block's header and entry count, padded
+        type2Cost = HEADER + 4 + weight
+        if needType2:
+            layer = 0 if cost[0][n] <= cost[1][n] else 1
+        else:
+            layer = 0 if cost[0][n] <= cost[1][n] + type2Cost else 1
+
+        blocks = []
+        type2 = []
+        i = n
+        while i > 0:
+            type, start, prevLayer = choice[layer][i]
+            if type == 2:
+                type2.append(start)
+            else:
+                blocks.append((type, start, i))
+            i = start
+            layer = prevLayer
+
+        blocks.sort(key=lambda b: (b[1] - b[2], b[1]))
+        if type2 or needType2:
+            blocks.append((2, type2[::-1], None))
+        return blocks
+
+
+    def getExportedImageMetrics(self, numGlyphs=None):
         """
         Calculate the size and rows/columns that an image export of this
-        font should use.
+        font (or of numGlyphs glyphs with this font's cell size) should
+        use.
         """
+        if numGlyphs is None:
+            numGlyphs = len(self.glyphs)
+
         CHARS_PER_ROW = 16
-        numRows = (len(self.glyphs) + CHARS_PER_ROW - 1) // CHARS_PER_ROW
+        numRows = (numGlyphs + CHARS_PER_ROW - 1) // CHARS_PER_ROW
         texWidth = self.cellWidth * CHARS_PER_ROW
         texHeight = self.cellHeight * numRows
 
@@ -1993,6 +2731,137 @@ class BRFNT:
         return tex
 
 
+    def exportSheets(self):
+        """
+        Return a QImage with all of the texture sheets stacked
+        vertically, laid out the same way they're stored in the font,
+        but with every glyph in its own cell, in order
+        """
+        texWidth, texHeight = self.getTextureSize()
+        sheets = self._paintSheets(self.glyphs)
+
+        tex = QtGui.QImage(texWidth, texHeight * len(sheets), QtGui.QImage.Format_ARGB32_Premultiplied)
+        tex.fill(QtCore.Qt.transparent)
+        texP = QtGui.QPainter(tex)
+
+        for i, sheet in enumerate(sheets):
+            texP.drawImage(0, i * texHeight, sheet)
+
+        del texP
+        return tex
+
+
+    def getCellPositions(self, numGlyphs, layout):
+        """
+        Return the image size (width, height) and a list of (x, y)
+        glyph cell positions for an image of numGlyphs glyphs with the
+        given layout ('export' for exportImage(), 'sheets' for
+        exportSheets())
+        """
+        positions = []
+
+        if layout == 'export':
+            texWidth, texHeight, rows, columns = self.getExportedImageMetrics(numGlyphs)
+            for i in range(numGlyphs):
+                positions.append(((i % columns) * self.cellWidth, (i // columns) * self.cellHeight))
+
+        elif layout == 'sheets':
+            sheetWidth, sheetHeight = self.getTextureSize()
+            charsPerTex = self.charsPerRow * self.charsPerColumn
+            numSheets = (numGlyphs + charsPerTex - 1) // charsPerTex
+            texWidth, texHeight = sheetWidth, sheetHeight * numSheets
+            for i in range(numGlyphs):
+                sheet, cell = divmod(i, charsPerTex)
+                positions.append((
+                    (cell % self.charsPerRow) * self.cellWidth,
+                    sheet * sheetHeight + (cell // self.charsPerRow) * self.cellHeight))
+
+        else:
+            raise ValueError('unknown image layout: %s' % repr(layout))
+
+        return (texWidth, texHeight), positions
+
+
+    def getMetrics(self):
+        """
+        Return a JSON-serializable dict of everything in the font except
+        for the glyph images: FINF and TGLP values, and the CWDH entry
+        and CMAP character code of each glyph (in order)
+        """
+        return {
+            'version': METRICS_VERSION,
+            'endianness': 'big' if self.endianness == '>' else 'little',
+            'compressedSheets': self.compressedSheets,
+            'rfntVersion': [self.rfntVersionMajor, self.rfntVersionMinor],
+            'finf': {name: getattr(self, name) for name in FINF_METRICS},
+            'tglp': {name: getattr(self, name) for name in TGLP_METRICS},
+            'glyphs': [
+                {
+                    'code': g.value(self.encoding),
+                    'leftMargin': g.leftMargin,
+                    'charWidth': g.charWidth,
+                    'fullWidth': g.fullWidth,
+                } for g in self.glyphs],
+        }
+
+
+    def setMetrics(self, metrics):
+        """
+        Apply the font-wide values (everything but the glyph list) from
+        a dict in the format returned by getMetrics()
+        """
+        if metrics.get('version') != METRICS_VERSION:
+            raise ValueError('unsupported metrics version: %s' % repr(metrics.get('version')))
+
+        self.endianness = {'big': '>', 'little': '<'}[metrics['endianness']]
+        self.compressedSheets = metrics.get('compressedSheets', False)
+        self.rfntVersionMajor, self.rfntVersionMinor = metrics['rfntVersion']
+        for name in FINF_METRICS:
+            setattr(self, name, metrics['finf'][name])
+        for name in TGLP_METRICS:
+            setattr(self, name, metrics['tglp'][name])
+
+        if self.encoding not in ENCODINGS:
+            raise ValueError('unknown encoding: %s' % repr(self.encoding))
+
+
+    @classmethod
+    def fromImage(cls, image, metrics):
+        """
+        Create a font from a QImage of glyphs and a dict in the format
+        returned by getMetrics(). The image can use either the
+        exportImage() or the exportSheets() layout; the metrics dict can
+        specify which with a 'layout' key, or else it's guessed from the
+        image size. Raises ValueError if the image doesn't match the
+        glyph count and cell size in the metrics.
+        """
+        self = cls()
+        self.setMetrics(metrics)
+
+        entries = metrics['glyphs']
+        layouts = [metrics['layout']] if 'layout' in metrics else ['export', 'sheets']
+
+        expected = []
+        for layout in layouts:
+            size, positions = self.getCellPositions(len(entries), layout)
+            if size == (image.width(), image.height()):
+                break
+            expected.append('%dx%d (%s layout)' % (size[0], size[1], layout))
+        else:
+            raise ValueError('The image is %dx%d, but %d glyphs with %dx%d cells need %s'
+                % (image.width(), image.height(), len(entries),
+                    self.cellWidth, self.cellHeight, ' or '.join(expected)))
+
+        self.glyphs = []
+        for e, (x, y) in zip(entries, positions):
+            pix = QtGui.QPixmap.fromImage(image.copy(x, y, self.cellWidth, self.cellHeight))
+            g = Glyph(pix, valueToChar(e['code'], self.encoding), e['leftMargin'], e['charWidth'], e['fullWidth'])
+            g.updateToolTip(self.encoding)
+            self.glyphs.append(g)
+
+        return self
+
+
     def importImage(self, image):
         """
         Import a QImage over all of the character images
@@ -2014,6 +2883,20 @@ class BRFNT:
             g.update()
 
 
+def codeRanges(codes):
+    """
+    Return a sorted list of [first, last] pairs covering every character
+    code in codes (with no gaps inside each range)
+    """
+    ranges = []
+    for code in sorted(set(codes)):
+        if ranges and ranges[-1][1] == code - 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return ranges
+
+
 def valueToChar(value, encoding):
     """
     Convert an integer value (from CMAP data) to a single-character
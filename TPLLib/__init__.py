@@ -30,16 +30,29 @@
 ################################################################
 
 
+import time
+
 using_cython = True
 
 try:
     import pyximport
     pyximport.install()
     from .backend_cython import *
+    from . import backend_cython
 except ImportError:
     from .backend_python import *
+    backend_cython = None
     using_cython = False
 
+from . import backend_python
+
+# NumPy is optional; where it's available, it's used for the formats
+# that benefit the most from whole-texture processing
+try:
+    from . import backend_numpy
+except ImportError:
+    backend_numpy = None
+
 
 # Enums
 I4 = 0
@@ -54,69 +67,228 @@ CI8 = 9
 CI14x2 = 10
 CMPR = 14
 
+# Palette formats, which need palette (TLUT) data to go with the
+# texture. Their decoders take tlut and tlutFormat (TLUT_IA8,
+# TLUT_RGB565 or TLUT_RGB5A3) arguments; their encoders take tlutFormat
+# and put the palette in .tlut after run().
+PALETTE_FORMATS = (CI4, CI8, CI14x2)
+
+# Names used for each format's classes (e.g. I4Decoder, I4Encoder)
+FORMAT_NAMES = {
+    I4: 'I4',
+    I8: 'I8',
+    IA4: 'IA4',
+    IA8: 'IA8',
+    RGB565: 'RGB565',
+    RGB4A3: 'RGB4A3',
+    RGBA8: 'RGBA8',
+    CI4: 'CI4',
+    CI8: 'CI8',
+    CI14x2: 'CI14x2',
+    CMPR: 'CMPR',
+}
+
+# Codec capabilities
+THREADED = 'threaded' # runs in parallel with other threads (doesn't hold the GIL)
 
 
-def decoder(type):
+
+################################################################
+############################ Codecs ############################
+
+class Codec():
     """
-    Returns the appropriate decoding algorithm based on the type specified
+    A decoder or encoder class for one format, and what it can do
     """
-    if not isinstance(type, int):
-        raise TypeError('Type is not an int')
+    def __init__(self, backend, format, kind, cls, capabilities=(), highQuality=False):
+        """
+        Initializes the codec
+        """
+        self.backend = backend
+        self.format = format
+        self.kind = kind # 'decoder' or 'encoder'
+        self.cls = cls
+        self.capabilities = frozenset(capabilities)
+        self.highQuality = highQuality
 
-    if type == I4:
-    	return I4Decoder
-    elif type == I8:
-    	return I8Decoder
-    elif type == IA4:
-    	return IA4Decoder
-    elif type == IA8:
-    	return IA8Decoder
-    elif type == RGB565:
-    	return RGB565Decoder
-    elif type == RGB4A3:
-    	return RGB4A3Decoder
-    elif type == RGBA8:
-    	return RGBA8Decoder
-    elif type == CI4:
-        raise ValueError('CI4 is not supported')
-    elif type == CI8:
-        raise ValueError('CI8 is not supported')
-    elif type == CI14x2:
-        raise ValueError('CI14x2 is not supported')
-    elif type == CMPR:
-        raise ValueError('CMPR is not supported')
-    else:
-        raise ValueError('Unrecognized type')
+    def __repr__(self):
+        return '<Codec %s %s %s (%s)>' % (self.backend, FORMAT_NAMES.get(self.format, self.format), self.kind, ', '.join(sorted(self.capabilities)))
+
+
+# (kind, format) -> list of Codecs, most preferred first
+codecs = {}
+
+# Backend names, most preferred first, for formats that haven't been
+# calibrated
+backendPriority = []
+
+# (kind, format, highQuality) -> the backend calibrate() found fastest
+calibrated = {}
+
+# Formats calibrate() has been run for
+calibratedFormats = set()
+
+
+def registerCodec(backend, format, kind, cls, capabilities=(), highQuality=False):
+    """
+    Makes a decoder or encoder class available through decoder() and
+    encoder(). highQuality marks encoders that are slower but give
+    better results than the backend's normal one for that format.
+    """
+    if kind not in ('decoder', 'encoder'):
+        raise ValueError('Unrecognized codec kind: %s' % kind)
+    if backend not in backendPriority:
+        backendPriority.append(backend)
+
+    codec = Codec(backend, format, kind, cls, capabilities, highQuality)
+    codecs.setdefault((kind, format), []).append(codec)
+    codecs[kind, format].sort(key=lambda c: backendPriority.index(c.backend))
+    return codec
+
+
+def registerBackend(backend, module, capabilities=()):
+    """
+    Registers every decoder and encoder a backend module provides,
+    found by name (I4Decoder, I4Encoder, ...). A module can also
+    provide high-quality encoders, named like CMPRHighQualityEncoder.
+    capabilities apply to all of them; classes whose threaded attribute
+    is True also get THREADED.
+    """
+    for format, name in FORMAT_NAMES.items():
+        for kind, suffix, highQuality in (
+                ('decoder', 'Decoder', False),
+                ('encoder', 'Encoder', False),
+                ('encoder', 'HighQualityEncoder', True)):
+            cls = getattr(module, name + suffix, None)
+            if cls is not None:
+                codecCapabilities = tuple(capabilities)
+                if getattr(cls, 'threaded', False):
+                    codecCapabilities += (THREADED,)
+                registerCodec(backend, format, kind, cls, codecCapabilities, highQuality)
 
 
-def encoder(type):
+def findCodec(kind, type, highQuality=False, backend=None, require=()):
     """
-    Returns the appropriate encoding algorithm based on the type specified
+    Returns the Codec to use for a format. If backend is given, only
+    that backend's codecs are used; otherwise the fastest one according
+    to calibrate() is picked (it's run for the format the first time
+    there's more than one backend to choose from). require is a
+    collection of capabilities the codec must have.
     """
     if not isinstance(type, int):
         raise TypeError('Type is not an int')
+    if type not in FORMAT_NAMES:
+        raise ValueError('Unrecognized type')
+
+    candidates = [c for c in codecs.get((kind, type), ()) if c.capabilities.issuperset(require)]
+    if backend is not None:
+        candidates = [c for c in candidates if c.backend == backend]
 
-    if type == I4:
-        return I4Encoder
-    elif type == I8:
-        return I8Encoder
-    elif type == IA4:
-        return IA4Encoder
-    elif type == IA8:
-        return IA8Encoder
-    elif type == RGB565:
-        return RGB565Encoder
-    elif type == RGB4A3:
-        return RGB4A3Encoder
-    elif type == RGBA8:
-        return RGBA8Encoder
-    elif type == CI4:
-        raise ValueError('CI4 is not supported')
-    elif type == CI8:
-        raise ValueError('CI8 is not supported')
-    elif type == CI14x2:
-        raise ValueError('CI14x2 is not supported')
-    elif type == CMPR:
-        raise ValueError('CMPR is not supported')
+    if highQuality:
+        # Fall back to the normal codec if no backend has a better one
+        candidates = [c for c in candidates if c.highQuality] or [c for c in candidates if not c.highQuality]
     else:
-        raise ValueError('Unrecognized type')
+        candidates = [c for c in candidates if not c.highQuality]
+
+    if not candidates:
+        message = '%s is not supported' % FORMAT_NAMES[type]
+        if backend is not None:
+            message += ' by the %s backend' % backend
+        if require:
+            message += ' with %s' % ', '.join(sorted(require))
+        raise ValueError(message)
+
+    if backend is None and type not in calibratedFormats and len({c.backend for c in candidates}) > 1:
+        calibrate(formats=(type,))
+
+    fastest = calibrated.get((kind, type, highQuality))
+    for c in candidates:
+        if c.backend == fastest:
+            return c
+    return candidates[0]
+
+
+def calibrate(size=64, repeat=3, formats=None):
+    """
+    Times every registered codec on a small synthetic texture, so that
+    decoder() and encoder() pick the fastest available backend for
+    each format from now on. Only backends whose output matches the
+    most preferred backend's are considered, so which one is fastest
+    never changes what gets encoded. Returns {(kind, format,
+    highQuality): {backend: seconds}}.
+    """
+    from .tpl import textureSize
+
+    # Glyph-like test image: a few colors, mostly transparent
+    argb = bytearray(size * size * 4)
+    for y in range(size):
+        for x in range(size):
+            if (x * 3 + y * 5) % 7 < 3:
+                argb[(y * size + x) * 4 : (y * size + x) * 4 + 4] = (0xFF, 0xC0 if x % 2 else 0xFF, 0x80, 0xFF)
+    argb = bytes(argb)
+    tlut = bytes(range(256)) * 128
+
+    results = {}
+    for (kind, format), formatCodecs in codecs.items():
+        if formats is not None and format not in formats:
+            continue
+
+        if kind == 'decoder':
+            args = (bytes((i * 37) & 0xFF for i in range(textureSize(format, size, size))), size, size)
+        else:
+            args = (argb, size, size)
+        kwargs = {}
+        if format in PALETTE_FORMATS:
+            kwargs = {'tlut': tlut} if kind == 'decoder' else {'tlutFormat': TLUT_RGB5A3}
+
+        references = {} # highQuality -> the most preferred backend's output
+        for codec in formatCodecs:
+            best = None
+            try:
+                for i in range(repeat):
+                    start = time.perf_counter()
+                    output = codec.cls(*args, **kwargs).run()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+            except Exception:
+                continue # a codec that fails just isn't calibrated
+            if bytes(output) != references.setdefault(codec.highQuality, bytes(output)):
+                continue
+            results.setdefault((kind, format, codec.highQuality), {})[codec.backend] = best
+
+    calibratedFormats.update(format for kind, format in codecs if formats is None or format in formats)
+    for key, times in results.items():
+        calibrated[key] = min(times, key=times.get)
+    return results
+
+
+# Built-in backends, most preferred first. Only the NumPy codecs that do
+# all of their work in NumPy (outside the GIL) can run in parallel in
+# threads; they set threaded = True.
+if backend_numpy is not None:
+    registerBackend('numpy', backend_numpy)
+if backend_cython is not None:
+    registerBackend('cython', backend_cython)
+registerBackend('python', backend_python)
+
+
+
+def decoder(type, backend=None, require=()):
+    """
+    Returns the appropriate decoding algorithm based on the type specified.
+    See findCodec() for backend and require.
+    """
+    return findCodec('decoder', type, False, backend, require).cls
+
+
+def encoder(type, highQuality=False, backend=None, require=()):
+    """
+    Returns the appropriate encoding algorithm based on the type specified.
+    If highQuality is True, slower algorithms that give better results
+    are used where available. See findCodec() for backend and require.
+    """
+    return findCodec('encoder', type, highQuality, backend, require).cls
+
+
+# TPL files (this needs the functions above)
+from .tpl import TPL, TPLImage
@@ -26,6 +26,11 @@
 # Image encoding/decoding classes using pure-Python as a backend
 
 
+import bisect
+import heapq
+import itertools
+
+
 ################################################################
 ################################################################
 
@@ -739,3 +744,526 @@ class RGBA8Encoder(Encoder):
 
         self.result = bytes(texBuf)
         return self.result
+
+
+class CMPRDecoder(Decoder):
+    """
+    Decodes a CMPR texture
+    """
+    # Format:
+    # 8x8 tiles, each made of four 4x4 DXT1 blocks (top-left, top-right,
+    # bottom-left, bottom-right):
+    # RRRRRGGG GGGBBBBB (color 0)
+    # RRRRRGGG GGGBBBBB (color 1)
+    # 4 bytes of 2-bit palette indices, one byte per row, leftmost first
+    bytesPerPixel = .5
+
+    def run(self):
+        """
+        Runs the algorithm
+        """
+        tex, w, h = self.tex, self.size[0], self.size[1]
+
+        argbBuf = bytearray(w * h * 4)
+        i = 0
+        for ytile in range(0, h, 8):
+            for xtile in range(0, w, 8):
+                for yblock in range(ytile, ytile + 8, 4):
+                    for xblock in range(xtile, xtile + 8, 4):
+
+                        palette = CMPRPalette((tex[i] << 8) | tex[i + 1], (tex[i + 2] << 8) | tex[i + 3])
+
+                        for ypixel in range(yblock, yblock + 4):
+                            indices = tex[i + 4 + ypixel - yblock]
+
+                            for xpixel in range(xblock, xblock + 4):
+                                if xpixel >= w or ypixel >= h:
+                                    continue
+
+                                blue, green, red, alpha = palette[(indices >> (6 - 2 * (xpixel - xblock))) & 3]
+
+                                argbBuf[(((ypixel * w) + xpixel) * 4) + 0] = blue
+                                argbBuf[(((ypixel * w) + xpixel) * 4) + 1] = green
+                                argbBuf[(((ypixel * w) + xpixel) * 4) + 2] = red
+                                argbBuf[(((ypixel * w) + xpixel) * 4) + 3] = alpha
+
+                        i += 8
+
+            newProgress = (ytile / h) - self.progress
+            if newProgress > self.updateInterval and self.updater:
+                self.progress += self.updateInterval
+                self.updater()
+
+        self.result = bytes(argbBuf)
+        return self.result
+
+
+def CMPRPalette(color0, color1):
+    """
+    Returns the four (blue, green, red, alpha) colors a CMPR block can
+    use, given its two RGB565 endpoint colors. The in-between colors
+    are blended the same way the GameCube/Wii GPU does it.
+    """
+    red0, green0, blue0 = RGB565ToRGB8(color0)
+    red1, green1, blue1 = RGB565ToRGB8(color1)
+
+    if color0 > color1:
+        color2 = ((blue0 * 5 + blue1 * 3) >> 3, (green0 * 5 + green1 * 3) >> 3, (red0 * 5 + red1 * 3) >> 3, 0xFF)
+        color3 = ((blue0 * 3 + blue1 * 5) >> 3, (green0 * 3 + green1 * 5) >> 3, (red0 * 3 + red1 * 5) >> 3, 0xFF)
+    else:
+        color2 = ((blue0 + blue1) >> 1, (green0 + green1) >> 1, (red0 + red1) >> 1, 0xFF)
+        color3 = (0, 0, 0, 0)
+
+    return [(blue0, green0, red0, 0xFF), (blue1, green1, red1, 0xFF), color2, color3]
+
+
+def RGB565ToRGB8(color):
+    """
+    Expands an RGB565 color to an (red, green, blue) tuple of 8-bit values
+    """
+    red5 = color >> 11
+    green6 = (color >> 5) & 0x3F
+    blue5 = color & 0x1F
+    return red5 << 3 | red5 >> 2, green6 << 2 | green6 >> 4, blue5 << 3 | blue5 >> 2
+
+
+class CMPREncoder(Encoder):
+    """
+    Encodes a CMPR texture
+    """
+    # Format: see CMPRDecoder
+    # Endpoints are chosen with a "range fit": the corners of the
+    # bounding box of the block's colors, along its main diagonal
+    bytesPerPixel = .5
+
+    def run(self):
+        """
+        Runs the algorithm
+        """
+        argb, w, h = self.argb, self.size[0], self.size[1]
+
+        texBuf = bytearray(((w + 7) // 8) * ((h + 7) // 8) * 32)
+        i = 0
+        for ytile in range(0, h, 8):
+            for xtile in range(0, w, 8):
+                for yblock in range(ytile, ytile + 8, 4):
+                    for xblock in range(xtile, xtile + 8, 4):
+
+                        # (blue, green, red) for each pixel, or None if
+                        # it's transparent
+                        pixels = []
+                        for ypixel in range(yblock, yblock + 4):
+                            for xpixel in range(xblock, xblock + 4):
+                                if xpixel >= w or ypixel >= h or argb[(((ypixel * w) + xpixel) * 4) + 3] < 128:
+                                    pixels.append(None)
+                                else:
+                                    pixels.append(tuple(argb[((ypixel * w) + xpixel) * 4 : (((ypixel * w) + xpixel) * 4) + 3]))
+
+                        texBuf[i:i + 8] = CMPRBlock(pixels)
+                        i += 8
+
+            newProgress = (ytile / h) - self.progress
+            if newProgress > self.updateInterval and self.updater:
+                self.progress += self.updateInterval
+                self.updater()
+
+        self.result = bytes(texBuf)
+        return self.result
+
+
+def CMPRBlock(pixels):
+    """
+    Returns an encoded 4x4 CMPR block, given a list of 16
+    (blue, green, red) colors (None for transparent pixels)
+    """
+    opaque = [p for p in pixels if p is not None]
+    if not opaque:
+        return b'\0\0\0\0\xFF\xFF\xFF\xFF'
+
+    low = [min(p[c] for p in opaque) for c in range(3)]
+    high = [max(p[c] for p in opaque) for c in range(3)]
+
+    # Use the diagonal of the bounding box that follows the colors:
+    # if blue or red decreases as green increases, flip that axis
+    mean = [sum(p[c] for p in opaque) / len(opaque) for c in range(3)]
+    for c in (0, 2):
+        if sum((p[c] - mean[c]) * (p[1] - mean[1]) for p in opaque) < 0:
+            low[c], high[c] = high[c], low[c]
+
+    # Pull the endpoints in a bit, since the extremes are rarely the
+    # best choice
+    for c in range(3):
+        inset = (high[c] - low[c]) >> 4
+        high[c] -= inset
+        low[c] += inset
+
+    color0 = RGB8ToRGB565(high[2], high[1], high[0])
+    color1 = RGB8ToRGB565(low[2], low[1], low[0])
+
+    # Blocks with transparent pixels need the three-color mode
+    # (color0 <= color1); all others use the four-color one
+    if (len(opaque) < 16) == (color0 > color1):
+        color0, color1 = color1, color0
+
+    palette = CMPRPalette(color0, color1)
+    numColors = 4 if color0 > color1 else 3
+
+    block = bytearray((color0 >> 8, color0 & 0xFF, color1 >> 8, color1 & 0xFF))
+    for row in range(4):
+        indices = 0
+        for column in range(4):
+            pixel = pixels[row * 4 + column]
+            if pixel is None:
+                index = 3
+            else:
+                index = min(range(numColors), key=lambda j: (
+                    (palette[j][0] - pixel[0]) ** 2
+                    + (palette[j][1] - pixel[1]) ** 2
+                    + (palette[j][2] - pixel[2]) ** 2))
+            indices |= index << (6 - 2 * column)
+        block.append(indices)
+
+    return block
+
+
+def RGB8ToRGB565(red, green, blue):
+    """
+    Converts 8-bit red, green and blue values to an RGB565 color
+    """
+    red5 = ((red + 4) << 2) // 33
+    green6 = ((green + 2) << 4) // 65
+    blue5 = ((blue + 4) << 2) // 33
+    return red5 << 11 | green6 << 5 | blue5
+
+
+# Palette (TLUT) formats
+TLUT_IA8 = 0
+TLUT_RGB565 = 1
+TLUT_RGB5A3 = 2
+
+
+class PaletteDecoder(Decoder):
+    """
+    Object that decodes a palette (CI4, CI8 or CI14x2) texture, given
+    its palette (TLUT) data
+    """
+    def __init__(self, tex, width, height, updater=None, updateInterval=0.1, tlut=b'', tlutFormat=TLUT_RGB5A3):
+        """
+        Initializes the decoder
+        """
+        Decoder.__init__(self, tex, width, height, updater, updateInterval)
+        self.tlut = tlut
+        self.tlutFormat = tlutFormat
+
+    def run(self):
+        """
+        Runs the algorithm
+        """
+        tex, w, h = self.tex, self.size[0], self.size[1]
+        tileW, tileH = self.tileSize
+
+        # Indices past the end of the palette are transparent
+        colors = TLUTColors(self.tlut, self.tlutFormat)
+        colors.extend([b'\0\0\0\0'] * ((1 << self.indexBits) - len(colors)))
+        indices = self.unpackIndices(tex)
+
+        argbBuf = bytearray(w * h * 4)
+        i = 0
+        for ytile in range(0, h, tileH):
+            for xtile in range(0, w, tileW):
+                for ypixel in range(ytile, ytile + tileH):
+                    for xpixel in range(xtile, xtile + tileW):
+                        index = indices[i]
+                        i += 1
+
+                        if xpixel >= w or ypixel >= h:
+                            continue
+
+                        argbBuf[((ypixel * w) + xpixel) * 4 : (((ypixel * w) + xpixel) * 4) + 4] = colors[index]
+
+            newProgress = (ytile / h) - self.progress
+            if newProgress > self.updateInterval and self.updater:
+                self.progress += self.updateInterval
+                self.updater()
+
+        self.result = bytes(argbBuf)
+        return self.result
+
+
+class PaletteEncoder(Encoder):
+    """
+    Object that encodes a palette (CI4, CI8 or CI14x2) texture. After
+    run(), the palette (TLUT) data is in self.tlut. Images with more
+    distinct colors than the format allows are reduced with a median
+    cut (see medianCut()).
+    """
+    def __init__(self, argb, width, height, updater=None, updateInterval=0.1, tlutFormat=TLUT_RGB5A3):
+        """
+        Initializes the encoder
+        """
+        Encoder.__init__(self, argb, width, height, updater, updateInterval)
+        self.tlutFormat = tlutFormat
+        self.tlut = None
+
+    def run(self):
+        """
+        Runs the algorithm
+        """
+        argb, w, h = self.argb, self.size[0], self.size[1]
+        tileW, tileH = self.tileSize
+        maxColors = 1 << self.indexBits
+
+        # Palette entries are numbered in the order they first appear
+        entries = {}
+        pixelEntries = []
+        for pixel in range(w * h):
+            entry = BGRAToTLUTEntry(*argb[pixel * 4 : pixel * 4 + 4], self.tlutFormat)
+            pixelEntries.append(entries.setdefault(entry, len(entries)))
+        if len(entries) > maxColors:
+            colors = [TLUTEntryToBGRA(entry, self.tlutFormat) for entry in entries]
+            counts = [0] * len(colors)
+            for entry in pixelEntries:
+                counts[entry] += 1
+            labels = medianCut(colors, counts, maxColors)
+
+            # Each palette color is the pixel-weighted average of its box
+            numBoxes = max(labels) + 1
+            weights = [0] * numBoxes
+            sums = [[0] * 4 for box in range(numBoxes)]
+            for color, count, label in zip(colors, counts, labels):
+                weights[label] += count
+                for c in range(4):
+                    sums[label][c] += color[c] * count
+
+            entries = [BGRAToTLUTEntry(*[round(total / weight) for total in boxSums], self.tlutFormat)
+                       for boxSums, weight in zip(sums, weights)]
+            pixelEntries = [labels[entry] for entry in pixelEntries]
+
+        indices = []
+        for ytile in range(0, h, tileH):
+            for xtile in range(0, w, tileW):
+                for ypixel in range(ytile, ytile + tileH):
+                    for xpixel in range(xtile, xtile + tileW):
+                        if xpixel >= w or ypixel >= h:
+                            indices.append(0)
+                        else:
+                            indices.append(pixelEntries[(ypixel * w) + xpixel])
+
+            newProgress = (ytile / h) - self.progress
+            if newProgress > self.updateInterval and self.updater:
+                self.progress += self.updateInterval
+                self.updater()
+
+        tlut = bytearray()
+        for entry in entries:
+            tlut.append(entry >> 8)
+            tlut.append(entry & 0xFF)
+        self.tlut = bytes(tlut)
+
+        self.result = self.packIndices(indices)
+        return self.result
+
+
+class CI4Decoder(PaletteDecoder):
+    """
+    Decodes a CI4 texture
+    """
+    # Format:
+    # 8x8 tiles of 4-bit palette indices, left pixel in the upper nybble
+    bytesPerPixel = .5
+    indexBits = 4
+    tileSize = (8, 8)
+
+    def unpackIndices(self, tex):
+        """
+        Returns a list of all palette indices, in storage order
+        """
+        indices = []
+        for byte in tex:
+            indices.append(byte >> 4)
+            indices.append(byte & 0xF)
+        return indices
+
+
+class CI4Encoder(PaletteEncoder):
+    """
+    Encodes a CI4 texture
+    """
+    # Format: see CI4Decoder
+    bytesPerPixel = .5
+    indexBits = 4
+    tileSize = (8, 8)
+
+    def packIndices(self, indices):
+        """
+        Returns palette indices (in storage order) as bytes
+        """
+        return bytes(indices[i] << 4 | indices[i + 1] for i in range(0, len(indices), 2))
+
+
+class CI8Decoder(PaletteDecoder):
+    """
+    Decodes a CI8 texture
+    """
+    # Format:
+    # 8x4 tiles of 8-bit palette indices
+    bytesPerPixel = 1
+    indexBits = 8
+    tileSize = (8, 4)
+
+    def unpackIndices(self, tex):
+        """
+        Returns a list of all palette indices, in storage order
+        """
+        return list(tex)
+
+
+class CI8Encoder(PaletteEncoder):
+    """
+    Encodes a CI8 texture
+    """
+    # Format: see CI8Decoder
+    bytesPerPixel = 1
+    indexBits = 8
+    tileSize = (8, 4)
+
+    def packIndices(self, indices):
+        """
+        Returns palette indices (in storage order) as bytes
+        """
+        return bytes(indices)
+
+
+class CI14x2Decoder(PaletteDecoder):
+    """
+    Decodes a CI14x2 texture
+    """
+    # Format:
+    # 4x4 tiles of 16-bit values, whose lower 14 bits are palette indices
+    # 00IIIIII IIIIIIII
+    bytesPerPixel = 2
+    indexBits = 14
+    tileSize = (4, 4)
+
+    def unpackIndices(self, tex):
+        """
+        Returns a list of all palette indices, in storage order
+        """
+        return [((tex[i] << 8) | tex[i + 1]) & 0x3FFF for i in range(0, len(tex) - 1, 2)]
+
+
+class CI14x2Encoder(PaletteEncoder):
+    """
+    Encodes a CI14x2 texture
+    """
+    # Format: see CI14x2Decoder
+    bytesPerPixel = 2
+    indexBits = 14
+    tileSize = (4, 4)
+
+    def packIndices(self, indices):
+        """
+        Returns palette indices (in storage order) as bytes
+        """
+        texBuf = bytearray()
+        for index in indices:
+            texBuf.append(index >> 8)
+            texBuf.append(index & 0xFF)
+        return bytes(texBuf)
+
+
+def TLUTColors(tlut, tlutFormat):
+    """
+    Returns the colors in palette (TLUT) data, as a list of 4-byte
+    (blue, green, red, alpha) bytes objects
+    """
+    return [bytes(TLUTEntryToBGRA((tlut[i] << 8) | tlut[i + 1], tlutFormat)) for i in range(0, len(tlut) - 1, 2)]
+
+
+def medianCut(colors, counts, maxColors):
+    """
+    Groups colors (a list of tuples of channel values) into at most
+    maxColors boxes by repeatedly splitting the box with the widest
+    channel range (weighted by how many pixels it covers) at the
+    weighted median of that channel. Returns the box number of each
+    color.
+    """
+    def priority(box):
+        spreads = [max(colors[i][c] for i in box) - min(colors[i][c] for i in box) for c in range(len(colors[0]))]
+        spread = max(spreads)
+        return -spread * sum(counts[i] for i in box), spreads.index(spread)
+
+    boxes = []
+    heap = []
+    def addBox(box):
+        if len(box) > 1:
+            score, channel = priority(box)
+            if score:
+                heapq.heappush(heap, (score, len(boxes), channel))
+        boxes.append(box)
+
+    addBox(list(range(len(colors))))
+    while heap and len(boxes) < maxColors:
+        _, i, channel = heapq.heappop(heap)
+        box = sorted(boxes[i], key=lambda c: colors[c][channel])
+
+        cumulative = list(itertools.accumulate(counts[c] for c in box))
+        split = bisect.bisect_left(cumulative, cumulative[-1] / 2)
+        split = min(max(split, 1), len(box) - 1)
+
+        boxes[i] = box[:split]
+        addBox(box[split:])
+        if len(boxes[i]) > 1:
+            score, channel = priority(boxes[i])
+            if score:
+                heapq.heappush(heap, (score, i, channel))
+
+    labels = [0] * len(colors)
+    for i, box in enumerate(boxes):
+        for c in box:
+            labels[c] = i
+    return labels
+
+
+def TLUTEntryToBGRA(entry, tlutFormat):
+    """
+    Converts a palette entry to a (blue, green, red, alpha) tuple. The
+    entry formats are the same as in IA8, RGB565 and RGB4A3 textures.
+    """
+    if tlutFormat == TLUT_IA8:
+        return entry >> 8, entry >> 8, entry >> 8, entry & 0xFF
+
+    elif tlutFormat == TLUT_RGB565:
+        red, green, blue = RGB565ToRGB8(entry)
+        return blue, green, red, 0xFF
+
+    elif entry & 0x8000: # RGB555
+        red5 = (entry >> 10) & 0x1F
+        green5 = (entry >> 5) & 0x1F
+        blue5 = entry & 0x1F
+        return blue5 << 3 | blue5 >> 2, green5 << 3 | green5 >> 2, red5 << 3 | red5 >> 2, 0xFF
+
+    else: # RGB4A3
+        alpha3 = entry >> 12
+        return (entry & 0xF) * 17, ((entry >> 4) & 0xF) * 17, ((entry >> 8) & 0xF) * 17, (alpha3 << 5) | (alpha3 << 2) | (alpha3 >> 1)
+
+
+def BGRAToTLUTEntry(blue, green, red, alpha, tlutFormat):
+    """
+    Converts a color to the closest palette entry in the given format
+    """
+    if tlutFormat == TLUT_IA8:
+        return ((red + green + blue) // 3) << 8 | alpha
+
+    elif tlutFormat == TLUT_RGB565:
+        return RGB8ToRGB565(red, green, blue)
+
+    elif alpha < 238: # RGB4A3
+        alpha3 = ((alpha + 18) << 1) // 73
+        return (alpha3 << 12) | (((red + 8) // 17) << 8) | (((green + 8) // 17) << 4) | ((blue + 8) // 17)
+
+    else: # RGB555
+        red5 = ((red + 4) << 2) // 33
+        green5 = ((green + 4) << 2) // 33
+        blue5 = ((blue + 4) << 2) // 33
+        return 0x8000 | (red5 << 10) | (green5 << 5) | blue5
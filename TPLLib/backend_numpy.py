@@ -0,0 +1,627 @@
+#!/usr/bin/python
+# -*- coding: latin-1 -*-
+
+# TPLLib - A Python library for decoding and encoding Nintendo image formats
+# Version 0.1
+# Copyright (C) 2009-2014 Tempus, RoadrunnerWMC
+
+# This file is part of TPLLib.
+
+# TPLLib is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# TPLLib is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with TPLLib.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# backend_numpy.py
+# Image encoding/decoding classes that use NumPy to process whole
+# textures at once. This backend is optional, and only provides some
+# formats; the others come from the Python or Cython backend.
+
+
+################################################################
+################################################################
+
+import heapq
+
+import numpy
+
+from .backend_python import Decoder, Encoder, PaletteDecoder, PaletteEncoder, TLUT_IA8, TLUT_RGB565
+
+
+
+def _tileBlocks(tex, w, h, tileW, tileH, blockSize, blocksPerTile=1):
+    """
+    Returns the encoded texture as an array of shape
+    (tileRows, tileColumns, blocksPerTile, blockSize)
+    """
+    tilesX = (w + tileW - 1) // tileW
+    tilesY = (h + tileH - 1) // tileH
+    data = numpy.frombuffer(tex, dtype=numpy.uint8, count=tilesX * tilesY * blocksPerTile * blockSize)
+    return data.reshape(tilesY, tilesX, blocksPerTile, blockSize)
+
+
+def _untile(pixels, w, h):
+    """
+    Converts an array of shape (tileRows, tileColumns, tileH, tileW, 4)
+    to BGRA bytes for a w x h image
+    """
+    tilesY, tilesX, tileH, tileW, _ = pixels.shape
+    image = pixels.transpose(0, 2, 1, 3, 4).reshape(tilesY * tileH, tilesX * tileW, 4)
+    return numpy.ascontiguousarray(image[:h, :w]).tobytes()
+
+
+def _tilePixels(argb, w, h, tileW, tileH):
+    """
+    Returns BGRA bytes for a w x h image as an array of shape
+    (tileRows, tileColumns, tileH, tileW, 4). Pixels outside the image
+    are transparent black.
+    """
+    tilesX = (w + tileW - 1) // tileW
+    tilesY = (h + tileH - 1) // tileH
+    image = numpy.zeros((tilesY * tileH, tilesX * tileW, 4), dtype=numpy.uint8)
+    image[:h, :w] = numpy.frombuffer(argb, dtype=numpy.uint8, count=w * h * 4).reshape(h, w, 4)
+    return image.reshape(tilesY, tileH, tilesX, tileW, 4).transpose(0, 2, 1, 3, 4)
+
+
+def _expandRGB565(colors):
+    """
+    Expands an array of RGB565 colors to an array of (blue, green, red)
+    values, with a new last axis
+    """
+    red5 = colors >> 11
+    green6 = (colors >> 5) & 0x3F
+    blue5 = colors & 0x1F
+    return numpy.stack([
+        blue5 << 3 | blue5 >> 2,
+        green6 << 2 | green6 >> 4,
+        red5 << 3 | red5 >> 2], axis=-1)
+
+
+def _packRGB565(bgr):
+    """
+    Converts an array of (blue, green, red) values (last axis) to an
+    array of RGB565 colors
+    """
+    red5 = ((bgr[..., 2] + 4) << 2) // 33
+    green6 = ((bgr[..., 1] + 2) << 4) // 65
+    blue5 = ((bgr[..., 0] + 4) << 2) // 33
+    return red5 << 11 | green6 << 5 | blue5
+
+
+
+################################################################
+############################# CMPR #############################
+
+def _CMPRPalettes(color0, color1):
+    """
+    Returns the four-color palettes of CMPR blocks with the given
+    RGB565 endpoint colors, as an array with two new axes
+    (color index, BGRA)
+    """
+    bgr0 = _expandRGB565(color0)
+    bgr1 = _expandRGB565(color1)
+
+    fourColor = (color0 > color1)[..., None]
+    bgr2 = numpy.where(fourColor, (bgr0 * 5 + bgr1 * 3) >> 3, (bgr0 + bgr1) >> 1)
+    bgr3 = numpy.where(fourColor, (bgr0 * 3 + bgr1 * 5) >> 3, 0)
+    alpha3 = numpy.where(fourColor, 0xFF, 0)
+
+    opaque = numpy.full(alpha3.shape, 0xFF)
+    return numpy.stack([
+        numpy.concatenate([bgr0, opaque], axis=-1),
+        numpy.concatenate([bgr1, opaque], axis=-1),
+        numpy.concatenate([bgr2, opaque], axis=-1),
+        numpy.concatenate([bgr3, alpha3], axis=-1),
+    ], axis=-2)
+
+
+def _CMPRBlockPixels(argb, w, h):
+    """
+    Splits BGRA bytes into CMPR blocks, in the order they're stored.
+    Returns an array of shape (blocks, 16 pixels, BGR) and one of shape
+    (blocks, 16 pixels) that says which pixels are opaque.
+    """
+    tiles = _tilePixels(argb, w, h, 8, 8)
+    tilesY, tilesX = tiles.shape[:2]
+    # (tileRows, tileColumns, blockRow, row, blockColumn, column, BGRA)
+    # -> (tileRows, tileColumns, blockRow, blockColumn, row, column, BGRA)
+    blocks = tiles.reshape(tilesY, tilesX, 2, 4, 2, 4, 4).transpose(0, 1, 2, 4, 3, 5, 6)
+    blocks = blocks.reshape(-1, 16, 4).astype(numpy.int32)
+    return blocks[..., :3], blocks[..., 3] >= 128
+
+
+def _CMPRIndices(colors, opaque, color0, color1):
+    """
+    Picks the closest palette color for every pixel of every block.
+    Returns the indices and each block's total squared error.
+    """
+    palettes = _CMPRPalettes(color0, color1)[..., :3].astype(numpy.int32)
+
+    # (blocks, 16 pixels, 4 palette colors)
+    distances = ((colors[:, :, None, :] - palettes[:, None, :, :]) ** 2).sum(axis=-1)
+    distances[:, :, 3] = numpy.where((color0 > color1)[:, None], distances[:, :, 3], numpy.iinfo(numpy.int32).max)
+
+    indices = distances.argmin(axis=-1)
+    errors = numpy.take_along_axis(distances, indices[..., None], axis=-1)[..., 0]
+    indices = numpy.where(opaque, indices, 3)
+    return indices, numpy.where(opaque, errors, 0).sum(axis=-1)
+
+
+def _CMPROrderEndpoints(color0, color1, threeColor):
+    """
+    Swaps endpoints where needed so that blocks use the three-color
+    mode (color0 <= color1) where threeColor is True, and the
+    four-color mode elsewhere
+    """
+    swap = threeColor == (color0 > color1)
+    return numpy.where(swap, color1, color0), numpy.where(swap, color0, color1)
+
+
+def _CMPRRangeFit(colors, opaque):
+    """
+    Chooses endpoint colors for every block: the corners of the
+    bounding box of its opaque colors, along its main diagonal, pulled
+    in by 1/16 of the box size
+    """
+    counts = opaque.sum(axis=-1)
+    mask = opaque[..., None]
+    low = numpy.where(mask, colors, 255).min(axis=1)
+    high = numpy.where(mask, colors, 0).max(axis=1)
+
+    # If blue or red decreases as green increases, flip that axis
+    mean = numpy.where(mask, colors, 0).sum(axis=1) / numpy.maximum(counts, 1)[:, None]
+    centered = numpy.where(mask, colors - mean[:, None, :], 0)
+    covariance = (centered * centered[..., 1:2]).sum(axis=1)
+    flip = covariance < 0
+    flip[:, 1] = False
+    low, high = numpy.where(flip, high, low), numpy.where(flip, low, high)
+
+    inset = (high - low) >> 4
+    high -= inset
+    low += inset
+
+    # Fully transparent blocks just need the three-color mode
+    color0 = numpy.where(counts > 0, _packRGB565(high), 0)
+    color1 = numpy.where(counts > 0, _packRGB565(low), 0)
+    return _CMPROrderEndpoints(color0, color1, counts < 16)
+
+
+def _CMPRLeastSquares(colors, opaque, indices, color0, color1):
+    """
+    Returns the endpoint colors (unquantized, as BGR arrays) that best
+    fit every block's pixels, keeping the pixels' current palette
+    indices. Blocks that can't be solved keep their current endpoints.
+    """
+    # How much of each endpoint goes into each palette color
+    fourColor = (color0 > color1)[:, None]
+    weight0 = numpy.where(fourColor,
+        numpy.choose(indices, [1, 0, 5 / 8, 3 / 8]),
+        numpy.choose(indices, [1, 0, 1 / 2, 0]))
+    weight0 = numpy.where(opaque, weight0, 0)
+    weight1 = numpy.where(opaque & ((indices != 3) | fourColor), 1 - weight0, 0)
+
+    aa = (weight0 * weight0).sum(axis=1)
+    ab = (weight0 * weight1).sum(axis=1)
+    bb = (weight1 * weight1).sum(axis=1)
+    ax = (weight0[..., None] * colors).sum(axis=1)
+    bx = (weight1[..., None] * colors).sum(axis=1)
+
+    det = aa * bb - ab * ab
+    solvable = (numpy.abs(det) > 1e-6)[:, None]
+    det = numpy.where(solvable[:, 0], det, 1)[:, None]
+    bgr0 = (bb[:, None] * ax - ab[:, None] * bx) / det
+    bgr1 = (aa[:, None] * bx - ab[:, None] * ax) / det
+
+    bgr0 = numpy.where(solvable, bgr0, _expandRGB565(color0))
+    bgr1 = numpy.where(solvable, bgr1, _expandRGB565(color1))
+    return (numpy.clip(numpy.rint(bgr0), 0, 255).astype(numpy.int32),
+            numpy.clip(numpy.rint(bgr1), 0, 255).astype(numpy.int32))
+
+
+def _packCMPRBlocks(color0, color1, indices):
+    """
+    Returns encoded CMPR blocks as bytes
+    """
+    blocks = numpy.empty((len(color0), 8), dtype=numpy.uint8)
+    blocks[:, 0] = color0 >> 8
+    blocks[:, 1] = color0 & 0xFF
+    blocks[:, 2] = color1 >> 8
+    blocks[:, 3] = color1 & 0xFF
+    rows = indices.reshape(-1, 4, 4) << numpy.array([6, 4, 2, 0])
+    blocks[:, 4:] = rows.sum(axis=-1)
+    return blocks.tobytes()
+
+
+
+class CMPRDecoder(Decoder):
+    """
+    Decodes a CMPR texture
+    """
+    # Format: see backend_python.CMPRDecoder
+    bytesPerPixel = .5
+    threaded = True # all NumPy, so it doesn't hold the GIL for long
+
+    def run(self):
+        """
+        Runs the algorithm
+        """
+        tex, w, h = self.tex, self.size[0], self.size[1]
+
+        # (tileRows, tileColumns, 4 blocks, 8 bytes)
+        blocks = _tileBlocks(tex, w, h, 8, 8, 8, 4).astype(numpy.int32)
+
+        color0 = blocks[..., 0] << 8 | blocks[..., 1]
+        color1 = blocks[..., 2] << 8 | blocks[..., 3]
+        palette = _CMPRPalettes(color0, color1).astype(numpy.uint8)
+
+        # Unpack the 2-bit indices: (..., 4 rows, 4 columns)
+        indices = (blocks[..., 4:8, None] >> numpy.array([6, 4, 2, 0])) & 3
+
+        # Look up every pixel with one gather
+        flatPalette = palette.reshape(-1, 4, 4)
+        flatIndices = indices.reshape(flatPalette.shape[0], 16)
+        pixels = flatPalette[numpy.arange(flatPalette.shape[0])[:, None], flatIndices]
+
+        # (tileRows, tileColumns, blockRow, blockColumn, row, column, BGRA)
+        # -> (tileRows, tileColumns, 8, 8, BGRA)
+        tilesY, tilesX = blocks.shape[:2]
+        pixels = pixels.reshape(tilesY, tilesX, 2, 2, 4, 4, 4)
+        pixels = pixels.transpose(0, 1, 2, 4, 3, 5, 6).reshape(tilesY, tilesX, 8, 8, 4)
+
+        self.progress = 1
+        self.result = _untile(pixels, w, h)
+        return self.result
+
+
+class CMPREncoder(Encoder):
+    """
+    Encodes a CMPR texture, choosing endpoints with a range fit. This
+    gives the same result as backend_python.CMPREncoder.
+    """
+    bytesPerPixel = .5
+
+    def run(self):
+        """
+        Runs the algorithm
+        """
+        argb, w, h = self.argb, self.size[0], self.size[1]
+
+        colors, opaque = _CMPRBlockPixels(argb, w, h)
+        color0, color1 = self.fitEndpoints(colors, opaque)
+        indices, _ = _CMPRIndices(colors, opaque, color0, color1)
+
+        self.progress = 1
+        self.result = _packCMPRBlocks(color0, color1, indices)
+        return self.result
+
+    def fitEndpoints(self, colors, opaque):
+        """
+        Returns the endpoint colors to use for every block
+        """
+        return _CMPRRangeFit(colors, opaque)
+
+
+class CMPRHighQualityEncoder(CMPREncoder):
+    """
+    Encodes a CMPR texture, choosing endpoints with a cluster fit:
+    starting from the range fit, the pixels are repeatedly grouped by
+    their closest palette color, and the endpoints are moved to the
+    least-squares best fit for those groups. Opaque blocks try both the
+    four- and three-color modes. Slower, but noticeably better for
+    gradients and antialiased edges.
+    """
+    iterations = 8
+
+    def fitEndpoints(self, colors, opaque):
+        """
+        Returns the endpoint colors to use for every block
+        """
+        color0, color1 = _CMPRRangeFit(colors, opaque)
+        _, bestError = _CMPRIndices(colors, opaque, color0, color1)
+        hasTransparency = ~opaque.all(axis=1)
+
+        for threeColor in (False, True):
+            fit0, fit1 = _CMPROrderEndpoints(color0, color1, threeColor | hasTransparency)
+            indices, _ = _CMPRIndices(colors, opaque, fit0, fit1)
+            for i in range(self.iterations):
+                bgr0, bgr1 = _CMPRLeastSquares(colors, opaque, indices, fit0, fit1)
+                fit0, fit1 = _CMPROrderEndpoints(_packRGB565(bgr0), _packRGB565(bgr1), threeColor | hasTransparency)
+
+                indices, error = _CMPRIndices(colors, opaque, fit0, fit1)
+                better = error < bestError
+                color0 = numpy.where(better, fit0, color0)
+                color1 = numpy.where(better, fit1, color1)
+                bestError = numpy.where(better, error, bestError)
+
+        return color0, color1
+
+
+
+################################################################
+########################### Palettes ###########################
+
+def _TLUTColors(tlut, tlutFormat, numColors):
+    """
+    Returns the colors in palette (TLUT) data as an array of shape
+    (numColors, BGRA). Missing entries are transparent.
+    """
+    count = min(len(tlut) // 2, numColors)
+    entries = numpy.frombuffer(tlut, dtype='>u2', count=count).astype(numpy.int32)
+    colors = numpy.zeros((numColors, 4), dtype=numpy.uint8)
+    colors[:count] = _TLUTEntriesToBGRA(entries, tlutFormat)
+    return colors
+
+
+def _TLUTEntriesToBGRA(entries, tlutFormat):
+    """
+    Converts an array of palette entries to an array of BGRA colors,
+    with a new last axis. See backend_python.TLUTEntryToBGRA.
+    """
+    if tlutFormat == TLUT_IA8:
+        intensity = entries >> 8
+        return numpy.stack([intensity, intensity, intensity, entries & 0xFF], axis=-1)
+
+    elif tlutFormat == TLUT_RGB565:
+        return numpy.concatenate([_expandRGB565(entries), numpy.full(entries.shape + (1,), 0xFF)], axis=-1)
+
+    red5 = (entries >> 10) & 0x1F
+    green5 = (entries >> 5) & 0x1F
+    blue5 = entries & 0x1F
+    rgb555 = numpy.stack([
+        blue5 << 3 | blue5 >> 2,
+        green5 << 3 | green5 >> 2,
+        red5 << 3 | red5 >> 2,
+        numpy.full(entries.shape, 0xFF)], axis=-1)
+
+    alpha3 = (entries >> 12) & 7
+    rgb4a3 = numpy.stack([
+        (entries & 0xF) * 17,
+        ((entries >> 4) & 0xF) * 17,
+        ((entries >> 8) & 0xF) * 17,
+        (alpha3 << 5) | (alpha3 << 2) | (alpha3 >> 1)], axis=-1)
+
+    return numpy.where((entries & 0x8000 != 0)[..., None], rgb555, rgb4a3)
+
+
+def _BGRAToTLUTEntries(colors, tlutFormat):
+    """
+    Converts an array of BGRA colors (last axis) to an array of the
+    closest palette entries. See backend_python.BGRAToTLUTEntry.
+    """
+    blue, green, red, alpha = (colors[..., c].astype(numpy.int32) for c in range(4))
+
+    if tlutFormat == TLUT_IA8:
+        return ((red + green + blue) // 3) << 8 | alpha
+
+    elif tlutFormat == TLUT_RGB565:
+        return _packRGB565(colors[..., :3].astype(numpy.int32))
+
+    alpha3 = ((alpha + 18) << 1) // 73
+    rgb4a3 = (alpha3 << 12) | (((red + 8) // 17) << 8) | (((green + 8) // 17) << 4) | ((blue + 8) // 17)
+    rgb555 = 0x8000 | ((((red + 4) << 2) // 33) << 10) | ((((green + 4) << 2) // 33) << 5) | (((blue + 4) << 2) // 33)
+    return numpy.where(alpha < 238, rgb4a3, rgb555)
+
+
+def _medianCut(colors, counts, maxColors):
+    """
+    Groups colors (an array of shape (colors, channels)) into at most
+    maxColors boxes by repeatedly splitting the box with the widest
+    channel range (weighted by how many pixels it covers) at the
+    weighted median of that channel. Returns the box number of each
+    color.
+    """
+    def priority(box):
+        spread = colors[box].max(axis=0) - colors[box].min(axis=0)
+        return -int(spread.max()) * int(counts[box].sum()), int(spread.argmax())
+
+    boxes = []
+    heap = []
+    def addBox(box):
+        if len(box) > 1:
+            score, channel = priority(box)
+            if score:
+                heapq.heappush(heap, (score, len(boxes), channel))
+        boxes.append(box)
+
+    addBox(numpy.arange(len(colors)))
+    while heap and len(boxes) < maxColors:
+        _, i, channel = heapq.heappop(heap)
+        box = boxes[i]
+        box = box[numpy.argsort(colors[box, channel], kind='stable')]
+
+        cumulative = numpy.cumsum(counts[box])
+        split = int(numpy.searchsorted(cumulative, cumulative[-1] / 2))
+        split = min(max(split, 1), len(box) - 1)
+
+        boxes[i] = box[:split]
+        addBox(box[split:])
+        if len(boxes[i]) > 1:
+            score, channel = priority(boxes[i])
+            if score:
+                heapq.heappush(heap, (score, i, channel))
+
+    labels = numpy.empty(len(colors), dtype=numpy.int32)
+    for i, box in enumerate(boxes):
+        labels[box] = i
+    return labels
+
+
+class _PaletteDecoderMixin:
+    """
+    Vectorized run() for palette decoders: every pixel is looked up in
+    the palette with a single gather
+    """
+    threaded = True # all NumPy, so it doesn't hold the GIL for long
+    def run(self):
+        """
+        Runs the algorithm
+        """
+        tex, w, h = self.tex, self.size[0], self.size[1]
+        tileW, tileH = self.tileSize
+        tilesX = (w + tileW - 1) // tileW
+        tilesY = (h + tileH - 1) // tileH
+
+        colors = _TLUTColors(self.tlut, self.tlutFormat, 1 << self.indexBits)
+        indices = self.unpackIndices(tex, tilesX * tilesY * tileW * tileH)
+        pixels = colors[indices].reshape(tilesY, tilesX, tileH, tileW, 4)
+
+        self.progress = 1
+        self.result = _untile(pixels, w, h)
+        return self.result
+
+
+class _PaletteEncoderMixin:
+    """
+    Vectorized run() for palette encoders. Images with more distinct
+    colors than the format allows are reduced with a median cut.
+    """
+    def run(self):
+        """
+        Runs the algorithm
+        """
+        argb, w, h = self.argb, self.size[0], self.size[1]
+        tileW, tileH = self.tileSize
+        maxColors = 1 << self.indexBits
+
+        image = numpy.frombuffer(argb, dtype=numpy.uint8, count=w * h * 4).reshape(h, w, 4)
+        pixelEntries = _BGRAToTLUTEntries(image, self.tlutFormat).ravel()
+
+        # Number the distinct entries in the order they first appear,
+        # like the Python backend does
+        entries, firstSeen, inverse, counts = numpy.unique(pixelEntries,
+            return_index=True, return_inverse=True, return_counts=True)
+        order = numpy.argsort(firstSeen)
+        rank = numpy.empty_like(order)
+        rank[order] = numpy.arange(len(order))
+        entries, counts, inverse = entries[order], counts[order], rank[inverse]
+
+        if len(entries) > maxColors:
+            colors = _TLUTEntriesToBGRA(entries, self.tlutFormat).astype(numpy.float64)
+            labels = _medianCut(colors, counts, maxColors)
+            numBoxes = labels.max() + 1
+
+            # Each palette color is the pixel-weighted average of its box
+            weights = numpy.bincount(labels, weights=counts, minlength=numBoxes)
+            average = numpy.stack([
+                numpy.bincount(labels, weights=colors[:, c] * counts, minlength=numBoxes) / weights
+                for c in range(4)], axis=-1)
+            average = numpy.clip(numpy.rint(average), 0, 255).astype(numpy.uint8)
+
+            entries = _BGRAToTLUTEntries(average, self.tlutFormat)
+            inverse = labels[inverse]
+
+        # Lay the indices out in tiles; pixels outside the image use index 0
+        tilesX = (w + tileW - 1) // tileW
+        tilesY = (h + tileH - 1) // tileH
+        indices = numpy.zeros((tilesY * tileH, tilesX * tileW), dtype=numpy.int32)
+        indices[:h, :w] = inverse.reshape(h, w)
+        indices = indices.reshape(tilesY, tileH, tilesX, tileW).transpose(0, 2, 1, 3).ravel()
+
+        self.tlut = entries.astype('>u2').tobytes()
+        self.progress = 1
+        self.result = self.packIndices(indices)
+        return self.result
+
+
+class CI4Decoder(_PaletteDecoderMixin, PaletteDecoder):
+    """
+    Decodes a CI4 texture
+    """
+    # Format: see backend_python.CI4Decoder
+    bytesPerPixel = .5
+    indexBits = 4
+    tileSize = (8, 8)
+
+    def unpackIndices(self, tex, count):
+        """
+        Returns an array of count palette indices, in storage order
+        """
+        data = numpy.frombuffer(tex, dtype=numpy.uint8, count=count // 2)
+        return numpy.stack([data >> 4, data & 0xF], axis=-1).ravel()
+
+
+class CI4Encoder(_PaletteEncoderMixin, PaletteEncoder):
+    """
+    Encodes a CI4 texture
+    """
+    bytesPerPixel = .5
+    indexBits = 4
+    tileSize = (8, 8)
+
+    def packIndices(self, indices):
+        """
+        Returns an array of palette indices (in storage order) as bytes
+        """
+        return (indices[0::2] << 4 | indices[1::2]).astype(numpy.uint8).tobytes()
+
+
+class CI8Decoder(_PaletteDecoderMixin, PaletteDecoder):
+    """
+    Decodes a CI8 texture
+    """
+    # Format: see backend_python.CI8Decoder
+    bytesPerPixel = 1
+    indexBits = 8
+    tileSize = (8, 4)
+
+    def unpackIndices(self, tex, count):
+        """
+        Returns an array of count palette indices, in storage order
+        """
+        return numpy.frombuffer(tex, dtype=numpy.uint8, count=count)
+
+
+class CI8Encoder(_PaletteEncoderMixin, PaletteEncoder):
+    """
+    Encodes a CI8 texture
+    """
+    bytesPerPixel = 1
+    indexBits = 8
+    tileSize = (8, 4)
+
+    def packIndices(self, indices):
+        """
+        Returns an array of palette indices (in storage order) as bytes
+        """
+        return indices.astype(numpy.uint8).tobytes()
+
+
+class CI14x2Decoder(_PaletteDecoderMixin, PaletteDecoder):
+    """
+    Decodes a CI14x2 texture
+    """
+    # Format: see backend_python.CI14x2Decoder
+    bytesPerPixel = 2
+    indexBits = 14
+    tileSize = (4, 4)
+
+    def unpackIndices(self, tex, count):
+        """
+        Returns an array of count palette indices, in storage order
+        """
+        return numpy.frombuffer(tex, dtype='>u2', count=count) & 0x3FFF
+
+
+class CI14x2Encoder(_PaletteEncoderMixin, PaletteEncoder):
+    """
+    Encodes a CI14x2 texture
+    """
+    bytesPerPixel = 2
+    indexBits = 14
+    tileSize = (4, 4)
+
+    def packIndices(self, indices):
+        """
+        Returns an array of palette indices (in storage order) as bytes
+        """
+        return indices.astype('>u2').tobytes()
@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: latin-1 -*-
+
+# TPLLib - A Python library for decoding and encoding Nintendo image formats
+# Version 0.1
+# Copyright (C) 2009-2014 Tempus, RoadrunnerWMC
+
+# This file is part of TPLLib.
+
+# TPLLib is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# TPLLib is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with TPLLib.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# tpl.py
+# Reading and writing .tpl files (containers for any number of
+# textures, each with an optional palette)
+
+
+################################################################
+################################################################
+
+# TPL format (big-endian):
+#     u32 magic # 0x0020AF30
+#     u32 numImages
+#     u32 imageTableOffset # 0xC
+#
+# (address imageTableOffset)
+#     [entry: 8 bytes long]  -.
+#     [entry: 8 bytes long]   |---  numImages entries
+#     [entry: 8 bytes long]  -'
+#
+#     Entry
+#         u32 imageHeaderOffset
+#         u32 paletteHeaderOffset # 0 if there's no palette
+#
+#     Image header
+#         u16 height
+#         u16 width
+#         u32 format
+#         u32 dataOffset
+#         u32 wrapS
+#         u32 wrapT
+#         u32 minFilter
+#         u32 magFilter
+#         f32 lodBias
+#         u8 edgeLODEnable
+#         u8 minLOD
+#         u8 maxLOD # mipmaps follow the texture if this is nonzero
+#         u8 unpacked
+#
+#     Palette header
+#         u16 numEntries
+#         u8 unpacked
+#         u8 pad
+#         u32 paletteFormat # TLUT_IA8, TLUT_RGB565 or TLUT_RGB5A3
+#         u32 paletteDataOffset
+#
+# Texture and palette data are aligned to 0x20 bytes.
+
+import mmap
+import struct
+
+from . import (
+    I4, I8, IA4, IA8, RGB565, RGB4A3, RGBA8, CI4, CI8, CI14x2, CMPR,
+    PALETTE_FORMATS, TLUT_RGB5A3, decoder, encoder)
+
+
+MAGIC = b'\x00\x20\xAF\x30'
+DATA_ALIGNMENT = 0x20
+
+# Tile width, tile height and bits per pixel of each format
+TILE_SIZES = {
+    I4: (8, 8, 4),
+    I8: (8, 4, 8),
+    IA4: (8, 4, 8),
+    IA8: (4, 4, 16),
+    RGB565: (4, 4, 16),
+    RGB4A3: (4, 4, 16),
+    RGBA8: (4, 4, 32),
+    CI4: (8, 8, 4),
+    CI8: (8, 4, 8),
+    CI14x2: (4, 4, 16),
+    CMPR: (8, 8, 4),
+}
+
+
+def textureSize(format, width, height):
+    """
+    Returns the size of a texture's data (without mipmaps) in bytes
+    """
+    tileW, tileH, bits = TILE_SIZES[format]
+    tilesX = (width + tileW - 1) // tileW
+    tilesY = (height + tileH - 1) // tileH
+    return tilesX * tilesY * tileW * tileH * bits // 8
+
+
+
+class TPLImage():
+    """
+    One image in a TPL file. Its texture data isn't decoded until
+    decode() is called.
+    """
+    def __init__(self, width, height, format, data, palette=None, paletteFormat=TLUT_RGB5A3):
+        """
+        Initializes the image
+        """
+        self.width = width
+        self.height = height
+        self.format = format
+        self.data = data
+        self.palette = palette
+        self.paletteFormat = paletteFormat
+
+        self.wrapS = self.wrapT = 0
+        self.minFilter = self.magFilter = 1
+        self.lodBias = 0.0
+        self.edgeLODEnable = self.minLOD = self.maxLOD = self.unpacked = 0
+
+    @classmethod
+    def fromARGB(cls, argb, width, height, format, paletteFormat=TLUT_RGB5A3, highQuality=False, updater=None):
+        """
+        Creates an image by encoding BGRA pixel data (as used by the
+        decoders and encoders) in the given format
+        """
+        enc = encoder(format, highQuality)
+        if format in PALETTE_FORMATS:
+            enc = enc(argb, width, height, updater, tlutFormat=paletteFormat)
+        else:
+            enc = enc(argb, width, height, updater)
+
+        data = enc.run()
+        return cls(width, height, format, data, getattr(enc, 'tlut', None), paletteFormat)
+
+    def decode(self, updater=None):
+        """
+        Decodes the texture and returns its BGRA pixel data
+        """
+        dec = decoder(self.format)
+        if self.format in PALETTE_FORMATS:
+            dec = dec(self.data, self.width, self.height, updater, tlut=self.palette or b'', tlutFormat=self.paletteFormat)
+        else:
+            dec = dec(self.data, self.width, self.height, updater)
+        return dec.run()
+
+
+
+class TPL():
+    """
+    A TPL file. Creating one only reads the image and palette headers;
+    each image's data is a zero-copy slice of the file data.
+    """
+    def __init__(self, data=None):
+        """
+        Initializes the TPL, from data (any bytes-like object) if given
+        """
+        self.images = []
+        if data is not None:
+            self._initFromData(memoryview(data))
+
+    def _initFromData(self, data):
+        """
+        Reads the image and palette headers
+        """
+        magic, numImages, imageTableOffset = struct.unpack_from('>4sII', data, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a TPL file (magic: %s)' % repr(magic))
+
+        for i in range(numImages):
+            imageHeaderOffset, paletteHeaderOffset = struct.unpack_from('>II', data, imageTableOffset + i * 8)
+
+            (height, width, format, dataOffset, wrapS, wrapT, minFilter, magFilter,
+                lodBias, edgeLODEnable, minLOD, maxLOD, unpacked) = struct.unpack_from('>HHIIIIIIfBBBB', data, imageHeaderOffset)
+            if format not in TILE_SIZES:
+                raise ValueError('Image %d has an unrecognized format (%d)' % (i, format))
+
+            palette = None
+            paletteFormat = TLUT_RGB5A3
+            if paletteHeaderOffset:
+                numEntries, _, _, paletteFormat, paletteDataOffset = struct.unpack_from('>HBBII', data, paletteHeaderOffset)
+                palette = data[paletteDataOffset : paletteDataOffset + numEntries * 2]
+
+            image = TPLImage(width, height, format,
+                data[dataOffset : dataOffset + textureSize(format, width, height)],
+                palette, paletteFormat)
+            image.wrapS, image.wrapT = wrapS, wrapT
+            image.minFilter, image.magFilter = minFilter, magFilter
+            image.lodBias = lodBias
+            image.edgeLODEnable, image.minLOD, image.maxLOD, image.unpacked = edgeLODEnable, minLOD, maxLOD, unpacked
+            self.images.append(image)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Opens a TPL file by mapping it into memory, so that only the
+        parts that are actually used are read from disk
+        """
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def save(self):
+        """
+        Returns the TPL file as bytes. Mipmaps aren't kept, so every
+        image is written with maxLOD 0.
+        """
+        numImages = len(self.images)
+        imageTableOffset = 0xC
+
+        # Headers first, then all the data
+        headerOffsets = []
+        pos = imageTableOffset + numImages * 8
+        for image in self.images:
+            imageHeaderOffset = pos
+            pos += 0x24
+            paletteHeaderOffset = 0
+            if image.palette is not None:
+                paletteHeaderOffset = pos
+                pos += 0xC
+            headerOffsets.append((imageHeaderOffset, paletteHeaderOffset))
+
+        pieces = []
+        def place(data):
+            nonlocal pos
+            pos = (pos + DATA_ALIGNMENT - 1) & ~(DATA_ALIGNMENT - 1)
+            pieces.append((pos, data))
+            pos += len(data)
+            return pieces[-1][0]
+
+        out = bytearray(MAGIC)
+        out.extend(struct.pack('>II', numImages, imageTableOffset))
+        for imageHeaderOffset, paletteHeaderOffset in headerOffsets:
+            out.extend(struct.pack('>II', imageHeaderOffset, paletteHeaderOffset))
+
+        for image, (imageHeaderOffset, paletteHeaderOffset) in zip(self.images, headerOffsets):
+            size = textureSize(image.format, image.width, image.height)
+            data = bytes(image.data[:size])
+            data += bytes(size - len(data))
+
+            out.extend(struct.pack('>HHIIIIIIfBBBB',
+                image.height, image.width, image.format, place(data),
+                image.wrapS, image.wrapT, image.minFilter, image.magFilter,
+                image.lodBias, image.edgeLODEnable, image.minLOD, 0, image.unpacked))
+
+            if paletteHeaderOffset:
+                out.extend(struct.pack('>HBBII',
+                    len(image.palette) // 2, 0, 0, image.paletteFormat, place(bytes(image.palette))))
+
+        for offset, data in pieces:
+            out.extend(bytes(offset - len(out)))
+            out.extend(data)
+
+        return bytes(out)
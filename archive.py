@@ -0,0 +1,232 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# archive.py
+# U8 (.arc) archive support
+
+# U8 format:
+#     u32 magic # 0x55AA382D
+#     u32 firstNodeOffset # 0x20
+#     u32 nodeTableLen # including the string table
+#     u32 dataOffset
+#     16 bytes reserved
+#
+# (address firstNodeOffset)
+#     [node: 12 bytes long]  -.
+#     [node: 12 bytes long]   |---  root.size nodes, root first
+#     [node: 12 bytes long]  -'
+#     [string table: null-terminated names]
+#
+#     Node
+#         u8 type # 0 = file, 1 = directory
+#         u24 nameOffset # into the string table
+#         u32 dataOffset # file: absolute offset; directory: parent index
+#         u32 size # file: length; directory: index of the first node
+#                  # that isn't inside it
+
+
+
+import io
+import mmap
+import os
+import struct
+
+
+MAGIC = b'\x55\xAA\x38\x2D'
+DATA_ALIGNMENT = 0x20
+
+
+def isU8(data):
+    """
+    Return True if data (bytes-like) is a U8 archive
+    """
+    return bytes(data[:4]) == MAGIC
+
+
+class U8:
+    """
+    Class that represents a U8 archive. Only the node table is read when
+    it's created; files are returned as zero-copy slices of the archive
+    data.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.replacements = {}
+
+        magic, firstNodeOffset, nodeTableLen, dataOffset = struct.unpack_from('>4s3I', self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a U8 archive (magic: %s)' % repr(magic))
+        self.firstNodeOffset = firstNodeOffset
+        self.nodeTableLen = nodeTableLen
+        self.dataOffset = dataOffset
+
+        numNodes = struct.unpack_from('>I', self.data, firstNodeOffset + 8)[0]
+        stringsOffset = firstNodeOffset + numNodes * 12
+
+        # Walk the node table, keeping track of which directories we're in
+        self.files = {} # path -> node index
+        self.nodes = [] # (type, dataOffset, size) for each node
+        dirs = [(numNodes, '')] # (end index, path prefix)
+        for i in range(numNodes):
+            typeAndName, offset, size = struct.unpack_from('>3I', self.data, firstNodeOffset + i * 12)
+            type = typeAndName >> 24
+            self.nodes.append((type, offset, size))
+            if i == 0: continue
+
+            while i >= dirs[-1][0]:
+                dirs.pop()
+
+            nameStart = stringsOffset + (typeAndName & 0xFFFFFF)
+            nameEnd = nameStart
+            while self.data[nameEnd]:
+                nameEnd += 1
+            path = dirs[-1][1] + bytes(self.data[nameStart:nameEnd]).decode('latin-1')
+
+            if type == 1:
+                dirs.append((size, path + '/'))
+            else:
+                self.files[path] = i
+
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open a U8 archive file by mapping it into memory, so that only
+        the parts that are actually used are read from disk
+        """
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+    def names(self):
+        """
+        Return the paths of all files in the archive, in node order
+        """
+        return list(self.files)
+
+
+    def getFile(self, path):
+        """
+        Return the data of a file in the archive. Unless it's been
+        replaced, this is a memoryview into the archive data.
+        """
+        if path in self.replacements:
+            return self.replacements[path]
+
+        type, offset, size = self.nodes[self.files[path]]
+        return self.data[offset : offset + size]
+
+
+    def replaceFile(self, path, data):
+        """
+        Replace the data of a file in the archive. The archive data
+        itself isn't changed until it's written with write() or save().
+        """
+        if path not in self.files:
+            raise KeyError(path)
+        self.replacements[path] = data
+
+
+    def write(self, f):
+        """
+        Write the archive, with any replaced files, to a file object.
+        Only the node table is modified; file data is written straight
+        from the original archive data.
+        """
+        nodeTable = bytearray(self.data[self.firstNodeOffset : self.firstNodeOffset + self.nodeTableLen])
+
+        # Lay files out in their original order, aligned like Nintendo's
+        fileIndices = sorted(self.files.values(), key=lambda i: self.nodes[i][1])
+        pathsByIndex = {i: path for path, i in self.files.items()}
+
+        pieces = []
+        pos = self.dataOffset
+        for i in fileIndices:
+            pos = (pos + DATA_ALIGNMENT - 1) & ~(DATA_ALIGNMENT - 1)
+            data = self.getFile(pathsByIndex[i])
+            struct.pack_into('>II', nodeTable, i * 12 + 4, pos, len(data))
+            pieces.append((pos, data))
+            pos += len(data)
+
+        header = bytes(self.data[:self.firstNodeOffset])
+        f.write(header)
+        f.write(nodeTable)
+        pos = len(header) + len(nodeTable)
+
+        for offset, data in pieces:
+            f.write(b'\0' * (offset - pos))
+            f.write(data)
+            pos = offset + len(data)
+
+
+    def writeFile(self, path):
+        """
+        Write the archive, with any replaced files, to a file. It's
+        written to a temporary file first, which then replaces the
+        original. If the archive is mapped from a file, the mapping is
+        closed before that (Windows can't replace a mapped file), and
+        the archive is then reloaded from the file it was written to.
+        """
+        tempPath = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tempPath, 'wb') as f:
+                self.write(f)
+            self._closeMapping()
+            os.replace(tempPath, path)
+        except BaseException:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+
+        with open(path, 'rb') as f:
+            self.__init__(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+    def _closeMapping(self):
+        """
+        Close the memory map the archive data comes from, if there is
+        one. Everything the archive needs must already have been written
+        out, since the data can't be used afterwards. Raises BufferError
+        (and leaves the archive usable) if something else still holds
+        a view into the mapping.
+        """
+        mapping = self.data.obj
+        if not isinstance(mapping, mmap.mmap):
+            return
+        self.data.release()
+        try:
+            mapping.close()
+        except BufferError:
+            self.data = memoryview(mapping)
+            raise
+
+
+    def save(self):
+        """
+        Return the archive, with any replaced files, as bytes
+        """
+        f = io.BytesIO()
+        self.write(f)
+        return f.getvalue()
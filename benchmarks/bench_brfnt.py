@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# bench_brfnt.py
+# End-to-end benchmark for loading and saving fonts, using synthetic
+# fonts. Each phase is timed separately:
+#     load: parse (headers, CWDH and creating glyphs), decode, slice, cmap
+#     save: paint, encode, cmap, write (assembling the blocks)
+#
+#     python benchmarks/bench_brfnt.py                     # default scenarios
+#     python benchmarks/bench_brfnt.py --glyphs 20000 --cmap sparse
+
+
+
+import argparse
+import os
+import sys
+import time
+
+import benchcommon
+import synthfont
+
+
+DEFAULT_BASELINE = os.path.join(benchcommon.BENCH_DIR, 'brfnt_baseline.json')
+
+# name: (glyphs, cell width, cell height, format, CMAP mix)
+SCENARIOS = {
+    'latin': (256, 16, 20, 'IA4', 'mixed'),
+    'cjk': (7000, 24, 26, 'I4', 'cjk'),
+}
+
+# (method, phase, whether the method is a generator)
+LOAD_PHASES = [
+    ('_decodeSheet', 'decode', False),
+    ('_sliceSheet', 'slice', False),
+    ('_parseCMAP', 'cmap', False),
+]
+SAVE_PHASES = [
+    ('_paintSheet', 'paint', False),
+    ('encodeSheet', 'encode', False),
+    ('_createCmapBlocks', 'cmap', True),
+]
+
+
+def timeLoad(BRFNT, data):
+    """
+    Load a font and return ({phase: seconds}, the font)
+    """
+    timer = benchcommon.PhaseTimer()
+    with timer.timing(BRFNT, LOAD_PHASES):
+        start = time.perf_counter()
+        font = BRFNT(data)
+        total = time.perf_counter() - start
+
+    times = dict(timer.times)
+    times['parse'] = total - sum(times.values())
+    times['total'] = total
+    return times, font
+
+
+def timeSave(BRFNT, font):
+    """
+    Save a font and return ({phase: seconds}, the data)
+    """
+    timer = benchcommon.PhaseTimer()
+    with timer.timing(BRFNT, SAVE_PHASES):
+        start = time.perf_counter()
+        data = font.save()
+        total = time.perf_counter() - start
+
+    times = dict(timer.times)
+    times['write'] = total - sum(times.values())
+    times['total'] = total
+    return times, data
+
+
+def runScenario(name, font, repeat):
+    """
+    Save a synthetic font, then load and save it again repeat times.
+    Return {name/load|save/phase: {'seconds': best time}}.
+    """
+    import BRFNTify
+
+    data = bytes(font.save())
+    best = {}
+    for i in range(repeat):
+        loadTimes, loaded = timeLoad(BRFNTify.BRFNT, data)
+        saveTimes, _ = timeSave(BRFNTify.BRFNT, loaded)
+        for op, times in (('load', loadTimes), ('save', saveTimes)):
+            for phase, seconds in times.items():
+                key = '%s/%s/%s' % (name, op, phase)
+                best[key] = min(best.get(key, seconds), seconds)
+
+    info = '%s: %d glyphs, %d sheets, %d bytes' % (name, len(font.glyphs),
+        -(-len(font.glyphs) // (font.charsPerRow * font.charsPerColumn)), len(data))
+    print(info)
+    for key, seconds in best.items():
+        print('  %-30s %9.1f ms' % (key, seconds * 1000))
+    sys.stdout.flush()
+
+    return {key: {'seconds': seconds} for key, seconds in best.items()}
+
+
+def main(argv=None):
+    """
+    Command-line entry point
+    """
+    parser = argparse.ArgumentParser(description='Benchmark loading and saving synthetic fonts, phase by phase.')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS),
+        help='built-in scenarios to run (default: all): ' + '; '.join(
+            '%s: %d glyphs, %dx%d, %s, %s CMAP' % ((n,) + s) for n, s in sorted(SCENARIOS.items())))
+    parser.add_argument('--custom', action='store_true',
+        help='run one scenario described by the options below, instead of the built-in ones')
+    synthfont.addFontArguments(parser)
+    parser.add_argument('--repeat', type=int, default=3,
+        help='times to load and save each font; the best time is kept (default: 3)')
+    benchcommon.addBaselineArguments(parser, DEFAULT_BASELINE)
+    args = parser.parse_args(argv)
+
+    app = benchcommon.initHeadless()
+
+    results = {}
+    if args.custom:
+        name = 'custom-%d-%dx%d-%s-%s' % (args.glyphs, args.cell[0], args.cell[1], args.format, args.cmap)
+        results.update(runScenario(name, synthfont.fontFromArguments(args), args.repeat))
+    else:
+        for name in args.scenarios:
+            glyphs, cellWidth, cellHeight, format, cmap = SCENARIOS[name]
+            args.glyphs, args.cell, args.format, args.cmap = glyphs, [cellWidth, cellHeight], format, cmap
+            results.update(runScenario(name, synthfont.fontFromArguments(args), args.repeat))
+
+    if args.save_baseline:
+        benchcommon.saveResults(args.baseline, results, repeat=args.repeat)
+        print('Saved baseline to %s' % args.baseline)
+        return 0
+
+    baseline = benchcommon.loadBaseline(args.baseline)
+    if baseline is None:
+        print('No baseline at %s; run with --save-baseline to create one.' % args.baseline)
+        return 0
+
+    regressions = benchcommon.compareToBaseline(results, baseline, 'seconds', args.threshold, higherIsBetter=False)
+    return benchcommon.printRegressions(regressions, 'time', args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
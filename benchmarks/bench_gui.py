@@ -0,0 +1,227 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# bench_gui.py
+# Interaction benchmark for the editor window, run headless. Opens a
+# large synthetic font through File > Open, then resizes and zooms the
+# view, scrolls through every glyph, toggles the overlays and types into
+# the text preview, repainting after each step. Reports the latency of
+# each kind of action (mean, 95th percentile and worst), and exits with
+# status 1 if any got slower than the baseline past a threshold.
+#
+#     python benchmarks/bench_gui.py                     # 7000 glyphs
+#     python benchmarks/bench_gui.py --glyphs 20000 --save-baseline
+
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import benchcommon
+import synthfont
+
+
+DEFAULT_BASELINE = os.path.join(benchcommon.BENCH_DIR, 'gui_baseline.json')
+
+# Window sizes to resize to, in order
+WINDOW_SIZES = [(1280, 800), (800, 600), (1920, 1080), (640, 480), (1280, 800)]
+
+# Overlays, by action name
+OVERLAYS = ['leading', 'ascent', 'baseLine', 'widths']
+
+# Typed into the text preview, one keystroke at a time
+PREVIEW_TEXT = 'The quick brown fox jumps over the lazy dog.\n0123456789 !?"#$%&\'()*+,-./:;<=>@[]^_`{|}~\n'
+
+
+class LatencyRecorder():
+    """
+    Collects how long each action took, grouped by action name
+    """
+    def __init__(self, app, view):
+        self.app = app
+        self.view = view
+        self.latencies = {}
+
+    def record(self, action, func, *args):
+        """
+        Call func(*args), let Qt handle the events it caused, and
+        repaint the view; record the total time as one sample of action
+        """
+        start = time.perf_counter()
+        func(*args)
+        self.app.processEvents()
+        self.view.viewport().repaint()
+        self.latencies.setdefault(action, []).append(time.perf_counter() - start)
+
+    def summary(self):
+        """
+        Return {action: {'count', 'meanMs', 'p95Ms', 'maxMs'}}
+        """
+        summary = {}
+        for action, samples in self.latencies.items():
+            samples = sorted(samples)
+            summary[action] = {
+                'count': len(samples),
+                'meanMs': sum(samples) / len(samples) * 1000,
+                'p95Ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+                'maxMs': samples[-1] * 1000,
+            }
+        return summary
+
+
+def openFont(window, path):
+    """
+    Open a font with File > Open, answering the file dialog with path.
+    Errors are raised instead of being shown in a dialog.
+    """
+    from PyQt5 import QtWidgets
+
+    def showErrorBox(caption):
+        raise
+
+    getOpenFileName = QtWidgets.QFileDialog.getOpenFileName
+    QtWidgets.QFileDialog.getOpenFileName = lambda *args, **kwargs: (path, '')
+    window.ShowErrorBox = showErrorBox
+    try:
+        window.HandleOpen()
+    finally:
+        QtWidgets.QFileDialog.getOpenFileName = getOpenFileName
+        del window.ShowErrorBox
+
+
+def scrollThrough(recorder, action, step):
+    """
+    Scroll from the top of the glyph grid to the bottom, step pixels
+    per frame
+    """
+    scrollBar = recorder.view.verticalScrollBar()
+    scrollBar.setValue(0)
+    while scrollBar.value() < scrollBar.maximum():
+        recorder.record(action, scrollBar.setValue, scrollBar.value() + step)
+
+
+def run(args, path):
+    """
+    Run the interactions on the font at path and return the recorder
+    """
+    import BRFNTify
+
+    app = benchcommon.initHeadless()
+    window = BRFNTify.Window()
+    window.resize(*WINDOW_SIZES[0])
+    window.show()
+    app.processEvents()
+
+    recorder = LatencyRecorder(app, window.view)
+
+    # Opening, with the time spent parsing the file split off so that
+    # populating the scene can be told apart
+    for i in range(args.repeat):
+        timer = benchcommon.PhaseTimer()
+        with timer.timing(BRFNTify.BRFNT, [('__init__', 'parse', False)]):
+            recorder.record('open', openFont, window, path)
+        recorder.latencies.setdefault('open-parse', []).append(timer.times['parse'])
+        recorder.latencies.setdefault('open-populate', []).append(recorder.latencies['open'][-1] - timer.times['parse'])
+
+    # Resizing
+    for i in range(args.repeat):
+        for size in WINDOW_SIZES:
+            recorder.record('resize', window.resize, *size)
+    recorder.record('relayout', window.view.updateLayout, True)
+
+    # Zooming all the way out, all the way in, and back to 100%
+    zoomSteps = len(window.zoomLevels)
+    for i in range(zoomSteps):
+        recorder.record('zoom', window.HandleZoom, '-')
+    for i in range(zoomSteps):
+        recorder.record('zoom', window.HandleZoom, '+')
+    recorder.record('zoom', window.HandleZoom, '%')
+
+    # Scrolling, without overlays and then with all of them
+    scrollThrough(recorder, 'scroll', args.scroll_step)
+    for name in OVERLAYS:
+        recorder.record('overlay-toggle', window.actions[name].trigger)
+    scrollThrough(recorder, 'scroll-overlays', args.scroll_step)
+    for name in OVERLAYS:
+        recorder.record('overlay-toggle', window.actions[name].trigger)
+
+    # Typing into the text preview
+    window.prevDock.setVisible(True)
+    app.processEvents()
+    textEdit = window.prevDock.textEdit
+    textEdit.clear()
+    for char in PREVIEW_TEXT * args.repeat:
+        recorder.record('preview-keystroke', textEdit.insertPlainText, char)
+
+    window.close()
+    return recorder
+
+
+def main(argv=None):
+    """
+    Command-line entry point
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the editor window with a synthetic font.')
+    synthfont.addFontArguments(parser)
+    parser.add_argument('--scroll-step', type=int, default=60,
+        help='pixels to scroll per frame (default: 60)')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='times to open the font, go through the window sizes and type the preview text (default: 3)')
+    benchcommon.addBaselineArguments(parser, DEFAULT_BASELINE)
+    args = parser.parse_args(argv)
+
+    app = benchcommon.initHeadless()
+
+    fd, path = tempfile.mkstemp(suffix='.brfnt')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(synthfont.fontFromArguments(args).save())
+        results = run(args, path).summary()
+    finally:
+        os.remove(path)
+
+    print('%d glyphs, %dx%d, %s' % (args.glyphs, args.cell[0], args.cell[1], args.format))
+    print('  %-20s %6s %10s %10s %10s' % ('action', 'count', 'mean ms', 'p95 ms', 'max ms'))
+    for action, result in sorted(results.items()):
+        print('  %-20s %6d %10.2f %10.2f %10.2f' % (action, result['count'], result['meanMs'], result['p95Ms'], result['maxMs']))
+
+    if args.save_baseline:
+        benchcommon.saveResults(args.baseline, results, glyphs=args.glyphs, cell=args.cell, format=args.format)
+        print('Saved baseline to %s' % args.baseline)
+        return 0
+
+    baseline = benchcommon.loadBaseline(args.baseline)
+    if baseline is None:
+        print('No baseline at %s; run with --save-baseline to create one.' % args.baseline)
+        return 0
+
+    regressions = benchcommon.compareToBaseline(results, baseline, 'meanMs', args.threshold, higherIsBetter=False)
+    return benchcommon.printRegressions(regressions, 'latency', args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# bench_memory.py
+# Peak memory benchmark for loading and saving large synthetic fonts.
+# For each, reports the peak growth of the whole process's resident
+# memory (which includes Qt's image buffers), and for loading, the
+# estimated memory the loaded font keeps (see memory.py). With
+# --tracemalloc (which is much slower), the peak of Python's own
+# allocations is reported too. Exits with status 1 if a peak grew past
+# a threshold compared to the baseline. Each measurement runs in a new
+# process, so memory freed by earlier ones doesn't hide new allocations.
+#
+#     python benchmarks/bench_memory.py                  # run and compare
+#     python benchmarks/bench_memory.py --save-baseline  # run and store
+
+
+
+import argparse
+import concurrent.futures
+import gc
+import multiprocessing
+import os
+import sys
+
+import benchcommon
+import synthfont
+
+import TPLLib
+
+
+DEFAULT_BASELINE = os.path.join(benchcommon.BENCH_DIR, 'memory_baseline.json')
+
+# name: (glyphs, cell width, cell height, format, CMAP mix)
+SCENARIOS = {
+    'cjk': (7000, 24, 26, 'I4', 'cjk'),
+    'cjk-rgb4a3': (7000, 24, 26, 'RGB4A3', 'cjk'),
+    'huge': (20000, 24, 26, 'I4', 'sparse'),
+}
+
+
+def measure(func, tracePython):
+    """
+    Measure func's peak memory use and return a result dict. Python's
+    allocations are traced if tracePython is True, or if the process's
+    memory use can't be measured.
+    """
+    result = {}
+
+    gc.collect()
+    rss = benchcommon.peakRSSGrowth(func)
+    if rss is not None:
+        result['rssPeakKB'] = rss / 1024
+
+    if tracePython or rss is None:
+        gc.collect()
+        result['peakKB'] = benchcommon.peakMemory(func) / 1024
+
+    return result
+
+
+def measureOperation(op, data, tracePython):
+    """
+    Measure loading data as a font (op = 'load') or saving it once it's
+    loaded (op = 'save'), in this process, and return a result dict
+    """
+    app = benchcommon.initHeadless()
+    import BRFNTify
+    import memory
+
+    if op == 'load':
+        result = measure(lambda: BRFNTify.BRFNT(data), tracePython)
+        result['retainedKB'] = sum(memory.fontUsage(BRFNTify.BRFNT(data)).values()) / 1024
+    else:
+        font = BRFNTify.BRFNT(data)
+        result = measure(font.save, tracePython)
+    return result
+
+
+def runScenario(name, font, tracePython):
+    """
+    Save a synthetic font, then measure loading it and saving it again,
+    each in a new process. Return {name/load|save: {metric: value}}.
+    """
+    data = bytes(font.save())
+    numGlyphs = len(font.glyphs)
+
+    results = {}
+    for op in ('load', 'save'):
+        with concurrent.futures.ProcessPoolExecutor(1, multiprocessing.get_context('spawn')) as pool:
+            results[name + '/' + op] = pool.submit(measureOperation, op, data, tracePython).result()
+
+    print('%s: %d glyphs, %d bytes' % (name, numGlyphs, len(data)))
+    for key, result in results.items():
+        print('  %-20s %14s process peak growth %14s Python peak' % (key,
+            '%.1f KB' % result['rssPeakKB'] if 'rssPeakKB' in result else '-',
+            '%.1f KB' % result['peakKB'] if 'peakKB' in result else '-'))
+    sys.stdout.flush()
+
+    return results
+
+
+def main(argv=None):
+    """
+    Command-line entry point
+    """
+    parser = argparse.ArgumentParser(description='Benchmark peak memory use while loading and saving large synthetic fonts.')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS),
+        help='scenarios to run (default: all): ' + '; '.join(
+            '%s: %d glyphs, %dx%d, %s, %s CMAP' % ((n,) + s) for n, s in sorted(SCENARIOS.items())))
+    parser.add_argument('--tracemalloc', action='store_true',
+        help="also measure the peak of Python's own allocations (much slower)")
+    benchcommon.addBaselineArguments(parser, DEFAULT_BASELINE)
+    args = parser.parse_args(argv)
+
+    app = benchcommon.initHeadless()
+
+    results = {}
+    formats = {name: format for format, name in TPLLib.FORMAT_NAMES.items()}
+    for name in args.scenarios:
+        glyphs, cellWidth, cellHeight, format, cmap = SCENARIOS[name]
+        font = synthfont.makeFont(glyphs, cellWidth, cellHeight, formats[format], cmap)
+        results.update(runScenario(name, font, args.tracemalloc))
+
+    if args.save_baseline:
+        benchcommon.saveResults(args.baseline, results)
+        print('Saved baseline to %s' % args.baseline)
+        return 0
+
+    baseline = benchcommon.loadBaseline(args.baseline)
+    if baseline is None:
+        print('No baseline at %s; run with --save-baseline to create one.' % args.baseline)
+        return 0
+
+    status = 0
+    for metric, description in (('rssPeakKB', 'process peak memory'), ('peakKB', 'Python peak memory')):
+        regressions = benchcommon.compareToBaseline(results, baseline, metric, args.threshold, higherIsBetter=False)
+        status |= benchcommon.printRegressions(regressions, description, args.threshold)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
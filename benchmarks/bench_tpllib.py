@@ -0,0 +1,211 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# bench_tpllib.py
+# Throughput benchmark for TPLLib's decoders and encoders: every
+# format, backend and texture size, on noise and on glyph-like images.
+# Reports megapixels per second and peak memory, and exits with status
+# 1 if throughput dropped past a threshold compared to the baseline.
+#
+#     python benchmarks/bench_tpllib.py                  # run and compare
+#     python benchmarks/bench_tpllib.py --save-baseline  # run and store
+
+
+
+import argparse
+import math
+import os
+import random
+import sys
+
+import benchcommon
+
+import TPLLib
+from TPLLib.tpl import textureSize
+
+
+DEFAULT_BASELINE = os.path.join(benchcommon.BENCH_DIR, 'tpllib_baseline.json')
+DEFAULT_SIZES = [64, 128, 256, 512, 1024]
+CONTENTS = ['noise', 'glyphs']
+
+
+def noiseImage(size, seed=0):
+    """
+    Return BGRA pixel data of random colors with a mix of opaque,
+    transparent and partly transparent pixels
+    """
+    rand = random.Random(seed)
+    pixels = bytearray(rand.getrandbits(8) for i in range(size * size * 4))
+    alphas = (0, 0xFF, 0xFF, 0x80)
+    for i in range(3, len(pixels), 4):
+        pixels[i] = alphas[pixels[i] & 3]
+    return bytes(pixels)
+
+
+def glyphImage(size, cell=32):
+    """
+    Return BGRA pixel data that looks like a texture sheet: white,
+    antialiased rings and strokes in a grid of cells, on a transparent
+    background
+    """
+    # Draw a few different cells, then tile them
+    cells = []
+    for shape in range(4):
+        rows = []
+        for y in range(cell):
+            row = bytearray()
+            for x in range(cell):
+                dx, dy = x - cell / 2 + 0.5, y - cell / 2 + 0.5
+                if shape == 0: # ring
+                    dist = abs(math.hypot(dx, dy) - cell * 0.3) - 1.5
+                elif shape == 1: # vertical stroke
+                    dist = abs(dx) - 2
+                elif shape == 2: # diagonal stroke
+                    dist = abs(dx - dy) / math.sqrt(2) - 1.5
+                else: # cross
+                    dist = min(abs(dx), abs(dy)) - 1.5
+                alpha = max(0, min(255, int((0.5 - dist) * 255)))
+                row.extend((alpha, alpha, alpha, alpha)) # premultiplied white
+            rows.append(bytes(row))
+        cells.append(rows)
+
+    image = bytearray()
+    for y in range(size):
+        row = bytearray()
+        for x in range(0, size, cell):
+            row.extend(cells[(x // cell + y // cell) % 4][y % cell][:(size - x) * 4])
+        image.extend(row)
+    return bytes(image)
+
+
+def makeCodec(codec, argb, size, tex=None, tlut=None):
+    """
+    Return an instance of a codec that's ready to run()
+    """
+    if codec.kind == 'decoder':
+        if codec.format in TPLLib.PALETTE_FORMATS:
+            return codec.cls(tex, size, size, tlut=tlut, tlutFormat=TPLLib.TLUT_RGB5A3)
+        return codec.cls(tex, size, size)
+
+    if codec.format in TPLLib.PALETTE_FORMATS:
+        return codec.cls(argb, size, size, tlutFormat=TPLLib.TLUT_RGB5A3)
+    return codec.cls(argb, size, size)
+
+
+def encodeForDecoding(format, argb, size):
+    """
+    Encode an image with the default encoder for the format, to get
+    realistic input for the decoders. Return (texture data, palette).
+    """
+    encoder = makeCodec(TPLLib.findCodec('encoder', format), argb, size)
+    tex = encoder.run()
+    tex += bytes(textureSize(format, size, size) - len(tex))
+    return tex, getattr(encoder, 'tlut', None)
+
+
+def run(args):
+    """
+    Run the benchmarks and return {name: {metric: value}}
+    """
+    results = {}
+    for size in args.sizes:
+        images = {'noise': noiseImage(size), 'glyphs': glyphImage(size)}
+
+        for format, formatName in sorted(TPLLib.FORMAT_NAMES.items()):
+            if args.formats and formatName not in args.formats:
+                continue
+
+            for content in args.contents:
+                argb = images[content]
+                tex = tlut = None
+
+                for kind in args.kinds:
+                    for codec in TPLLib.codecs.get((kind, format), ()):
+                        if args.backends and codec.backend not in args.backends:
+                            continue
+
+                        kindName = 'hq-encoder' if codec.highQuality else kind
+                        name = '%s/%s/%s/%d/%s' % (kindName, formatName, codec.backend, size, content)
+
+                        try:
+                            if kind == 'decoder' and tex is None:
+                                tex, tlut = encodeForDecoding(format, argb, size)
+                            makeCodec(codec, argb, size, tex, tlut).run()
+                        except ValueError as e:
+                            # e.g. input the codec doesn't support
+                            print('%-45s skipped: %s' % (name, e))
+                            continue
+
+                        seconds = benchcommon.bestTime(lambda: makeCodec(codec, argb, size, tex, tlut).run(), args.min_time)
+                        peak = benchcommon.peakMemory(lambda: makeCodec(codec, argb, size, tex, tlut).run())
+                        result = {
+                            'mpixPerSec': size * size / seconds / 1e6,
+                            'seconds': seconds,
+                            'peakKB': peak / 1024,
+                        }
+                        results[name] = result
+                        print('%-45s %10.3f MPix/s %12.1f KB peak' % (name, result['mpixPerSec'], result['peakKB']))
+                        sys.stdout.flush()
+
+    return results
+
+
+def main(argv=None):
+    """
+    Command-line entry point
+    """
+    parser = argparse.ArgumentParser(description='Benchmark TPLLib decoders and encoders.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+        help='texture widths/heights to test (default: %s)' % ' '.join(map(str, DEFAULT_SIZES)))
+    parser.add_argument('--formats', nargs='+', choices=sorted(TPLLib.FORMAT_NAMES.values()),
+        help='formats to test (default: all)')
+    parser.add_argument('--backends', nargs='+',
+        help='backends to test (default: all available: %s)' % ', '.join(TPLLib.backendPriority))
+    parser.add_argument('--kinds', nargs='+', choices=['decoder', 'encoder'], default=['decoder', 'encoder'],
+        help='test decoders, encoders or both (default: both)')
+    parser.add_argument('--contents', nargs='+', choices=CONTENTS, default=CONTENTS,
+        help='test images to use (default: both)')
+    parser.add_argument('--min-time', type=float, default=0.2,
+        help='keep repeating each measurement for at least this many seconds (default: 0.2)')
+    benchcommon.addBaselineArguments(parser, DEFAULT_BASELINE)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+
+    if args.save_baseline:
+        benchcommon.saveResults(args.baseline, results, backends=TPLLib.backendPriority)
+        print('Saved baseline to %s' % args.baseline)
+        return 0
+
+    baseline = benchcommon.loadBaseline(args.baseline)
+    if baseline is None:
+        print('No baseline at %s; run with --save-baseline to create one.' % args.baseline)
+        return 0
+
+    regressions = benchcommon.compareToBaseline(results, baseline, 'mpixPerSec', args.threshold)
+    return benchcommon.printRegressions(regressions, 'throughput', args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# benchcommon.py
+# Things shared by the benchmark scripts: timing, memory measurement
+# and comparing results against a stored baseline
+
+
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+# Let the benchmarks import BRFNTify's modules
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def initHeadless():
+    """
+    Create a QApplication that uses Qt's offscreen platform, so that
+    benchmarks can run without a display
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5 import QtWidgets
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def bestTime(func, minTime=0.2, maxRuns=20):
+    """
+    Call func repeatedly (at least once, and until minTime seconds have
+    passed or it's been called maxRuns times) and return the shortest
+    time one call took
+    """
+    best = None
+    total = 0
+    for i in range(maxRuns):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        if total >= minTime:
+            break
+    return best
+
+
+def peakMemory(func):
+    """
+    Call func once and return the peak amount of memory (in bytes) that
+    Python allocated during the call, on top of what was already
+    allocated
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+
+def peakRSSGrowth(func, interval=0.001):
+    """
+    Call func once and return how far the process's resident memory
+    (including memory Qt allocates, unlike peakMemory()) rose above
+    where it started, in bytes. It's sampled every interval seconds
+    from another thread, so very short spikes can be missed. Returns
+    None if the process's memory use can't be measured.
+    """
+    import memory
+
+    before = memory.currentRSS()
+    if before is None:
+        func()
+        return None
+
+    peak = before
+    done = threading.Event()
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, memory.currentRSS())
+            done.wait(interval)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        func()
+    finally:
+        done.set()
+        sampler.join()
+    return max(peak, memory.currentRSS()) - before
+
+
+class PhaseTimer():
+    """
+    Adds up the time spent in methods of a class
+    """
+    def __init__(self):
+        self.times = collections.defaultdict(float)
+
+    @contextlib.contextmanager
+    def timing(self, cls, phases):
+        """
+        Time the given methods of cls until the end of the with block.
+        phases is a list of (method name, phase name, whether the method
+        is a generator).
+        """
+        originals = {}
+        for method, phase, generator in phases:
+            originals[method] = getattr(cls, method)
+            setattr(cls, method, self._wrap(originals[method], phase, generator))
+        try:
+            yield self
+        finally:
+            for method, original in originals.items():
+                setattr(cls, method, original)
+
+    def _wrap(self, func, phase, generator):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                if generator:
+                    result = list(result)
+                return result
+            finally:
+                self.times[phase] += time.perf_counter() - start
+        return wrapper
+
+
+def loadBaseline(path):
+    """
+    Load baseline results saved with saveResults(), or return None if
+    the file doesn't exist
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def saveResults(path, results, **info):
+    """
+    Save results ({name: {metric: value}}) as JSON, along with anything
+    in info that describes how they were measured
+    """
+    info['python'] = sys.version.split()[0]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'info': info, 'results': results}, f, indent=1, sort_keys=True)
+
+
+def compareToBaseline(results, baseline, metric, threshold, higherIsBetter=True):
+    """
+    Compare one metric of each result to the baseline. Return a list of
+    (name, baseline value, new value, relative change) for every result
+    that got worse by more than threshold (0.1 = 10%).
+    """
+    regressions = []
+    for name, values in sorted(results.items()):
+        old = baseline.get(name, {}).get(metric)
+        new = values.get(metric)
+        if not old or new is None:
+            continue
+
+        change = (new - old) / old
+        if (-change if higherIsBetter else change) > threshold:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def printRegressions(regressions, metric, threshold):
+    """
+    Print the regressions found by compareToBaseline() and return an
+    exit status: 1 if there were any, 0 otherwise
+    """
+    if not regressions:
+        print('No %s regressions past %d%%.' % (metric, threshold * 100))
+        return 0
+
+    print('%d %s regression(s) past %d%%:' % (len(regressions), metric, threshold * 100), file=sys.stderr)
+    for name, old, new, change in regressions:
+        print('  %-45s %12.3f -> %12.3f (%+.1f%%)' % (name, old, new, change * 100), file=sys.stderr)
+    return 1
+
+
+def addBaselineArguments(parser, defaultBaseline):
+    """
+    Add the --baseline, --save-baseline and --threshold options that
+    every benchmark script shares
+    """
+    parser.add_argument('--baseline', default=defaultBaseline,
+        help='baseline results to compare against, if the file exists (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true',
+        help='save the results to the --baseline path, instead of comparing against it')
+    parser.add_argument('--threshold', type=float, default=0.2,
+        help='fail if a result is this much worse than the baseline (default: 0.2 = 20%%)')
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# synthfont.py
+# Generates synthetic fonts of any size for the benchmarks
+#
+#     python benchmarks/synthfont.py OUT.brfnt --glyphs 7000 --cmap cjk
+
+
+
+import argparse
+import random
+import sys
+
+import benchcommon
+
+import TPLLib
+
+
+# Ways to pick character codes, which lead to different mixes of CMAP
+# block types when the font is saved
+CMAP_MIXES = {
+    'dense': 'one contiguous range (type 0 blocks)',
+    'mixed': 'runs of 1-64 codes with small gaps (all three types)',
+    'sparse': 'codes scattered over the whole BMP (mostly type 2)',
+    'cjk': 'ASCII, kana, then CJK ideographs with a few gaps, like a Japanese font',
+}
+
+# Names of the texture formats fonts can be saved in (not the palette
+# formats; see BRFNT.save())
+SAVE_FORMATS = sorted(name for format, name in TPLLib.FORMAT_NAMES.items() if format not in TPLLib.PALETTE_FORMATS)
+
+
+def characterCodes(numGlyphs, mix, seed=0):
+    """
+    Return a sorted list of numGlyphs character codes, chosen in the
+    given way (a key of CMAP_MIXES)
+    """
+    rand = random.Random(seed)
+    usable = lambda code: not 0xD800 <= code <= 0xDFFF
+
+    if mix == 'dense':
+        codes = range(0x20, 0xFFFE)
+
+    elif mix == 'sparse':
+        codes = sorted(rand.sample([c for c in range(0x20, 0xFFFE) if usable(c)], numGlyphs))
+
+    elif mix == 'mixed':
+        codes = []
+        code = 0x20
+        while len(codes) < numGlyphs:
+            run = rand.randint(1, 64)
+            codes.extend(range(code, code + run))
+            code += run + rand.randint(1, 16)
+
+    elif mix == 'cjk':
+        codes = list(range(0x20, 0x7F)) + list(range(0x3041, 0x3097)) + list(range(0x30A1, 0x30FB))
+        code = 0x4E00
+        while len(codes) < numGlyphs:
+            if rand.random() > 0.1:
+                codes.append(code)
+            code += 1
+
+    else:
+        raise ValueError('Unknown CMAP mix: %s' % mix)
+
+    codes = [c for c in codes if usable(c)][:numGlyphs]
+    if len(codes) < numGlyphs:
+        raise ValueError('Too many glyphs for the "%s" CMAP mix' % mix)
+    return codes
+
+
+def glyphPixmap(index, cellWidth, cellHeight):
+    """
+    Return a glyph-like antialiased white drawing on a transparent
+    background, different for each index
+    """
+    from PyQt5 import QtCore, QtGui
+
+    image = QtGui.QImage(cellWidth, cellHeight, QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.fill(QtCore.Qt.transparent)
+
+    painter = QtGui.QPainter(image)
+    painter.setRenderHint(QtGui.QPainter.Antialiasing)
+    painter.setPen(QtGui.QPen(QtCore.Qt.white, 1.5))
+
+    rand = random.Random(index)
+    for stroke in range(2 + index % 4):
+        x1, x2 = rand.uniform(2, cellWidth - 2), rand.uniform(2, cellWidth - 2)
+        y1, y2 = rand.uniform(2, cellHeight - 2), rand.uniform(2, cellHeight - 2)
+        if stroke % 3 == 2:
+            painter.drawEllipse(QtCore.QRectF(min(x1, x2), min(y1, y2), abs(x2 - x1) + 1, abs(y2 - y1) + 1))
+        else:
+            painter.drawLine(QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2))
+
+    painter.end()
+    return QtGui.QPixmap.fromImage(image)
+
+
+def makeFont(numGlyphs, cellWidth=24, cellHeight=26, texFormat=TPLLib.I4, cmap='cjk', sheetSize=512, seed=0):
+    """
+    Return a BRFNT with numGlyphs synthetic glyphs. Cells are packed
+    onto sheets about sheetSize pixels square.
+    """
+    import BRFNTify
+
+    font = BRFNTify.BRFNT()
+    font.setMetrics({
+        'version': BRFNTify.METRICS_VERSION,
+        'endianness': 'big',
+        'rfntVersion': [0xFFFE, 0x0104],
+        'finf': {
+            'fontType': 1, 'leading': cellHeight + 1, 'defaultChar': 0x20,
+            'leftMargin': 0, 'charWidth': cellWidth, 'fullWidth': cellWidth,
+            'encoding': 'UTF-16', 'height': cellHeight, 'width': cellWidth,
+            'ascent': cellHeight * 3 // 4, 'descent': cellHeight // 4,
+        },
+        'tglp': {
+            'cellWidth': cellWidth, 'cellHeight': cellHeight,
+            'baseLine': cellHeight * 3 // 4, 'maxCharWidth': cellWidth,
+            'texFormat': texFormat,
+            'charsPerRow': max(1, sheetSize // cellWidth),
+            'charsPerColumn': max(1, sheetSize // cellHeight),
+        },
+    })
+
+    font.glyphs = []
+    for i, code in enumerate(characterCodes(numGlyphs, cmap, seed)):
+        font.glyphs.append(BRFNTify.Glyph(
+            glyphPixmap(i + seed, cellWidth, cellHeight),
+            BRFNTify.valueToChar(code, font.encoding),
+            i % 3, cellWidth - 2, cellWidth))
+    return font
+
+
+def addFontArguments(parser):
+    """
+    Add options that describe a synthetic font
+    """
+    parser.add_argument('--glyphs', type=int, default=7000,
+        help='number of glyphs (default: 7000)')
+    parser.add_argument('--cell', type=int, nargs=2, default=[24, 26], metavar=('WIDTH', 'HEIGHT'),
+        help='glyph cell size (default: 24 26)')
+    parser.add_argument('--format', choices=SAVE_FORMATS, default='I4',
+        help='texture format (default: I4)')
+    parser.add_argument('--cmap', choices=sorted(CMAP_MIXES), default='cjk',
+        help='how character codes are chosen: ' + '; '.join('%s: %s' % i for i in sorted(CMAP_MIXES.items())))
+    parser.add_argument('--sheet-size', type=int, default=512,
+        help='approximate texture sheet width and height (default: 512)')
+
+
+def fontFromArguments(args):
+    """
+    Return a synthetic font as described by the options from
+    addFontArguments()
+    """
+    formats = {name: format for format, name in TPLLib.FORMAT_NAMES.items()}
+    return makeFont(args.glyphs, args.cell[0], args.cell[1], formats[args.format], args.cmap, args.sheet_size)
+
+
+def main(argv=None):
+    """
+    Command-line entry point
+    """
+    parser = argparse.ArgumentParser(description='Generate a synthetic font for benchmarking.')
+    parser.add_argument('output',
+        help='output .brfnt file')
+    addFontArguments(parser)
+    args = parser.parse_args(argv)
+
+    app = benchcommon.initHeadless()
+    with open(args.output, 'wb') as f:
+        f.write(fontFromArguments(args).save())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1069 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# brfntify_cli.py
+# Command-line tools for working with many fonts at once, without
+# opening any windows
+
+
+
+# Imports
+
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from PyQt5 import QtGui, QtWidgets
+
+import archive
+import BRFNTify
+import formatadvisor
+import memory
+import TPLLib
+import yaz0
+from TPLLib.tpl import textureSize
+
+
+
+def initHeadless():
+    """
+    Create a windowless Qt application for this process if there isn't
+    one already (BRFNT needs one in order to create QPixmaps)
+    """
+    global app
+
+    if QtWidgets.QApplication.instance() is None:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        app = QtWidgets.QApplication([])
+
+
+def findFiles(paths, extensions):
+    """
+    Yield (path, relativePath) pairs for every file in the given list of
+    files and directories. Directories are searched recursively for
+    files with any of the given extensions (e.g. {'.brfnt'}), or for
+    all files if extensions is None.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for fn in sorted(files):
+                if extensions is None or os.path.splitext(fn)[1].lower() in extensions:
+                    fullPath = os.path.join(root, fn)
+                    yield fullPath, os.path.relpath(fullPath, path)
+
+
+FONT_MAGICS = {b'RFNT', b'RFNA', b'TNFR', b'ANFR'}
+
+# Extensions of fonts inside archives, and of the files fonts are
+# looked for in when searching directories
+FONT_EXTENSIONS = ('.brfnt', '.brfna')
+FONT_FILE_EXTENSIONS = {'.brfnt', '.brfna', '.szs', '.arc'}
+
+
+def fontsInFile(path):
+    """
+    Return [None] if a file is a font (possibly Yaz0-compressed), the
+    paths of the fonts inside it if it's a U8 archive (possibly
+    Yaz0-compressed), or [] if it's neither. Only as much of the file
+    as is needed to tell is read and decompressed.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(0x10)
+        if yaz0.isCompressed(head):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                head = yaz0.decompress(data, limit=0x10)
+                if archive.isU8(head):
+                    # The node table ends where the file data starts
+                    nodes = yaz0.decompress(data, limit=struct.unpack_from('>I', head, 12)[0])
+        elif archive.isU8(head):
+            nodes = head + f.read(struct.unpack_from('>I', head, 12)[0] - len(head))
+
+    if bytes(head[:4]) in FONT_MAGICS:
+        return [None]
+    elif archive.isU8(head):
+        return [n for n in archive.U8(nodes).names() if n.lower().endswith(FONT_EXTENSIONS)]
+    return []
+
+
+def findFonts(paths):
+    """
+    Yield (path, member, relativePath) triples for every font in the
+    given list of files and directories. Directories are searched
+    recursively for .brfnt, .brfna, .szs and .arc files, and files found
+    there that don't contain any fonts are skipped. member is the path
+    of the font inside a U8 archive, or None if the file is a font
+    itself.
+    """
+    for path in paths:
+        for fullPath, rel in findFiles([path], FONT_FILE_EXTENSIONS):
+            try:
+                members = fontsInFile(fullPath)
+            except (OSError, ValueError, struct.error):
+                members = [None] # the error is reported when it's loaded
+            if not members and not os.path.isdir(path):
+                members = [None] # named explicitly, so report the error
+
+            for member in members:
+                if member is None:
+                    yield fullPath, None, rel
+                else:
+                    yield fullPath, member, os.path.normpath(os.path.join(os.path.splitext(rel)[0], member))
+
+
+def loadFont(path, member=None):
+    """
+    Load a font from a file (possibly Yaz0-compressed), or from the
+    given member of a U8 archive file. Uncompressed files are mapped
+    into memory rather than read, so only the font's own data is read
+    from an archive.
+    """
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data = yaz0.unwrap(data)
+    if member is not None:
+        data = archive.U8(data).getFile(member)
+    return BRFNTify.BRFNT(data)
+
+
+def fontName(path, member):
+    """
+    Return how to refer to a font in messages
+    """
+    return path if member is None else '%s:%s' % (path, member)
+
+
+def runJobs(func, jobs, numWorkers):
+    """
+    Call func(*args) for each args tuple in jobs, spread across a pool
+    of worker processes. Yield (args, result, exception) triples in the
+    order the jobs finish.
+    """
+    if numWorkers == 1 or len(jobs) <= 1:
+        initHeadless()
+        for args in jobs:
+            try:
+                yield args, func(*args), None
+            except Exception as e:
+                yield args, None, e
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(numWorkers, initializer=initHeadless) as pool:
+        futures = {pool.submit(func, *args): args for args in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+def reportJobs(results, describe, name=None):
+    """
+    Print a line for each (args, result, exception) triple, and return
+    the number of jobs that failed. name(args) says which job failed in
+    error messages; by default, its first argument is used.
+    """
+    failures = 0
+    for args, result, exc in results:
+        if exc is None:
+            print(describe(args, result))
+        else:
+            failures += 1
+            print('ERROR: %s: %s' % (args[0] if name is None else name(args), exc), file=sys.stderr)
+
+    return failures
+
+
+def outputExtension(args):
+    """
+    Return the file extension to use for fonts output by a command
+    """
+    return '.brfnt' if args.compress is None else '.szs'
+
+
+def makeParentDirs(path):
+    """
+    Create the directory that will contain the given file, if needed
+    """
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+
+
+########################################################################
+################################ Export ################################
+########################################################################
+
+def exportFont(inPath, outBase, layout, member=None):
+    """
+    Convert a single font file (or a font in an archive file) to
+    outBase + '.png' and outBase + '.json'. Return the number of glyphs
+    exported.
+    """
+    font = loadFont(inPath, member)
+
+    if layout == 'sheets':
+        image = font.exportSheets()
+    else:
+        image = font.exportImage()
+
+    metrics = font.getMetrics()
+    metrics['layout'] = layout
+
+    makeParentDirs(outBase)
+    if not image.save(outBase + '.png'):
+        raise OSError('could not write %s' % (outBase + '.png'))
+    with open(outBase + '.json', 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=1)
+
+    return len(font.glyphs)
+
+
+def cmdExport(args):
+    """
+    Handle the "export" command
+    """
+    jobs = []
+    for path, member, rel in findFonts(args.input):
+        jobs.append((path, os.path.join(args.output, os.path.splitext(rel)[0]), args.layout, member))
+
+    return reportJobs(
+        runJobs(exportFont, jobs, args.jobs),
+        lambda args, result: '%s: %d glyphs' % (fontName(args[0], args[3]), result),
+        lambda args: fontName(args[0], args[3]))
+
+
+
+########################################################################
+################################# Build ################################
+########################################################################
+
+def loadFontImage(imagePath, metricsPath):
+    """
+    Create a BRFNT from a PNG image and a JSON metrics file
+    """
+    with open(metricsPath, 'r', encoding='utf-8') as f:
+        metrics = json.load(f)
+
+    image = QtGui.QImage(imagePath)
+    if image.isNull():
+        raise OSError('could not read %s' % imagePath)
+
+    return BRFNTify.BRFNT.fromImage(image, metrics)
+
+
+def buildFont(metricsPath, outPath, compressLevel=None, highQuality=False, reorder=False, autoFormat=None, autoGrid=False, dedupe=False):
+    """
+    Convert a single JSON metrics file and the PNG image next to it back
+    into a font file (Yaz0-compressed if compressLevel is not None). If
+    autoFormat is not None, the smallest texture format within that
+    error is used; if autoGrid is True, the sheet grid is chosen by
+    BRFNT.getBestSheetGrid(); if dedupe is True, identical glyphs are
+    stored once. Return the number of glyphs in it.
+    """
+    font = loadFontImage(os.path.splitext(metricsPath)[0] + '.png', metricsPath)
+    font.highQualityEncoding = highQuality
+    font.reorderGlyphs = reorder
+    font.dedupeGlyphs = dedupe
+    font.autoFormatMaxError = autoFormat
+    font.autoSheetGrid = autoGrid
+    data = font.save()
+    if compressLevel is not None:
+        data = yaz0.compress(data, compressLevel)
+
+    makeParentDirs(outPath)
+    with open(outPath, 'wb') as f:
+        f.write(data)
+
+    return len(font.glyphs)
+
+
+def cmdBuild(args):
+    """
+    Handle the "build" command
+    """
+    jobs = []
+    for path, rel in findFiles(args.input, {'.json'}):
+        jobs.append((path, os.path.join(args.output, os.path.splitext(rel)[0] + outputExtension(args)), args.compress, args.best, args.reorder, args.auto_format, args.auto_grid, args.dedupe))
+
+    return reportJobs(
+        runJobs(buildFont, jobs, args.jobs),
+        lambda args, result: '%s: %d glyphs' % (args[1], result))
+
+
+
+########################################################################
+############################### Projects ###############################
+########################################################################
+
+# A project is a directory containing PROJECT_MANIFEST (a metrics dict
+# as returned by BRFNT.getMetrics(), with an "image" filename added to
+# each glyph entry) and one PNG per glyph. Encoded texture sheets are
+# cached by a hash of everything that goes into them, so rebuilding a
+# project only re-encodes sheets whose glyphs or settings changed.
+PROJECT_MANIFEST = 'font.json'
+PROJECT_GLYPHS_DIR = 'glyphs'
+PROJECT_CACHE_DIR = '.cache'
+PROJECT_CACHE_VERSION = b'BRFNTify sheet cache 1'
+
+
+def writeFileAtomic(path, data):
+    """
+    Write data to a file such that readers only ever see either the old
+    or the complete new contents
+    """
+    makeParentDirs(path)
+    tempPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tempPath, 'wb') as f:
+        f.write(data)
+    os.replace(tempPath, path)
+
+
+def unpackProject(fontPath, projectDir, member=None):
+    """
+    Convert a font file (or a font in an archive file) to a project
+    directory. Return the number of glyphs.
+    """
+    font = loadFont(fontPath, member)
+
+    os.makedirs(os.path.join(projectDir, PROJECT_GLYPHS_DIR), exist_ok=True)
+
+    manifest = font.getMetrics()
+    usedNames = set()
+    images = {} # glyphs sharing a pixmap share the image file too
+    for g, entry in zip(font.glyphs, manifest['glyphs']):
+        if g.pixmap.cacheKey() in images:
+            entry['image'] = images[g.pixmap.cacheKey()]
+            continue
+
+        name = '%04X' % entry['code']
+        n = 1
+        while name in usedNames:
+            n += 1
+            name = '%04X-%d' % (entry['code'], n)
+        usedNames.add(name)
+
+        entry['image'] = images[g.pixmap.cacheKey()] = PROJECT_GLYPHS_DIR + '/' + name + '.png'
+        if not g.pixmap.save(os.path.join(projectDir, entry['image'])):
+            raise OSError('could not write %s' % entry['image'])
+
+    with open(os.path.join(projectDir, PROJECT_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+
+    return len(font.glyphs)
+
+
+class Project:
+    """
+    Class that builds a font from a project directory
+    """
+    def __init__(self, projectDir, cacheDir=None, highQuality=False, reorder=False, autoGrid=False, dedupe=False):
+        self.projectDir = projectDir
+        self.cacheDir = cacheDir or os.path.join(projectDir, PROJECT_CACHE_DIR)
+        self.highQuality = highQuality
+        self.reorder = reorder
+        self.autoGrid = autoGrid
+        self.dedupe = dedupe
+        self.lastTexDatas = []
+        self.reload()
+
+
+    def reload(self):
+        """
+        (Re)load the manifest
+        """
+        with open(os.path.join(self.projectDir, PROJECT_MANIFEST), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+
+        font = self.font = BRFNTify.BRFNT()
+        font.setMetrics(self.manifest)
+        font.highQualityEncoding = self.highQuality
+        font.reorderGlyphs = self.reorder
+        font.dedupeGlyphs = self.dedupe
+
+        font.glyphs = []
+        for e in self.manifest['glyphs']:
+            # The glyph images are only needed when painting sheets,
+            # which buildSheets() takes care of
+            font.glyphs.append(BRFNTify.Glyph(QtGui.QPixmap(),
+                BRFNTify.valueToChar(e['code'], font.encoding),
+                e['leftMargin'], e['charWidth'], e['fullWidth']))
+
+        if self.autoGrid:
+            font.charsPerRow, font.charsPerColumn = font.getBestSheetGrid(len(self.saveLayout()[0]))
+
+
+    def saveLayout(self):
+        """
+        Return how the font's glyphs will be stored (see
+        BRFNT.getSaveLayout()). Glyphs are identified by their image
+        filenames, so ones sharing an image file can be stored once.
+        """
+        return self.font.getSaveLayout([e['image'] for e in self.manifest['glyphs']])
+
+
+    def sheetEntries(self):
+        """
+        Return the manifest's glyph entries, split into lists of the
+        entries on each texture sheet
+        """
+        font = self.font
+        charsPerTex = font.charsPerRow * font.charsPerColumn
+        entries = [self.manifest['glyphs'][i] for i in self.saveLayout()[0]]
+        return [entries[i : i + charsPerTex] for i in range(0, len(entries), charsPerTex)]
+
+
+    def sheetKey(self, entries):
+        """
+        Return a hash of everything that affects the encoded texture
+        sheet containing the given glyph entries
+        """
+        font = self.font
+        # Backends don't all encode the same way (e.g. CMPR), so the one
+        # used is part of the key
+        backend = TPLLib.findCodec('encoder', font.texFormat, font.highQualityEncoding).backend
+        h = hashlib.sha256(PROJECT_CACHE_VERSION)
+        h.update(repr((
+            font.texFormat, font.highQualityEncoding, backend, font.getTextureSize(),
+            font.cellWidth, font.cellHeight,
+            font.charsPerRow, font.charsPerColumn)).encode('ascii'))
+
+        for e in entries:
+            with open(os.path.join(self.projectDir, e['image']), 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+
+        return h.hexdigest()
+
+
+    def encodeSheet(self, entries):
+        """
+        Paint and encode the texture sheet containing the given glyph
+        entries
+        """
+        pixmaps = []
+        for e in entries:
+            image = QtGui.QImage(os.path.join(self.projectDir, e['image']))
+            if image.isNull():
+                raise OSError('could not read %s' % e['image'])
+            pixmaps.append(QtGui.QPixmap.fromImage(image))
+
+        return self.font.encodeSheet(self.font._paintSheet(pixmaps))
+
+
+    def buildSheets(self, changedSheets=None):
+        """
+        Return the encoded texture sheets and the number of them that
+        had to be re-encoded (rather than loaded from the cache). If
+        changedSheets (a set of sheet indices) is given, all other
+        sheets are assumed to be unchanged since the last build.
+        """
+        texDatas = []
+        numEncoded = 0
+
+        for i, entries in enumerate(self.sheetEntries()):
+            if changedSheets is not None and i not in changedSheets and i < len(self.lastTexDatas):
+                texDatas.append(self.lastTexDatas[i])
+                continue
+
+            cachePath = os.path.join(self.cacheDir, self.sheetKey(entries) + '.bin')
+
+            try:
+                with open(cachePath, 'rb') as f:
+                    texData = f.read()
+            except FileNotFoundError:
+                texData = self.encodeSheet(entries)
+                writeFileAtomic(cachePath, texData)
+                numEncoded += 1
+
+            texDatas.append(texData)
+
+        self.lastTexDatas = texDatas
+        return texDatas, numEncoded
+
+
+    def build(self, outPath, changedSheets=None, compressLevel=None):
+        """
+        Build the font file (Yaz0-compressed if compressLevel is not
+        None). Return the number of sheets and the number of them that
+        had to be re-encoded. See buildSheets() for changedSheets.
+        """
+        texDatas, numEncoded = self.buildSheets(changedSheets)
+        data = self.font.save(texDatas, self.saveLayout())
+        if compressLevel is not None:
+            data = yaz0.compress(data, compressLevel)
+        writeFileAtomic(outPath, bytes(data))
+
+        return len(texDatas), numEncoded
+
+
+def packProject(projectDir, outPath, cacheDir, compressLevel, highQuality=False, reorder=False, autoGrid=False, dedupe=False):
+    """
+    Build a project directory into a font file. Return the number of
+    sheets and the number of them that had to be re-encoded.
+    """
+    return Project(projectDir, cacheDir, highQuality, reorder, autoGrid, dedupe).build(outPath, compressLevel=compressLevel)
+
+
+def watchProject(project, outPath, interval, debounce, compressLevel):
+    """
+    Rebuild a project whenever its files change, until interrupted.
+    Changes are collected until none have happened for debounce
+    seconds, so that a burst of saved files only causes one rebuild.
+    """
+    manifestPath = os.path.join(project.projectDir, PROJECT_MANIFEST)
+
+    def imageSheets():
+        """
+        Map each glyph image path to the index of its texture sheet
+        """
+        sheets = {}
+        for i, entries in enumerate(project.sheetEntries()):
+            for e in entries:
+                sheets[os.path.join(project.projectDir, e['image'])] = i
+        return sheets
+
+    def snapshot(paths):
+        """
+        Return the modification time and size of each path
+        """
+        stats = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stats[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stats[path] = None
+        return stats
+
+    def rebuild(changedSheets):
+        start = time.perf_counter()
+        try:
+            numSheets, numEncoded = project.build(outPath, changedSheets, compressLevel)
+        except Exception as e:
+            print('ERROR: %s' % e, file=sys.stderr)
+            return False
+        print('Rebuilt %s: %d of %d sheets re-encoded in %.3f s'
+            % (outPath, numEncoded, numSheets, time.perf_counter() - start))
+        return True
+
+    sheets = imageSheets()
+    stats = snapshot([manifestPath, *sheets])
+    rebuild(None)
+
+    pending = set()
+    lastChange = None
+    while True:
+        time.sleep(interval)
+
+        newStats = snapshot(stats)
+        changed = [path for path in stats if newStats[path] != stats[path]]
+        stats = newStats
+        if changed:
+            pending.update(changed)
+            lastChange = time.monotonic()
+
+        if not pending or time.monotonic() - lastChange < debounce:
+            continue
+
+        if manifestPath in pending:
+            try:
+                project.reload()
+            except Exception as e:
+                print('ERROR: %s' % e, file=sys.stderr)
+                pending.clear()
+                continue
+            sheets = imageSheets()
+            stats = snapshot([manifestPath, *sheets])
+            changedSheets = None
+        else:
+            changedSheets = {sheets[path] for path in pending}
+
+        pending.clear()
+        if not rebuild(changedSheets):
+            # Check every sheet next time, since this build didn't finish
+            pending.add(manifestPath)
+            lastChange = time.monotonic()
+
+
+def cmdWatch(args):
+    """
+    Handle the "watch" command
+    """
+    initHeadless()
+
+    try:
+        project = Project(args.project, args.cache, args.best, args.reorder, args.auto_grid, args.dedupe)
+        watchProject(project, args.output, args.interval, args.debounce, args.compress)
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+def cmdUnpack(args):
+    """
+    Handle the "unpack" command
+    """
+    jobs = []
+    for path, member, rel in findFonts(args.input):
+        jobs.append((path, os.path.join(args.output, os.path.splitext(rel)[0]), member))
+
+    return reportJobs(
+        runJobs(unpackProject, jobs, args.jobs),
+        lambda args, result: '%s: %d glyphs' % (args[1], result),
+        lambda args: fontName(args[0], args[2]))
+
+
+def cmdPack(args):
+    """
+    Handle the "pack" command
+    """
+    jobs = []
+    for projectDir in args.input:
+        name = os.path.basename(os.path.normpath(projectDir))
+        jobs.append((projectDir, os.path.join(args.output, name + outputExtension(args)), args.cache, args.compress, args.best, args.reorder, args.auto_grid, args.dedupe))
+
+    return reportJobs(
+        runJobs(packProject, jobs, args.jobs),
+        lambda args, result: '%s: %d sheets, %d re-encoded' % (args[1], *result))
+
+
+
+########################################################################
+################################ Memory ################################
+########################################################################
+
+def measureFont(path, member=None):
+    """
+    Load a font and return (memory.fontUsage() results, how much the
+    process's memory use grew while loading it, or None if unknown)
+    """
+    before = memory.currentRSS()
+    font = loadFont(path, member)
+    after = memory.currentRSS()
+
+    growth = None if before is None or after is None else after - before
+    return memory.fontUsage(font), growth
+
+
+def describeUsage(args, result):
+    """
+    Describe the result of measureFont() on one line
+    """
+    usage, growth = result
+    parts = ['%s %s' % (description.lower(), memory.formatSize(usage[key])) for key, description in memory.SUBSYSTEMS]
+    return '%s: %s total (%s); process grew by %s' % (
+        fontName(*args), memory.formatSize(sum(usage.values())), ', '.join(parts), memory.formatSize(growth))
+
+
+def cmdMemory(args):
+    """
+    Handle the "memory" command
+    """
+    jobs = [(path, member) for path, member, rel in findFonts(args.input)]
+
+    return reportJobs(runJobs(measureFont, jobs, args.jobs), describeUsage, lambda args: fontName(*args))
+
+
+
+########################################################################
+############################### Formats ################################
+########################################################################
+
+def analyzeFontFormats(path, maxError, member=None):
+    """
+    Load a font and return (its texture format, formatadvisor results,
+    the smallest format within maxError)
+    """
+    font = loadFont(path, member)
+
+    results = formatadvisor.analyzeFormats(font)
+    return font.texFormat, results, formatadvisor.smallestFormat(font, maxError, results)
+
+
+def cmdFormats(args):
+    """
+    Handle the "formats" command
+    """
+    jobs = [(path, args.max_error, member) for path, member, rel in findFonts(args.input)]
+    showTable = args.table
+
+    def describe(args, result):
+        current, results, smallest = result
+        sizes = {r['format']: r['size'] for r in results}
+        if current in sizes:
+            line = '%s: %s, %d bytes' % (fontName(args[0], args[2]), TPLLib.FORMAT_NAMES[current], sizes[current])
+        else: # a palette format, which fonts can't be saved in
+            line = '%s: %s' % (fontName(args[0], args[2]), TPLLib.FORMAT_NAMES[current])
+        line += '; smallest within error %d: %s, %d bytes' % (args[1], TPLLib.FORMAT_NAMES[smallest], sizes[smallest])
+        if showTable:
+            line += '\n' + formatadvisor.formatReport(results, current)
+        return line
+
+    return reportJobs(runJobs(analyzeFontFormats, jobs, args.jobs), describe, lambda args: fontName(args[0], args[2]))
+
+
+
+########################################################################
+################################# Scan #################################
+########################################################################
+
+# Columns of the scan report, in order
+SCAN_FIELDS = [
+    'file', 'member', 'containers', 'size', 'magic', 'endianness',
+    'encoding', 'format', 'cellWidth', 'cellHeight', 'glyphs', 'sheets',
+    'sheetWidth', 'sheetHeight', 'codeRanges', 'anomalies', 'error',
+]
+
+
+def findAnomalies(metrics):
+    """
+    Return a list of descriptions of anything unusual in a font's
+    metrics (as returned by BRFNT.peekData())
+    """
+    anomalies = []
+    finf, tglp, sheets, glyphs = metrics['finf'], metrics['tglp'], metrics['sheets'], metrics['glyphs']
+
+    expectedSize = textureSize(tglp['texFormat'], sheets['width'], sheets['height'])
+    if tglp['texFormat'] in TPLLib.PALETTE_FORMATS:
+        expectedSize += 2 << {TPLLib.CI4: 4, TPLLib.CI8: 8, TPLLib.CI14x2: 14}[tglp['texFormat']]
+    if sheets['size'] != expectedSize:
+        anomalies.append('sheet size is 0x%X, expected 0x%X' % (sheets['size'], expectedSize))
+
+    if tglp['cellWidth'] * tglp['charsPerRow'] > sheets['width'] or tglp['cellHeight'] * tglp['charsPerColumn'] > sheets['height']:
+        anomalies.append('cells extend past the edge of the sheets')
+
+    slots = sheets['count'] * tglp['charsPerRow'] * tglp['charsPerColumn']
+    if slots - len(glyphs) >= tglp['charsPerRow'] * tglp['charsPerColumn']:
+        anomalies.append('%d of %d glyph slots have no character code' % (slots - len(glyphs), slots))
+
+    codes = [g['code'] for g in glyphs]
+    if len(set(codes)) != len(codes):
+        anomalies.append('%d character codes are used by more than one glyph' % (len(codes) - len(set(codes))))
+    if codes and finf['defaultChar'] not in codes:
+        anomalies.append('default character 0x%X has no glyph' % finf['defaultChar'])
+
+    missingWidths = sum(1 for g in glyphs if g['leftMargin'] == 0xFF)
+    if missingWidths:
+        anomalies.append('%d glyphs have no CWDH entry' % missingWidths)
+    tooWide = sum(1 for g in glyphs if g['leftMargin'] != 0xFF and g['charWidth'] > tglp['cellWidth'])
+    if tooWide:
+        anomalies.append('%d glyphs are wider than their cells' % tooWide)
+
+    return anomalies
+
+
+def describeFontData(data, row):
+    """
+    Fill in a scan report row from BRFNT data, and return it
+    """
+    metrics = BRFNTify.BRFNT.peekData(data)
+    row.update({
+        'size': len(data),
+        'magic': bytes(data[:4]).decode('latin-1'),
+        'endianness': metrics['endianness'],
+        'encoding': metrics['finf']['encoding'],
+        'format': TPLLib.FORMAT_NAMES.get(metrics['tglp']['texFormat'], str(metrics['tglp']['texFormat'])),
+        'cellWidth': metrics['tglp']['cellWidth'],
+        'cellHeight': metrics['tglp']['cellHeight'],
+        'glyphs': len(metrics['glyphs']),
+        'sheets': metrics['sheets']['count'],
+        'sheetWidth': metrics['sheets']['width'],
+        'sheetHeight': metrics['sheets']['height'],
+        'codeRanges': metrics['codeRanges'],
+        'anomalies': findAnomalies(metrics),
+    })
+    return row
+
+
+def scanData(data, path, members, containers, rows):
+    """
+    Look for fonts in data, descending into Yaz0 and U8 containers, and
+    append a report row to rows for each one (or for each font or
+    container that couldn't be read)
+    """
+    row = {'file': path, 'member': '/'.join(members), 'containers': '+'.join(containers)}
+    try:
+        if yaz0.isCompressed(data):
+            # Only decompress all of it if there's something to look at
+            inner = bytes(yaz0.decompress(data, limit=4))
+            if inner in FONT_MAGICS or archive.isU8(inner):
+                scanData(yaz0.decompress(data), path, members, containers + ['yaz0'], rows)
+
+        elif archive.isU8(data):
+            arc = archive.U8(data)
+            for name in arc.names():
+                scanData(arc.getFile(name), path, members + [name], containers + ['u8'], rows)
+
+        elif bytes(data[:4]) in FONT_MAGICS:
+            rows.append(describeFontData(data, row))
+
+    except Exception as e:
+        row['error'] = '%s: %s' % (type(e).__name__, e)
+        rows.append(row)
+
+
+def scanFile(path):
+    """
+    Return a list of report rows for the fonts in a file. Only files
+    that start with a font, Yaz0 or U8 magic are read any further, and
+    no part of a file is read more than once.
+    """
+    rows = []
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 4:
+            return rows
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        magic = data[:4]
+        if magic in FONT_MAGICS or yaz0.isCompressed(magic) or archive.isU8(magic):
+            scanData(data, path, [], [], rows)
+    finally:
+        data.close()
+    return rows
+
+
+def scanFileSafely(path):
+    """
+    scanFile(), but errors (such as unreadable files) are reported as
+    rows instead of being raised
+    """
+    try:
+        return scanFile(path)
+    except Exception as e:
+        return [{'file': path, 'member': '', 'containers': '', 'error': '%s: %s' % (type(e).__name__, e)}]
+
+
+def writeScanReport(f, rows, format):
+    """
+    Write report rows to a text file as JSON Lines or CSV, as they come
+    in. Return (number of rows, number with errors).
+    """
+    if format == 'csv':
+        writer = csv.DictWriter(f, SCAN_FIELDS, restval='')
+        writer.writeheader()
+
+    count = errors = 0
+    for row in rows:
+        count += 1
+        if row.get('error'):
+            errors += 1
+
+        if format == 'csv':
+            row = dict(row)
+            if 'codeRanges' in row:
+                row['codeRanges'] = ' '.join('%X-%X' % tuple(r) if r[0] != r[1] else '%X' % r[0] for r in row['codeRanges'])
+            if 'anomalies' in row:
+                row['anomalies'] = '; '.join(row['anomalies'])
+            writer.writerow(row)
+        else:
+            f.write(json.dumps(row) + '\n')
+
+    return count, errors
+
+
+def cmdScan(args):
+    """
+    Handle the "scan" command
+    """
+    paths = [path for path, rel in findFiles(args.input, None)]
+
+    format = args.format
+    if format is None:
+        format = 'csv' if args.output.lower().endswith('.csv') else 'jsonl'
+
+    def rows(results):
+        for fileRows in results:
+            yield from fileRows
+
+    if args.jobs == 1 or len(paths) <= 1:
+        results = map(scanFileSafely, paths)
+        pool = None
+    else:
+        pool = concurrent.futures.ProcessPoolExecutor(args.jobs)
+        results = pool.map(scanFileSafely, paths, chunksize=64)
+
+    try:
+        if args.output == '-':
+            count, errors = writeScanReport(sys.stdout, rows(results), format)
+        else:
+            makeParentDirs(args.output)
+            with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                count, errors = writeScanReport(f, rows(results), format)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    print('Scanned %d files: found %d fonts, %d errors' % (len(paths), count - errors, errors), file=sys.stderr)
+    return errors
+
+
+
+########################################################################
+################################# Main #################################
+########################################################################
+
+def main(argv=None):
+    """
+    Command-line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description='Command-line tools for BRFNTify Next. These never open any windows.')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='number of worker processes to use (default: one per CPU)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('export',
+        help='convert fonts to PNG images plus JSON metrics')
+    p.add_argument('input', nargs='+',
+        help='font files (optionally Yaz0-compressed) and archives containing fonts, or directories to search for .brfnt, .brfna, .szs and .arc files')
+    p.add_argument('-o', '--output', default='.',
+        help='output directory (directory structure is mirrored)')
+    p.add_argument('--layout', choices=['export', 'sheets'], default='export',
+        help='image layout: 16 glyphs per row (like "Export as Image") or the texture sheets as stored in the font')
+    p.set_defaults(func=cmdExport)
+
+    p = subparsers.add_parser('build',
+        help='convert PNG images plus JSON metrics back to fonts')
+    p.add_argument('input', nargs='+',
+        help='.json metrics files (each next to a .png with the same name), or directories to search for them')
+    p.add_argument('-o', '--output', default='.',
+        help='output directory (directory structure is mirrored)')
+    p.add_argument('--compress', type=int, nargs='?', const=yaz0.DEFAULT_LEVEL, choices=range(10), metavar='LEVEL',
+        help='Yaz0-compress the output (level 0-9, default %d; higher is smaller but slower, and 9 is 5-10x slower than the default)' % yaz0.DEFAULT_LEVEL)
+    p.add_argument('--best', action='store_true',
+        help='use slower, higher-quality texture encoding where available (CMPR)')
+    p.add_argument('--reorder', action='store_true',
+        help='store glyphs sorted by character code, for a smaller and faster CMAP')
+    p.add_argument('--auto-grid', action='store_true',
+        help='choose the characters per row and column (and so the sheet size) that need the least texture data')
+    p.add_argument('--dedupe', action='store_true',
+        help='store identical glyphs (same image and widths) once, with all of their character codes pointing to it')
+    p.add_argument('--auto-format', type=int, nargs='?', const=0, metavar='MAXERROR',
+        help='use the smallest texture format that changes no pixel channel by more than MAXERROR (0-255, default 0: lossless)')
+    p.set_defaults(func=cmdBuild)
+
+    p = subparsers.add_parser('unpack',
+        help='convert fonts to project directories (one PNG per glyph plus a manifest)')
+    p.add_argument('input', nargs='+',
+        help='font files (optionally Yaz0-compressed) and archives containing fonts, or directories to search for .brfnt, .brfna, .szs and .arc files')
+    p.add_argument('-o', '--output', default='.',
+        help='output directory (one project directory is created per font)')
+    p.set_defaults(func=cmdUnpack)
+
+    p = subparsers.add_parser('pack',
+        help='build project directories into fonts, re-encoding only changed texture sheets')
+    p.add_argument('input', nargs='+',
+        help='project directories')
+    p.add_argument('-o', '--output', default='.',
+        help='output directory')
+    p.add_argument('--cache',
+        help='directory to cache encoded texture sheets in (default: .cache in each project)')
+    p.add_argument('--compress', type=int, nargs='?', const=yaz0.DEFAULT_LEVEL, choices=range(10), metavar='LEVEL',
+        help='Yaz0-compress the output (level 0-9, default %d; higher is smaller but slower, and 9 is 5-10x slower than the default)' % yaz0.DEFAULT_LEVEL)
+    p.add_argument('--best', action='store_true',
+        help='use slower, higher-quality texture encoding where available (CMPR)')
+    p.add_argument('--reorder', action='store_true',
+        help='store glyphs sorted by character code, for a smaller and faster CMAP')
+    p.add_argument('--auto-grid', action='store_true',
+        help='choose the characters per row and column (and so the sheet size) that need the least texture data')
+    p.add_argument('--dedupe', action='store_true',
+        help='store identical glyphs (same image and widths) once, with all of their character codes pointing to it')
+    p.set_defaults(func=cmdPack)
+
+    p = subparsers.add_parser('watch',
+        help='rebuild a project directory into a font whenever its files change')
+    p.add_argument('project',
+        help='project directory')
+    p.add_argument('-o', '--output', required=True,
+        help='output .brfnt file (replaced atomically on each rebuild)')
+    p.add_argument('--cache',
+        help='directory to cache encoded texture sheets in (default: .cache in the project)')
+    p.add_argument('--interval', type=float, default=0.05,
+        help='seconds between checks for changed files (default: 0.05)')
+    p.add_argument('--debounce', type=float, default=0.2,
+        help='seconds to wait after the last change before rebuilding (default: 0.2)')
+    p.add_argument('--compress', type=int, nargs='?', const=yaz0.DEFAULT_LEVEL, choices=range(10), metavar='LEVEL',
+        help='Yaz0-compress the output (level 0-9, default %d; higher is smaller but slower, and 9 is 5-10x slower than the default)' % yaz0.DEFAULT_LEVEL)
+    p.add_argument('--best', action='store_true',
+        help='use slower, higher-quality texture encoding where available (CMPR)')
+    p.add_argument('--reorder', action='store_true',
+        help='store glyphs sorted by character code, for a smaller and faster CMAP')
+    p.add_argument('--auto-grid', action='store_true',
+        help='choose the characters per row and column (and so the sheet size) that need the least texture data')
+    p.add_argument('--dedupe', action='store_true',
+        help='store identical glyphs (same image and widths) once, with all of their character codes pointing to it')
+    p.set_defaults(func=cmdWatch)
+
+    p = subparsers.add_parser('memory',
+        help='report how much memory fonts use once loaded, by subsystem')
+    p.add_argument('input', nargs='+',
+        help='font files (optionally Yaz0-compressed) and archives containing fonts, or directories to search for .brfnt, .brfna, .szs and .arc files')
+    p.set_defaults(func=cmdMemory)
+
+    p = subparsers.add_parser('formats',
+        help='report how big fonts would be in each texture format, and the smallest that keeps them lossless')
+    p.add_argument('input', nargs='+',
+        help='font files (optionally Yaz0-compressed) and archives containing fonts, or directories to search for .brfnt, .brfna, .szs and .arc files')
+    p.add_argument('--max-error', type=int, default=0, metavar='MAXERROR',
+        help='largest change to any pixel channel (0-255) that still counts as acceptable (default: 0)')
+    p.add_argument('--table', action='store_true',
+        help='show the size and error of every format')
+    p.set_defaults(func=cmdFormats)
+
+    p = subparsers.add_parser('scan',
+        help='find fonts in a directory tree (including inside Yaz0 and U8 files) and report on them')
+    p.add_argument('input', nargs='+',
+        help='files, or directories to search (every file is checked, whatever its extension)')
+    p.add_argument('-o', '--output', default='-',
+        help='report file (default: standard output)')
+    p.add_argument('--format', choices=['jsonl', 'csv'],
+        help='report format (default: csv if the output filename ends in .csv, otherwise jsonl)')
+    p.set_defaults(func=cmdScan)
+
+    args = parser.parse_args(argv)
+    args.jobs = max(1, args.jobs)
+
+    failures = args.func(args)
+    if failures:
+        print('%d file(s) failed' % failures, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# cx.py
+# Support for the "CX" compression formats from Nintendo's SDKs, which
+# BRFNA fonts use for their texture sheets
+
+# Every CX stream starts with a little-endian u32: the low byte is the
+# type, and the upper 24 bits are the decompressed size.
+#     0x10: LZ77
+#     0x11: LZ77 with extended lengths
+#     0x24: Huffman, 4-bit units
+#     0x28: Huffman, 8-bit units
+#     0x30: Run-length
+
+
+
+LZ77 = 0x10
+LZ77_EX = 0x11
+HUFFMAN_4 = 0x24
+HUFFMAN_8 = 0x28
+RUN_LENGTH = 0x30
+
+
+def decompressedSize(data):
+    """
+    Return the decompressed size from a CX header
+    """
+    return int.from_bytes(data[1:4], 'little')
+
+
+def decompress(data):
+    """
+    Decompress a CX stream of any supported type and return the result
+    as a bytearray
+    """
+    type = data[0]
+    size = decompressedSize(data)
+
+    try:
+        if type in (LZ77, LZ77_EX):
+            return _decompressLZ77(data, size, type == LZ77_EX)
+        elif type in (HUFFMAN_4, HUFFMAN_8):
+            return _decompressHuffman(data, size, type & 0xF)
+        elif type == RUN_LENGTH:
+            return _decompressRunLength(data, size)
+    except IndexError:
+        raise ValueError('Truncated CX data') from None
+
+    raise ValueError('Unknown CX compression type: 0x%02X' % type)
+
+
+def _decompressLZ77(data, size, extended):
+    """
+    Decompress LZ77 (type 0x10) or extended LZ77 (type 0x11) data
+    """
+    out = bytearray(size)
+    src = 4
+    dst = 0
+
+    while dst < size:
+        flags = data[src]
+        src += 1
+
+        for bit in (0x80, 0x40, 0x20, 0x10, 0x08, 0x04, 0x02, 0x01):
+            if dst >= size:
+                break
+
+            if not flags & bit:
+                out[dst] = data[src]
+                src += 1
+                dst += 1
+                continue
+
+            b1 = data[src]
+            if not extended:
+                length = (b1 >> 4) + 3
+                src += 1
+            elif b1 >> 4 == 0:
+                length = ((b1 & 0xF) << 4 | data[src + 1] >> 4) + 0x11
+                b1 = data[src + 1]
+                src += 2
+            elif b1 >> 4 == 1:
+                length = ((b1 & 0xF) << 12 | data[src + 1] << 4 | data[src + 2] >> 4) + 0x111
+                b1 = data[src + 2]
+                src += 3
+            else:
+                length = (b1 >> 4) + 1
+                src += 1
+            dist = ((b1 & 0xF) << 8 | data[src]) + 1
+            src += 1
+
+            start = dst - dist
+            if start < 0:
+                raise ValueError('Corrupt LZ77 data (back-reference before start)')
+            length = min(length, size - dst)
+
+            if dist >= length:
+                out[dst : dst + length] = out[start : start + length]
+            else:
+                pattern = bytes(out[start : dst])
+                out[dst : dst + length] = (pattern * (length // dist + 1))[:length]
+            dst += length
+
+    return out
+
+
+def _decompressHuffman(data, size, unitBits):
+    """
+    Decompress Huffman (type 0x24 or 0x28) data
+    """
+    out = bytearray(size)
+    treeStart = 5
+    src = 4 + (data[4] + 1) * 2 # the bitstream follows the tree
+
+    unitsPerByte = 8 // unitBits
+    dst = 0
+    partial = partialCount = 0
+
+    node = treeStart
+    nodeValue = data[node]
+    while dst < size:
+        if src + 4 > len(data):
+            raise IndexError
+        word = int.from_bytes(data[src : src + 4], 'little')
+        src += 4
+
+        for shift in range(31, -1, -1):
+            right = (word >> shift) & 1
+            childIsData = nodeValue & (0x40 if right else 0x80)
+            node = (node & ~1) + (nodeValue & 0x3F) * 2 + 2 + right
+            nodeValue = data[node]
+
+            if not childIsData:
+                continue
+
+            # Reached a leaf
+            if unitsPerByte == 1:
+                out[dst] = nodeValue
+                dst += 1
+            else:
+                partial |= (nodeValue & 0xF) << (partialCount * 4)
+                partialCount += 1
+                if partialCount == unitsPerByte:
+                    out[dst] = partial
+                    dst += 1
+                    partial = partialCount = 0
+
+            node = treeStart
+            nodeValue = data[node]
+            if dst >= size:
+                break
+
+    return out
+
+
+def _decompressRunLength(data, size):
+    """
+    Decompress run-length (type 0x30) data
+    """
+    out = bytearray(size)
+    src = 4
+    dst = 0
+
+    while dst < size:
+        flag = data[src]
+        src += 1
+        if flag & 0x80:
+            length = min((flag & 0x7F) + 3, size - dst)
+            out[dst : dst + length] = bytes((data[src],)) * length
+            src += 1
+        else:
+            length = min((flag & 0x7F) + 1, size - dst)
+            out[dst : dst + length] = data[src : src + length]
+            src += length
+        dst += length
+
+    return out
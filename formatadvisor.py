@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# formatadvisor.py
+# Works out how well a font's glyphs would survive being saved in each
+# texture format, and how big each would make the font, so the smallest
+# format that's lossless (or close enough) can be picked.
+#
+# Glyphs only use a handful of distinct colors, so instead of encoding
+# every sheet in every format, the glyphs' pixels are counted into a
+# color histogram, and only the distinct colors are run through each
+# format's encoder and decoder. Errors are measured against the pixels
+# the encoder is given (which RGBA8 stores exactly), in 0-255 units.
+#
+# Those pixels are premultiplied, so a font whose glyphs have partly
+# transparent pixels can measure as lossy even in the format it was
+# loaded from. smallestFormat() therefore always accepts the font's
+# current format, and never picks a bigger one.
+
+
+
+import collections
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from PyQt5 import QtGui
+
+import TPLLib
+from TPLLib.tpl import textureSize
+
+
+# Formats that are analyzed, in the order they're reported. Fonts can't
+# be saved in palette formats (see BRFNT.save()).
+FORMATS = [
+    TPLLib.I4, TPLLib.I8, TPLLib.IA4, TPLLib.IA8, TPLLib.RGB565,
+    TPLLib.RGB4A3, TPLLib.RGBA8, TPLLib.CMPR,
+]
+
+# Formats that are reported, but never picked by smallestFormat(): CMPR
+# compresses 4x4 blocks of pixels together, so its error can't be found
+# from a color histogram
+UNCHOSEN_FORMATS = {TPLLib.CMPR}
+
+# Glyphs counted per batch, to limit how much pixel data is held at once
+HISTOGRAM_BATCH = 4096
+
+# Width of the image the distinct colors are laid out in; a multiple of
+# every format's tile width
+COLORS_WIDTH = 64
+
+
+def colorHistogram(font, layout=None):
+    """
+    Return {color: number of pixels} for the glyphs the font stores
+    (see BRFNT.getSaveLayout()), as they're painted onto texture sheets.
+    Colors are premultiplied ARGB32 values (0xAARRGGBB).
+    """
+    if layout is None:
+        layout = font.getSaveLayout()
+
+    histogram = collections.Counter()
+    stored = layout[0]
+    for start in range(0, len(stored), HISTOGRAM_BATCH):
+        pixels = bytearray()
+        for i in stored[start : start + HISTOGRAM_BATCH]:
+            image = font.glyphs[i].pixmap.toImage().convertToFormat(QtGui.QImage.Format_ARGB32_Premultiplied)
+            if not image.isNull():
+                pixels.extend(image.constBits().asstring(image.byteCount()))
+
+        if numpy is not None:
+            colors, counts = numpy.unique(numpy.frombuffer(pixels, dtype='<u4'), return_counts=True)
+            histogram.update(dict(zip(colors.tolist(), counts.tolist())))
+        else:
+            histogram.update(memoryview(pixels).cast('I'))
+
+    return histogram
+
+
+def fontTextureSize(font, format, numGlyphs):
+    """
+    Return the size in bytes of the texture sheets for numGlyphs glyphs
+    in the given format
+    """
+    texWidth, texHeight = font.getTextureSize()
+    charsPerTex = font.charsPerRow * font.charsPerColumn
+    return textureSize(format, texWidth, texHeight) * -(-numGlyphs // charsPerTex)
+
+
+def roundTrip(format, colors, highQuality=False):
+    """
+    Encode a list of colors in the given format and decode them again.
+    Return the decoded colors, in the same order.
+    """
+    width = COLORS_WIDTH
+    height = -(-len(colors) // width)
+    height += -height % 8 # every format's tile height divides 8
+
+    padded = list(colors) + [colors[0]] * (width * height - len(colors))
+    argb = struct.pack('<%dI' % len(padded), *padded)
+
+    tex = TPLLib.encoder(format, highQuality)(argb, width, height).run()
+    decoder = TPLLib.decoder(format)(tex, width, height)
+
+    return struct.unpack_from('<%dI' % len(colors), decoder.run())
+
+
+def colorError(a, b):
+    """
+    Return the largest difference between any channel of two ARGB32
+    colors
+    """
+    return max(abs(((a >> shift) & 0xFF) - ((b >> shift) & 0xFF)) for shift in (0, 8, 16, 24))
+
+
+def analyzeFormats(font, histogram=None, layout=None):
+    """
+    Return a list of dicts describing what saving the font in each of
+    FORMATS would do: 'format', 'name', 'size' (of the texture data, in
+    bytes), 'maxError' and 'meanError' (per pixel, the largest channel
+    difference from what the encoder was given), and 'lossless'.
+    maxError and meanError are None for CMPR.
+    """
+    if layout is None:
+        layout = font.getSaveLayout()
+    if histogram is None:
+        histogram = colorHistogram(font, layout)
+
+    colors = list(histogram)
+    counts = [histogram[c] for c in colors]
+    numPixels = sum(counts)
+
+    results = []
+    for format in FORMATS:
+        maxError = meanError = None
+        if colors and format != TPLLib.CMPR:
+            decoded = roundTrip(format, colors, font.highQualityEncoding)
+            errors = [colorError(a, b) for a, b in zip(colors, decoded)]
+            maxError = max(errors)
+            meanError = sum(e * n for e, n in zip(errors, counts)) / numPixels
+        elif not colors:
+            maxError = meanError = 0
+
+        results.append({
+            'format': format,
+            'name': TPLLib.FORMAT_NAMES[format],
+            'size': fontTextureSize(font, format, len(layout[0])),
+            'maxError': maxError,
+            'meanError': meanError,
+            'lossless': maxError == 0,
+        })
+
+    return results
+
+
+def smallestFormat(font, maxError=0, results=None):
+    """
+    Return the texture format that makes the font's texture data the
+    smallest without any pixel's error going over maxError. Formats in
+    UNCHOSEN_FORMATS are never returned unless the font already uses
+    them. The font's current format is always acceptable, and is
+    returned if nothing smaller is.
+    """
+    if results is None:
+        results = analyzeFormats(font)
+
+    current = [r for r in results if r['format'] == font.texFormat]
+    acceptable = [r for r in results
+                  if r['format'] not in UNCHOSEN_FORMATS and r['maxError'] is not None and r['maxError'] <= maxError]
+    if current:
+        acceptable = [r for r in acceptable if r['size'] <= current[0]['size']] + current
+    return min(acceptable, key=lambda r: (r['size'], r['format'] != font.texFormat))['format']
+
+
+def formatReport(results, current=None):
+    """
+    Return a text table of analyzeFormats() results, smallest first.
+    The current format, if given, is marked with an asterisk.
+    """
+    lines = ['  %-8s %12s %10s %10s' % ('format', 'size', 'max error', 'mean error')]
+    for r in sorted(results, key=lambda r: (r['size'], r['format'])):
+        if r['maxError'] is None:
+            errors = '%10s %10s' % ('-', '-')
+        else:
+            errors = '%10d %10.3f' % (r['maxError'], r['meanError'])
+        lines.append('%s %-8s %12d %s%s' % (
+            '*' if r['format'] == current else ' ',
+            r['name'], r['size'], errors, '  lossless' if r['lossless'] else ''))
+    return '\n'.join(lines)
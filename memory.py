@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# memory.py
+# Estimates how much memory a loaded font uses, broken down by
+# subsystem, and measures the memory used by the whole process
+
+
+
+import os
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+import TPLLib
+from TPLLib.tpl import textureSize
+
+
+# (key, description), in the order they're reported
+SUBSYSTEMS = [
+    ('glyphImages', 'Decoded glyph images'),
+    ('encodedSheets', 'Encoded texture sheets'),
+    ('sceneItems', 'Glyph scene items'),
+    ('toolTips', 'Glyph tooltips'),
+    ('metadata', 'Metrics and character codes'),
+]
+
+# Qt's own data for each QGraphicsItem isn't visible from Python. This
+# is roughly the size of QGraphicsItemPrivate on 64-bit builds.
+QGRAPHICSITEM_SIZE = 256
+
+
+def fontUsage(font):
+    """
+    Return an estimate of the memory used by a loaded BRFNT, as
+    {subsystem key: bytes}. Encoded texture sheets aren't kept after
+    loading, so that's the size they take up while loading or saving.
+    """
+    usage = {key: 0 for key, description in SUBSYSTEMS}
+
+    seenPixmaps = set()
+    for g in font.glyphs:
+        # Pixmaps can be shared between glyphs
+        if g.pixmap.cacheKey() not in seenPixmaps:
+            seenPixmaps.add(g.pixmap.cacheKey())
+            usage['glyphImages'] += g.pixmap.width() * g.pixmap.height() * g.pixmap.depth() // 8
+
+        usage['sceneItems'] += (QGRAPHICSITEM_SIZE + sys.getsizeof(g) + sys.getsizeof(g.__dict__)
+            + sys.getsizeof(g.boundingRect) + sys.getsizeof(g.selectionRect))
+        usage['toolTips'] += len(g.toolTip()) * 2 # QStrings are UTF-16
+        usage['metadata'] += sys.getsizeof(g.char)
+
+    usage['metadata'] += sys.getsizeof(font.__dict__) + sys.getsizeof(font.glyphs)
+
+    if font.glyphs:
+        texWidth, texHeight = font.getTextureSize()
+        sheetSize = textureSize(font.texFormat, texWidth, texHeight)
+        if font.texFormat in TPLLib.PALETTE_FORMATS:
+            sheetSize += font.getPaletteSize()
+        charsPerTex = font.charsPerRow * font.charsPerColumn
+        usage['encodedSheets'] = sheetSize * -(-len(font.glyphs) // charsPerTex)
+
+    return usage
+
+
+def currentRSS():
+    """
+    Return the amount of memory the process is using (its resident set
+    size) in bytes, or None if it can't be found out
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peakRSS():
+    """
+    Return the most memory the process has used at once, in bytes, or
+    None if it can't be found out
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024 # macOS uses bytes, others KB
+
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', None)
+
+    return None
+
+
+def formatSize(size):
+    """
+    Format a number of bytes for people to read
+    """
+    if size is None:
+        return 'unknown'
+    for unit in ('bytes', 'KB', 'MB'):
+        if size < 1024:
+            return ('%d %s' if unit == 'bytes' else '%.1f %s') % (size, unit)
+        size /= 1024
+    return '%.1f GB' % size
+
+
+def formatReport(usage, process=True):
+    """
+    Return a text table of fontUsage() results, plus the process's
+    current and peak memory use if process is True
+    """
+    lines = []
+    for key, description in SUBSYSTEMS:
+        lines.append('%-30s %12s' % (description, formatSize(usage[key])))
+    lines.append('%-30s %12s' % ('Total', formatSize(sum(usage.values()))))
+
+    if process:
+        lines.append('')
+        current, peak = currentRSS(), peakRSS()
+        if current is not None and peak is not None:
+            peak = max(peak, current) # they're measured differently
+        lines.append('%-30s %12s' % ('Process (current)', formatSize(current)))
+        lines.append('%-30s %12s' % ('Process (peak)', formatSize(peak)))
+
+    return '\n'.join(lines)
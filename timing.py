@@ -0,0 +1,218 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# timing.py
+# Records how long each phase of loading and saving takes (as named
+# spans), so slow operations can be narrowed down. Recording is off
+# unless enabled with setEnabled() or the BRFNTIFY_TIMING environment
+# variable:
+#
+#     BRFNTIFY_TIMING=1           print a summary table when exiting
+#     BRFNTIFY_TIMING=trace.json  write a Chrome trace when exiting
+#                                 (open it in chrome://tracing or Perfetto)
+#     BRFNTIFY_TIMING=0           don't record (same as unset, empty,
+#                                 "false", "no" or "off")
+#
+# When recording is off, span() returns a shared do-nothing context
+# manager and functions decorated with timed() are called directly, so
+# instrumented code costs about one extra function call per span.
+
+
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+
+ENV_VAR = 'BRFNTIFY_TIMING'
+ENV_OFF_VALUES = {'', '0', 'false', 'no', 'off'} # lowercase
+
+enabled = False
+_events = [] # (name, thread id, start, end), times from time.perf_counter()
+_lock = threading.Lock()
+
+
+class _Span():
+    """
+    Records the time between entering and exiting it
+    """
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        with _lock:
+            _events.append((self.name, threading.get_ident(), self.start, end))
+
+
+class _NullSpan():
+    """
+    Used instead of _Span when recording is off
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """
+    Return a context manager that records the time spent inside it as
+    a span with the given name, if recording is enabled
+    """
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """
+    Decorator that records each call to the function as a span with the
+    given name, if recording is enabled
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def setEnabled(value):
+    """
+    Turn recording on or off. Spans that were already recorded are
+    kept.
+    """
+    global enabled
+    enabled = bool(value)
+
+
+def clear():
+    """
+    Forget all recorded spans
+    """
+    with _lock:
+        del _events[:]
+
+
+def events():
+    """
+    Return a list of the recorded spans, as (name, thread id, start,
+    end) tuples in the order they ended
+    """
+    with _lock:
+        return list(_events)
+
+
+def summary():
+    """
+    Return {name: (count, total seconds, longest seconds)} for the
+    recorded spans
+    """
+    result = {}
+    for name, thread, start, end in events():
+        count, total, longest = result.get(name, (0, 0, 0))
+        result[name] = (count + 1, total + end - start, max(longest, end - start))
+    return result
+
+
+def summaryTable():
+    """
+    Return the summary as a text table, slowest phases first
+    """
+    lines = ['%-16s %7s %12s %12s %12s' % ('phase', 'count', 'total ms', 'mean ms', 'max ms')]
+    for name, (count, total, longest) in sorted(summary().items(), key=lambda item: -item[1][1]):
+        lines.append('%-16s %7d %12.2f %12.2f %12.2f' % (name, count, total * 1000, total / count * 1000, longest * 1000))
+    return '\n'.join(lines)
+
+
+def chromeTrace():
+    """
+    Return the recorded spans in Chrome's trace event format (as a dict
+    ready to be saved as JSON)
+    """
+    pid = os.getpid()
+    traceEvents = []
+    for name, thread, start, end in events():
+        traceEvents.append({
+            'name': name,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': pid,
+            'tid': thread,
+        })
+    traceEvents.sort(key=lambda e: e['ts'])
+    return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}
+
+
+def saveChromeTrace(path):
+    """
+    Save the recorded spans to a Chrome trace JSON file
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(chromeTrace(), f)
+
+
+def _reportAtExit(destination):
+    """
+    Write the trace or print the summary, as requested by the
+    environment variable. Worker processes (which have their own,
+    separate spans) leave this to the main process.
+    """
+    try:
+        import multiprocessing
+    except ImportError: # left out of release builds, which never start workers
+        multiprocessing = None
+    if multiprocessing is not None and multiprocessing.parent_process() is not None:
+        return
+    if not events():
+        return
+    if destination.lower().endswith('.json'):
+        saveChromeTrace(destination)
+    else:
+        print(summaryTable(), file=sys.stderr)
+
+
+if os.environ.get(ENV_VAR, '').strip().lower() not in ENV_OFF_VALUES:
+    setEnabled(True)
+    atexit.register(_reportAtExit, os.environ[ENV_VAR])
@@ -0,0 +1,318 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# BRFNTify - Editor for Nintendo BRFNT font files
+# Version Next Beta 1
+# Copyright (C) 2009-2019 Tempus, RoadrunnerWMC
+
+# This file is part of BRFNTify.
+
+# BRFNTify is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BRFNTify is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BRFNTify.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+# yaz0.py
+# Yaz0 (.szs) compression support
+
+# Yaz0 format:
+#     b'Yaz0'
+#     u32 decompressedSize
+#     8 bytes padding
+#     [groups until decompressedSize bytes have been produced]
+#
+# Each group starts with a code byte. Its bits (most significant first)
+# describe the next eight chunks: 1 means a single literal byte follows,
+# and 0 means a two- or three-byte back-reference follows:
+#     NNNNDDDD DDDDDDDD [NNNNNNNN]
+# The distance back is D + 1. If the first N is nonzero, the length is
+# N + 2; otherwise, the length is the third byte + 0x12.
+
+
+
+MAGIC = b'Yaz0'
+HEADER_SIZE = 0x10
+
+
+def isCompressed(data):
+    """
+    Return True if data (bytes-like) is Yaz0-compressed
+    """
+    return bytes(data[:4]) == MAGIC
+
+
+def decompressedSize(data):
+    """
+    Return the decompressed size stored in a Yaz0 header
+    """
+    if not isCompressed(data):
+        raise ValueError('Not Yaz0 data (magic: %s)' % repr(bytes(data[:4])))
+    return int.from_bytes(data[4:8], 'big')
+
+
+def decompress(data, out=None, limit=None):
+    """
+    Decompress Yaz0 data (any bytes-like object, such as an mmap) and
+    return the result. If out (a bytearray or writable memoryview at
+    least decompressedSize(data) bytes long) is provided, the data is
+    decompressed into it instead of a newly allocated buffer. If limit
+    is given, decompression stops after that many bytes (which is a
+    cheap way to check what kind of data is inside).
+    """
+    size = decompressedSize(data)
+    if limit is not None:
+        size = min(size, limit)
+    if out is None:
+        out = bytearray(size)
+    elif len(out) < size:
+        raise ValueError('Output buffer is too small (%d < %d)' % (len(out), size))
+
+    src = HEADER_SIZE
+    dst = 0
+    code = bits = 0
+    dataLen = len(data)
+
+    try:
+        while dst < size:
+            if not bits:
+                code = data[src]
+                src += 1
+                bits = 8
+
+                if code == 0xFF and dst + 8 <= size and src + 8 <= dataLen:
+                    # Fast path: eight literal bytes in a row
+                    out[dst : dst + 8] = data[src : src + 8]
+                    src += 8
+                    dst += 8
+                    bits = 0
+                    continue
+
+            bits -= 1
+
+            if code & (1 << bits):
+                # Literal byte
+                out[dst] = data[src]
+                src += 1
+                dst += 1
+                continue
+
+            # Back-reference
+            b1 = data[src]
+            b2 = data[src + 1]
+            src += 2
+            dist = ((b1 & 0xF) << 8 | b2) + 1
+            length = b1 >> 4
+            if length:
+                length += 2
+            else:
+                length = data[src] + 0x12
+                src += 1
+
+            start = dst - dist
+            if start < 0:
+                raise ValueError('Corrupt Yaz0 data (back-reference before start at 0x%X)' % src)
+            if dst + length > size:
+                length = size - dst
+
+            if dist >= length:
+                out[dst : dst + length] = out[start : start + length]
+            elif dist == 1:
+                out[dst : dst + length] = bytes((out[start],)) * length
+            else:
+                # The source overlaps the destination, so the copy
+                # repeats the last dist bytes
+                pattern = bytes(out[start : dst])
+                out[dst : dst + length] = (pattern * (length // dist + 1))[:length]
+
+            dst += length
+
+    except IndexError:
+        raise ValueError('Truncated Yaz0 data') from None
+
+    return out
+
+
+def unwrap(data):
+    """
+    Return data decompressed if it's Yaz0-compressed, or data as-is if
+    it isn't
+    """
+    if isCompressed(data):
+        return decompress(data)
+    return data
+
+
+# Compression levels: (maximum number of hash-chain candidates to try
+# at each position, whether to use lazy matching, whether to index the
+# positions inside matches too). Level 0 stores everything as literals.
+# Past about 1024 candidates, the search gets much slower for very
+# little gain (searching the whole window saves another 1-2%, at a third
+# of the speed), so that's where level 9 stops.
+LEVELS = {
+    1: (1, False, False),
+    2: (4, False, False),
+    3: (8, False, True),
+    4: (16, True, True),
+    5: (32, True, True),
+    6: (64, True, True),
+    7: (128, True, True),
+    8: (512, True, True),
+    9: (1024, True, True),
+}
+DEFAULT_LEVEL = 6
+
+# How often compress() reports its progress, in bytes
+PROGRESS_INTERVAL = 0x4000
+
+MIN_MATCH = 3
+MAX_MATCH = 0xFF + 0x12
+WINDOW_SIZE = 0x1000
+
+
+def _matchLength(data, a, b, limit):
+    """
+    Return how many bytes data[a:] and data[b:] have in common, up to
+    limit
+    """
+    n = 0
+    while n + 16 <= limit and data[a + n : a + n + 16] == data[b + n : b + n + 16]:
+        n += 16
+    while n < limit and data[a + n] == data[b + n]:
+        n += 1
+    return n
+
+
+def compress(data, level=DEFAULT_LEVEL, progress=None):
+    """
+    Compress data with Yaz0 and return the result. Higher levels
+    compress better but more slowly: level 1 only tries the most recent
+    earlier occurrence of each three-byte sequence, and level 9 tries
+    up to 1024 of them and uses lazy matching. On font data, level 9
+    is roughly 5-10 times slower than the default level 6, for files
+    about 3% smaller. If progress is given, it's called every so often
+    with the number of bytes compressed so far.
+    """
+    data = bytes(data)
+    size = len(data)
+
+    out = bytearray(MAGIC)
+    out.extend(size.to_bytes(4, 'big'))
+    out.extend(b'\0' * 8)
+
+    if level == 0:
+        for i in range(0, size, 8):
+            out.append((0xFF00 >> len(data[i : i + 8])) & 0xFF)
+            out.extend(data[i : i + 8])
+        return bytes(out)
+
+    maxChain, lazy, insertAll = LEVELS[level]
+
+    head = {} # three-byte sequence -> most recent position
+    prev = [-1] * size # position -> previous position with the same sequence
+
+    def insert(i):
+        key = data[i : i + 3]
+        prev[i] = head.get(key, -1)
+        head[key] = i
+
+    def findMatch(i):
+        """
+        Return (length, distance) of the longest match for position i
+        """
+        limit = min(MAX_MATCH, size - i)
+        if limit < MIN_MATCH:
+            return 0, 0
+
+        bestLen = MIN_MATCH - 1
+        bestDist = 0
+        windowStart = i - WINDOW_SIZE
+        cand = head.get(data[i : i + 3], -1)
+        tries = maxChain
+        while cand >= 0 and cand >= windowStart and tries:
+            tries -= 1
+            # Quick rejection: a better match must also match at bestLen
+            if data[cand + bestLen] == data[i + bestLen]:
+                n = _matchLength(data, cand, i, limit)
+                if n > bestLen:
+                    bestLen = n
+                    bestDist = i - cand
+                    if n == limit:
+                        break
+            cand = prev[cand]
+
+        if bestDist:
+            return bestLen, bestDist
+        return 0, 0
+
+    codePos = len(out)
+    out.append(0)
+    code = 0
+    bit = 0x80
+
+    i = 0
+    pending = None # lazy matching: the match found at i (if already searched)
+    nextProgress = PROGRESS_INTERVAL
+    while i < size:
+        if progress is not None and i >= nextProgress:
+            progress(i)
+            nextProgress = i + PROGRESS_INTERVAL
+
+        if pending is not None:
+            length, dist = pending
+            pending = None
+        else:
+            length, dist = findMatch(i)
+        insert(i)
+
+        if length and lazy and length < MAX_MATCH and i + 1 < size:
+            # If the next position has a longer match, emit a literal
+            # here and use that one instead
+            nextMatch = findMatch(i + 1)
+            if nextMatch[0] > length:
+                length = 0
+                pending = nextMatch
+
+        if length:
+            d = dist - 1
+            if length >= 0x12:
+                out.append(d >> 8)
+                out.append(d & 0xFF)
+                out.append(length - 0x12)
+            else:
+                out.append(((length - 2) << 4) | (d >> 8))
+                out.append(d & 0xFF)
+
+            if insertAll:
+                for j in range(i + 1, min(i + length, size - 2)):
+                    insert(j)
+            i += length
+        else:
+            code |= bit
+            out.append(data[i])
+            i += 1
+
+        bit >>= 1
+        if not bit:
+            out[codePos] = code
+            codePos = len(out)
+            out.append(0)
+            code = 0
+            bit = 0x80
+
+    if bit == 0x80:
+        # The last group is empty
+        del out[codePos]
+    else:
+        out[codePos] = code
+
+    return bytes(out)